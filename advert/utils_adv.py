@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import aiohttp
 import asyncio
@@ -9,9 +10,21 @@ from dotenv import load_dotenv
 from datetime import datetime
 import itertools
 import requests
+# Добавляем в sys.path корень проекта (где лежит wb_archive.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wb_archive import ArchiveMissError, get_archive
 
 load_dotenv()
 
+# Базовый URL advert-api (переопределяется, например, для локального имитатора wb_simulator.py)
+ADVERT_API_URL = os.getenv('WB_ADVERT_API_URL', 'https://advert-api.wildberries.ru')
+# Эндпоинты рекламного API (ключи архива ответов)
+FULLSTATS_ENDPOINT = 'adv-fullstats'
+ADVERTS_ENDPOINT = 'adv-promotion-adverts'
+AUCTION_ADVERTS_ENDPOINT = 'adv-auction-adverts'
+# Списки кампаний хранятся в архиве как последний снимок
+CAMPAIGNS_PERIOD = 'current'
+
 
 # === НАСТРОЙКА ЛОГИРОВАНИЯ ===
 logger = logging.getLogger("funnel_logger")
@@ -85,13 +98,16 @@ async def adv_stat_async(campaign_ids: list, date_from: str, date_to: str, api_t
     :param api_token: токен для API WB
     :param account: название аккаунта
     """
-    url = "https://advert-api.wildberries.ru/adv/v3/fullstats"
+    url = f"{ADVERT_API_URL}/adv/v3/fullstats"
     headers = {"Authorization": api_token}
     batches = list(batchify(campaign_ids, 100))
     data = []
+    # архив сырых страниц: запись (record) или воспроизведение без HTTP (replay)
+    archive = get_archive()
+    period_key = f"{date_from}_{date_to}"
     async with semaphore:
         async with aiohttp.ClientSession(headers=headers) as session:
-            for batch in batches:
+            for page, batch in enumerate(batches):
                 ids_str = ",".join(str(c) for c in batch)
                 params = {"ids": ids_str, "beginDate": date_from, "endDate": date_to}
 
@@ -100,7 +116,11 @@ async def adv_stat_async(campaign_ids: list, date_from: str, date_to: str, api_t
                 retry_count = 0
                 while retry_count < 5:
                     try:
-                        async with session.get(url, params=params) as response:
+                        if archive.replaying:
+                            request = archive.response(FULLSTATS_ENDPOINT, account, period_key, page)
+                        else:
+                            request = session.get(url, params=params)
+                        async with request as response:
                             print(f"HTTP статус: {response.status}")
 
                             if response.status == 400:
@@ -117,6 +137,7 @@ async def adv_stat_async(campaign_ids: list, date_from: str, date_to: str, api_t
                                 continue
 
                             response.raise_for_status()
+                            archive.record(FULLSTATS_ENDPOINT, account, period_key, page, await response.read())
                             batch_data = await response.json()
 
                             # добавляем поле account в каждый элемент
@@ -126,22 +147,28 @@ async def adv_stat_async(campaign_ids: list, date_from: str, date_to: str, api_t
                             data.extend(batch_data or [])
                             break
 
+                    except ArchiveMissError as e:
+                        print(f"Страницы нет в архиве: {e}")
+                        break
+
                     except aiohttp.ClientError as e:
                         print(f"Сетевая ошибка для {account}: {e}")
                         retry_count += 1
                         await asyncio.sleep(30)
 
                 # WB ограничивает 1 запрос/мин → ждём после каждого батча
-                await asyncio.sleep(60)
+                if not archive.replaying:
+                    await asyncio.sleep(60)
 
         return data
     
 
 def camp_list(api_token: str, account: str):
-    url = 'https://advert-api.wildberries.ru/adv/v1/promotion/adverts'
+    url = f'{ADVERT_API_URL}/adv/v1/promotion/adverts'
     camps = []
     campaign_statuses = [9, 11]
     headers = {'Authorization': api_token}
+    archive = get_archive()
     for status_id in campaign_statuses:
         params = {
         'status': status_id,
@@ -149,8 +176,12 @@ def camp_list(api_token: str, account: str):
                 }
         payload = []
         try:
-            res = requests.post(url, headers=headers, params=params, json=payload)
+            if archive.replaying:
+                res = archive.sync_response(ADVERTS_ENDPOINT, account, CAMPAIGNS_PERIOD, status_id)
+            else:
+                res = requests.post(url, headers=headers, params=params, json=payload)
             res.raise_for_status()
+            archive.record(ADVERTS_ENDPOINT, account, CAMPAIGNS_PERIOD, status_id, res.content)
             data = res.json()
         except Exception as e:
             print(e)
@@ -165,17 +196,22 @@ def camp_list(api_token: str, account: str):
 
 
 def camp_list_manual(api_token: str, account: str):
-    url = 'https://advert-api.wildberries.ru/adv/v0/auction/adverts'
+    url = f'{ADVERT_API_URL}/adv/v0/auction/adverts'
     camps = []
     campaign_statuses = [9, 11]
     headers = {'Authorization': api_token}
+    archive = get_archive()
     for status_id in campaign_statuses:
         params = {
         'status': status_id
                 }
         try:
-            res = requests.get(url, headers=headers, params=params)
+            if archive.replaying:
+                res = archive.sync_response(AUCTION_ADVERTS_ENDPOINT, account, CAMPAIGNS_PERIOD, status_id)
+            else:
+                res = requests.get(url, headers=headers, params=params)
             res.raise_for_status()
+            archive.record(AUCTION_ADVERTS_ENDPOINT, account, CAMPAIGNS_PERIOD, status_id, res.content)
             data = res.json()
         except Exception as e:
             print(e)
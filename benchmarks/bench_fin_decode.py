@@ -0,0 +1,69 @@
+"""Бенчмарк разбора страницы reportDetailByPeriod: json против PageDecoder
+
+Два замера: только разбор (байты -> DataFrame) и разбор вместе с приведением
+типов (TypeConverter — одинаковый в обоих вариантах, поэтому разницу размывает).
+
+Запуск из корня проекта:
+    python benchmarks/bench_fin_decode.py --rows 50000
+"""
+import argparse
+import json
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import comparison_parser, run_comparison, write_results
+# datasets добавляет в sys.path папки пайплайнов
+from datasets import make_fin_reports_frame
+from my_fin_rep_utils import fin_reports_converter, fin_reports_decoder
+from page_decoder import orjson
+
+
+def make_page_bytes(rows: int) -> bytes:
+    """Синтетический ответ API: JSON-массив из rows объектов."""
+    df = make_fin_reports_frame(rows).drop(columns=['account'])
+    return df.to_json(orient='records', date_format='iso').encode('utf-8')
+
+
+def legacy_decode(raw: bytes) -> pd.DataFrame:
+    """Прежний путь: text -> json.loads -> pd.DataFrame(list_of_dicts)."""
+    return pd.DataFrame(json.loads(raw.decode('utf-8')))
+
+
+def decoder_decode(raw: bytes) -> pd.DataFrame:
+    data, _ = fin_reports_decoder.loads(raw)
+    df, _ = fin_reports_decoder.to_frame(data)
+    return df
+
+
+def legacy_convert(raw: bytes) -> pd.DataFrame:
+    return fin_reports_converter.convert(legacy_decode(raw))
+
+
+def decoder_convert(raw: bytes) -> pd.DataFrame:
+    return fin_reports_converter.convert(decoder_decode(raw))
+
+
+def main():
+    parser = comparison_parser(__doc__.splitlines()[0], rows=50_000)
+    args = parser.parse_args()
+
+    raw = make_page_bytes(args.rows)
+    print(f"Строк: {args.rows}, размер страницы: {len(raw) / 1024 / 1024:.1f} МБ, orjson: {'да' if orjson else 'нет'}")
+    # Оба замера пишутся в один файл результатов
+    run_args = argparse.Namespace(**{**vars(args), 'output': None})
+    print("Только разбор:")
+    results = run_comparison('fin_decode', {'legacy': legacy_decode, 'decoder': decoder_decode},
+                             lambda: raw, args.rows, run_args)
+    print("Разбор и приведение типов:")
+    results += run_comparison('fin_decode_convert', {'legacy': legacy_convert, 'decoder': decoder_convert},
+                              lambda: raw, args.rows, run_args)
+    if args.output:
+        path = write_results(results, None if args.output == 'auto' else args.output)
+        print(f"💾 Результаты: {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Бенчмарк приведения типов fin_reports_full: прежние list comprehension против TypeConverter
+
+Запуск из корня проекта:
+    python benchmarks/bench_fin_types.py --rows 100000
+"""
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import comparison_parser, run_comparison
+# datasets добавляет в sys.path папки пайплайнов
+from datasets import make_fin_reports_frame
+from my_fin_rep_utils import fin_reports_converter
+
+
+def legacy_convert(result: pd.DataFrame) -> pd.DataFrame:
+    """Прежняя поячеечная конвертация из get_fin_reports_async (для сравнения)."""
+    # Преобразование дат
+    date_cols_list = ['date_from', 'date_to', 'create_dt', 'fix_tariff_date_from',
+                    'fix_tariff_date_to', 'rr_dt', 'order_dt', 'sale_dt'] 
+
+    for col in date_cols_list:
+        if col in result.columns:
+            result[col] = pd.to_datetime(result[col], errors='coerce')
+            if pd.api.types.is_datetime64tz_dtype(result[col]):
+                result[col] = result[col].dt.tz_localize(None)
+            if col in ['order_dt', 'sale_dt']:
+                result[col] = pd.Series(
+                    [x.to_pydatetime() if pd.notna(x) else None for x in result[col]],
+                    index=result.index,
+                    dtype='object'
+                )
+            else:
+                result[col] = result[col].apply(
+                    lambda x: x.date() if pd.notna(x) else None
+                )
+
+    # Преобразование числовых типов
+    for col in result.columns:
+        if result[col].dtype in ['int64', 'int32', 'int16', 'int8']:
+            result[col] = pd.Series(
+                [None if pd.isna(x) else int(x) for x in result[col]],
+                index=result.index,
+                dtype='object'
+            )
+        elif result[col].dtype in ['float64', 'float32', 'float16']:
+            result[col] = pd.Series(
+                [None if pd.isna(x) else float(x) for x in result[col]],
+                index=result.index,
+                dtype='object'
+            )
+        elif result[col].dtype == 'bool':
+            result[col] = pd.Series(
+                [None if pd.isna(x) else bool(x) for x in result[col]],
+                index=result.index,
+                dtype='object'
+            )
+
+    # Явная конвертация BOOLEAN-колонок (для надёжности, из предыдущей ошибки)
+    bool_cols = ['is_kgvp_v2', 'srv_dbs', 'is_legal_entity']
+    for col in bool_cols:
+        if col in result.columns:
+            result[col] = pd.Series(
+                [None if pd.isna(x) else bool(x) for x in result[col]],
+                index=result.index,
+                dtype='object'
+            )
+
+    # Преобразование текстовых колонок (VARCHAR/TEXT)
+    text_cols = [
+        'currency_name', 'suppliercontract_code', 'dlv_prc', 'subject_name', 'brand_name',
+        'sa_name', 'ts_name', 'barcode', 'doc_type_name', 'office_name', 'supplier_oper_name',
+        'gi_box_type_name', 'payment_processing', 'acquiring_bank', 'ppvz_office_name',
+        'ppvz_supplier_name', 'ppvz_inn', 'declaration_number', 'bonus_type_name',
+        'sticker_id', 'site_country', 'rebill_logistic_org', 'kiz', 'trbx_id', 'account'
+    ]
+    for col in text_cols:
+        if col in result.columns:
+            result[col] = pd.Series(
+                [None if pd.isna(x) else str(x) for x in result[col]],
+                index=result.index,
+                dtype='object'
+            )
+
+    return result
+
+def main():
+    parser = comparison_parser(__doc__.splitlines()[0], rows=100_000)
+    args = parser.parse_args()
+
+    df = make_fin_reports_frame(args.rows)
+    print(f"Строк: {args.rows}, колонок: {df.shape[1]}")
+    run_comparison('fin_types', {'legacy': legacy_convert, 'vectorized': fin_reports_converter.convert},
+                   df.copy, args.rows, args)
+
+
+if __name__ == '__main__':
+    main()
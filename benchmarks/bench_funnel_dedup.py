@@ -0,0 +1,70 @@
+"""Бенчмарк удаления дубликатов funnel_daily: две сортировки против однопроходного dedup_funnel_daily
+
+Набор по умолчанию — 28 дней × 50 000 товаров (1,4 млн строк, часть пар повторяется).
+Запуск из корня проекта:
+    python benchmarks/bench_funnel_dedup.py --days 28 --skus 50000
+"""
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import comparison_parser, run_comparison
+# datasets добавляет в sys.path папки пайплайнов
+from datasets import make_funnel_daily_frame
+from funnel_normalize import dedup_funnel_daily
+
+
+def legacy_dedup(df: pd.DataFrame) -> pd.DataFrame:
+    """Прежнее удаление дубликатов из main_funnel_daily: две полные сортировки (для сравнения)."""
+    # Удаляем общие дубликаты
+    df = df.drop_duplicates()
+    # Приводим колонку к типу данных дата
+    df['date'] = pd.to_datetime(df['date']).dt.date
+
+    # Удаляем дубликаты, оставляя запись с наибольшим open_count
+    # Находим дубликаты по nm_id и date
+    df_orders_sum = df.sort_values(
+        by=['nm_id', 'date', 'orders_sum'],
+        ascending=[True, True, False]
+    )
+    # Удаляем дубликаты, оставляя первую запись (с наибольшим open_count)
+    df_orders_sum = df_orders_sum.drop_duplicates(subset=['nm_id', 'date'], keep='first')
+
+    # Теперь из полученного датафрейма удаляем дубликаты по nm_id и date, оставляя запись с наибольшим open_count
+    df_open_count = df_orders_sum.sort_values(
+        by=['nm_id', 'date', 'open_count'],
+        ascending=[True, True, False]
+    )
+    # Удаляем дубликаты, оставляя первую запись (с наибольшим open_count)
+    df_open_count = df_open_count.drop_duplicates(subset=['nm_id', 'date'], keep='first')
+    return df_open_count
+
+
+def main():
+    parser = comparison_parser(__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=28)
+    parser.add_argument('--skus', type=int, default=50_000)
+    args = parser.parse_args()
+
+    rows = args.days * args.skus
+    df = make_funnel_daily_frame(rows, skus=args.skus, days_count=args.days)
+    # Результаты должны совпадать по выбранным строкам (порядок строк не важен)
+    key = ['nm_id', 'date']
+    expected = legacy_dedup(df.copy()).sort_values(key)[key + ['orders_sum']].reset_index(drop=True)
+    actual = dedup_funnel_daily(df.copy()).sort_values(key)[key + ['orders_sum']].reset_index(drop=True)
+    assert expected.equals(actual), "dedup_funnel_daily выбрал другие строки"
+    # Кадр из нескольких пакетов (pd.concat без ignore_index) — метки индекса повторяются
+    half = len(df) // 2
+    glued = pd.concat([df.iloc[:half].reset_index(drop=True), df.iloc[half:].reset_index(drop=True)])
+    assert not glued.index.is_unique
+    glued_actual = dedup_funnel_daily(glued).sort_values(key)[key + ['orders_sum']].reset_index(drop=True)
+    assert expected.equals(glued_actual), "dedup_funnel_daily зависит от меток индекса"
+
+    print(f"Строк: {rows} ({args.days} дней × {args.skus} товаров), после отбора: {len(actual)}")
+    run_comparison('funnel_dedup', {'legacy': legacy_dedup, 'single pass': dedup_funnel_daily}, df.copy, rows, args)
+
+
+if __name__ == '__main__':
+    main()
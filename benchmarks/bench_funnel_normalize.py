@@ -0,0 +1,91 @@
+"""Бенчмарк разворота товаров sales-funnel/products: прежний цикл по словарям против normalize_funnel_products
+
+Запуск из корня проекта:
+    python benchmarks/bench_funnel_normalize.py --rows 500000
+"""
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import comparison_parser, run_comparison
+# datasets добавляет в sys.path папки пайплайнов
+from datasets import make_funnel_products
+from funnel_normalize import normalize_funnel_products
+
+
+def legacy_products_to_frame(all_products: list) -> pd.DataFrame:
+    """Прежний построчный разворот из process_funnel_month/daily (для сравнения)."""
+    rows = []
+    for product in all_products:
+        # Извлекаем данные 
+        prod_info = product.get("product", {})
+        stat = product.get("statistic", {})
+        selected = stat.get("selected", {})
+        time_to_ready = selected.get("timeToReady", {})
+        
+        # Базовая информация
+        row = {
+            "account": product.get("account"),
+            "nm_id": prod_info.get("nmId"),
+            "vendor_code": prod_info.get("vendorCode"),  
+            "title": prod_info.get("title"),
+            "subject_id": prod_info.get("subjectId"),
+            "subject_name": prod_info.get("subjectName"),
+            "brand_name": prod_info.get("brandName"),
+            "product_rating": prod_info.get("productRating"),
+            "feedback_rating": prod_info.get("feedbackRating"),
+            "stocks_wb": prod_info.get("stocks", {}).get("wb"),
+            "stocks_mp": prod_info.get("stocks", {}).get("mp"),
+            "balance_sum": prod_info.get("stocks", {}).get("balanceSum"),
+        }
+        
+        # Метрики selected
+        row.update({
+            "open_count": selected.get("openCount"),
+            "cart_count": selected.get("cartCount"),
+            "order_count": selected.get("orderCount"),
+            "orders_sum": selected.get("orderSum"),
+            "buyout_count": selected.get("buyoutCount"),
+            "buyout_sum": selected.get("buyoutSum"),
+            "cancel_count": selected.get("cancelCount"),
+            "cancel_sum": selected.get("cancelSum"),
+            "avg_price": selected.get("avgPrice"),
+            "avg_orders_count_per_day": selected.get("avgOrdersCountPerDay"),
+            "share_order_percent": selected.get("shareOrderPercent"),
+            "add_to_wish_list": selected.get("addToWishlist"),
+            "time_to_ready": (
+                time_to_ready.get("days", 0) * 24 * 60 +
+                time_to_ready.get("hours", 0) * 60 +
+                time_to_ready.get("mins", 0)
+            ),
+            "localization_percent": selected.get("localizationPercent"),
+            "date": selected.get("period", {}).get("end"),
+        })
+        
+        rows.append(row)
+            
+    # Один DataFrame
+    df_full = pd.DataFrame(rows)
+    
+    if df_full.empty:
+        return df_full
+    # Создаем новые колонки
+    df_full['month'] = pd.to_datetime(df_full['date']).dt.strftime('%m-%Y')
+    df_full['wild'] = df_full['vendor_code'].str.extract(r'(wild\d+)')
+    return df_full
+
+
+def main():
+    parser = comparison_parser(__doc__.splitlines()[0], rows=500_000)
+    args = parser.parse_args()
+
+    products = make_funnel_products(args.rows)
+    print(f"Товаров: {args.rows}")
+    run_comparison('funnel_normalize', {'legacy': legacy_products_to_frame, 'vectorized': normalize_funnel_products},
+                   lambda: products, args.rows, args, unit='товаров')
+
+
+if __name__ == '__main__':
+    main()
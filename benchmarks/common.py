@@ -0,0 +1,143 @@
+"""Общие утилиты бенчмарков: замер времени и пиковой памяти, запись результатов в JSON"""
+import argparse
+import asyncio
+import gc
+import inspect
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def _call(func, data):
+    result = func(data)
+    if inspect.isawaitable(result):
+        result = asyncio.run(result)
+    return result
+
+
+def measure(func, make_input, rows: int, repeat: int = 3, memory: bool = True) -> dict:
+    """
+    Замеряет один этап: func(data), где data = make_input() строится заново перед
+    каждым прогоном и в замер не входит. Время — лучшее из repeat прогонов без
+    трассировки памяти; пиковая память (tracemalloc) — отдельным прогоном.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        data = make_input()
+        gc.collect()
+        start = time.perf_counter()
+        _call(func, data)
+        best = min(best, time.perf_counter() - start)
+        del data
+
+    peak_mb = None
+    if memory:
+        data = make_input()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            _call(func, data)
+            peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        finally:
+            tracemalloc.stop()
+        del data
+
+    return {
+        'rows': rows,
+        'seconds': round(best, 6),
+        'rows_per_sec': round(rows / best, 1) if best > 0 else None,
+        'peak_mb': round(peak_mb, 2) if peak_mb is not None else None,
+        'repeat': repeat,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> dict:
+    import numpy
+    import pandas
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'pandas': pandas.__version__,
+        'numpy': numpy.__version__,
+    }
+
+
+def write_results(results: list, path: str | None = None) -> str:
+    """Пишет результаты в JSON; по умолчанию benchmarks/results/<дата>_<коммит>.json."""
+    meta = environment()
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(RESULTS_DIR, f"{stamp}_{meta['commit'] or 'nogit'}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'meta': meta, 'results': results}, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def load_results(path: str) -> dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(current: list, baseline: list) -> list:
+    """Строки сравнения (stage, rows, rows/sec сейчас и в базовом прогоне, изменение в %)."""
+    base = {(r['stage'], r['rows']): r for r in baseline if r.get('rows_per_sec')}
+    lines = []
+    for r in current:
+        old = base.get((r['stage'], r['rows']))
+        if not old or not r.get('rows_per_sec'):
+            continue
+        change = (r['rows_per_sec'] / old['rows_per_sec'] - 1) * 100
+        lines.append((r['stage'], r['rows'], r['rows_per_sec'], old['rows_per_sec'], change))
+    return lines
+
+
+def comparison_parser(description: str, rows: int | None = None) -> argparse.ArgumentParser:
+    """
+    Аргументы сравнительного бенчмарка «прежняя реализация против новой»:
+    --rows (если задано значение по умолчанию), --repeat, --memory, --output.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    if rows is not None:
+        parser.add_argument('--rows', type=int, default=rows)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--memory', action='store_true', help="замерять и пиковую память (tracemalloc)")
+    parser.add_argument('--output', help="записать результаты в JSON (путь или 'auto' — benchmarks/results/)")
+    return parser
+
+
+def run_comparison(stage: str, variants: dict, make_input, rows: int, args, unit: str = 'строк') -> list:
+    """
+    Замеряет варианты {имя: func} на одних и тех же данных (measure), печатает время,
+    скорость и ускорение последнего варианта относительно первого. Результаты
+    с stage='<stage>/<имя>' при --output пишутся в JSON в формате run_all.
+    """
+    results = []
+    for name, func in variants.items():
+        result = {'stage': f"{stage}/{name}", **measure(func, make_input, rows, args.repeat, memory=args.memory)}
+        peak = f"  {result['peak_mb']:9.1f} МБ" if result['peak_mb'] is not None else ''
+        print(f"{name:12} {result['seconds']:8.3f} сек  {result['rows_per_sec']:>14,.0f} {unit}/сек{peak}")
+        results.append(result)
+    if len(results) > 1:
+        print(f"ускорение:   x{results[0]['seconds'] / results[-1]['seconds']:.1f}")
+    if args.output:
+        path = write_results(results, None if args.output == 'auto' else args.output)
+        print(f"💾 Результаты: {path}")
+    return results
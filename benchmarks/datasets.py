@@ -0,0 +1,149 @@
+"""Синтетические наборы данных для бенчмарков (10k / 100k / 1M строк)"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Папки пайплайнов — в sys.path, чтобы импортировать их модули как при запуске из папки
+for _subdir in ('fin_reports', 'funnel_v3'):
+    _path = os.path.join(ROOT, _subdir)
+    if _path not in sys.path:
+        sys.path.append(_path)
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+from my_fin_rep_utils import FIN_REPORTS_COLUMNS_TYPE, FIN_REPORTS_KEY_COLUMNS
+from type_converter import base_type
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+
+
+def make_fin_reports_frame(rows: int, null_share: float = 0.05, seed: int = 0) -> pd.DataFrame:
+    """
+    Синтетический DataFrame в том виде, в каком его строит pd.DataFrame(ответ API).
+    Ключевые колонки (realizationreport_id, rrd_id, srid) уникальны и без пропусков.
+    """
+    rng = np.random.default_rng(seed)
+    data = {}
+    for col, dtype in FIN_REPORTS_COLUMNS_TYPE.items():
+        kind = base_type(dtype)
+        if kind in ('INTEGER', 'BIGINT', 'SMALLINT'):
+            values = rng.integers(0, 10_000, rows).astype('float64')
+        elif kind == 'NUMERIC':
+            values = rng.random(rows) * 1000
+        elif kind == 'DATE':
+            values = pd.Series(pd.Timestamp('2025-10-20') + pd.to_timedelta(rng.integers(0, 7, rows), unit='D')).dt.strftime('%Y-%m-%d').to_numpy(dtype=object)
+        elif kind == 'TIMESTAMP':
+            values = pd.Series(pd.Timestamp('2025-10-20') + pd.to_timedelta(rng.integers(0, 7 * 86400, rows), unit='s')).dt.strftime('%Y-%m-%dT%H:%M:%S').to_numpy(dtype=object)
+        elif kind == 'BOOLEAN':
+            values = rng.random(rows) > 0.5
+        else:
+            values = np.array([f"{col}_{i}" for i in rng.integers(0, 1000, rows)], dtype=object)
+        if kind not in ('BOOLEAN',) and null_share and col not in FIN_REPORTS_KEY_COLUMNS:
+            values = values.astype(object) if kind in ('DATE', 'TIMESTAMP', 'TEXT', 'VARCHAR') else values
+            values[rng.random(rows) < null_share] = None if values.dtype == object else np.nan
+        data[col] = values
+    data['realizationreport_id'] = np.full(rows, 300_000_000)
+    data['rrd_id'] = np.arange(1, rows + 1)
+    data['srid'] = np.array([f"srid_{i}" for i in range(rows)], dtype=object)
+    return pd.DataFrame(data)
+
+
+def make_funnel_products(rows: int, accounts: int = 3, seed: int = 0) -> list:
+    """Список товаров в формате ответа sales-funnel/products (с полем account)."""
+    rng = np.random.default_rng(seed)
+    nm_ids = rng.integers(10_000_000, 10_000_000 + max(rows // 4, 1), rows)
+    orders = rng.integers(0, 200, rows)
+    prices = rng.integers(300, 5000, rows)
+    days = pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D')
+    dates = days.strftime('%Y-%m-%d')
+    products = []
+    for i in range(rows):
+        order_count = int(orders[i])
+        price = int(prices[i])
+        products.append({
+            'account': f"account_{i % accounts}",
+            'product': {
+                'nmId': int(nm_ids[i]),
+                'title': f"Товар {nm_ids[i]}",
+                'vendorCode': f"wild{nm_ids[i] % 1000}-{nm_ids[i]}",
+                'brandName': 'Brand',
+                'subjectId': int(nm_ids[i] % 20),
+                'subjectName': 'Футболки',
+                'productRating': 4.5,
+                'feedbackRating': 4.7,
+                'stocks': {'wb': order_count * 3, 'mp': order_count, 'balanceSum': order_count * price},
+            },
+            'statistic': {
+                'selected': {
+                    'period': {'start': dates[i], 'end': dates[i]},
+                    'openCount': order_count * 20,
+                    'cartCount': order_count * 3,
+                    'orderCount': order_count,
+                    'orderSum': order_count * price,
+                    'buyoutCount': order_count // 2,
+                    'buyoutSum': order_count // 2 * price,
+                    'cancelCount': order_count // 10,
+                    'cancelSum': order_count // 10 * price,
+                    'avgPrice': price,
+                    'avgOrdersCountPerDay': round(order_count / 30, 2),
+                    'shareOrderPercent': 1.5,
+                    'addToWishlist': order_count,
+                    'timeToReady': {'days': 1, 'hours': 2, 'mins': 3},
+                    'localizationPercent': 80,
+                },
+            },
+        })
+    return products
+
+
+def make_funnel_daily_frame(rows: int, duplicate_share: float = 0.2, seed: int = 0,
+                            skus: int = 100_000, days_count: int = 28) -> pd.DataFrame:
+    """
+    Плоская ежедневная воронка (как после разворота ответа API) с повторами по
+    (nm_id, date): duplicate_share строк — повторы уже существующих пар с другими метриками.
+    skus и days_count — сколько разных товаров и дней встречается в наборе.
+    """
+    rng = np.random.default_rng(seed)
+    unique_rows = max(int(rows * (1 - duplicate_share)), 1)
+    nm_ids = rng.integers(10_000_000, 10_000_000 + skus, unique_rows)
+    days = rng.integers(0, days_count, unique_rows)
+    repeat = rng.integers(0, unique_rows, rows - unique_rows)
+    nm_ids = np.concatenate([nm_ids, nm_ids[repeat]])
+    days = np.concatenate([days, days[repeat]])
+    dates = (pd.Timestamp('2025-01-01') + pd.to_timedelta(days, unit='D')).strftime('%Y-%m-%d')
+    orders = rng.integers(0, 200, rows)
+    df = pd.DataFrame({
+        'account': np.array([f"account_{i % 3}" for i in range(rows)], dtype=object),
+        'nm_id': nm_ids,
+        'vendor_code': np.array([f"wild{n % 1000}-{n}" for n in nm_ids], dtype=object),
+        'title': 'Товар',
+        'subject_id': nm_ids % 20,
+        'subject_name': 'Футболки',
+        'brand_name': 'Brand',
+        'product_rating': 4.5,
+        'feedback_rating': 4.7,
+        'stocks_wb': orders * 3,
+        'stocks_mp': orders,
+        'balance_sum': orders * 1000,
+        'open_count': rng.integers(0, 5000, rows),
+        'cart_count': orders * 3,
+        'order_count': orders,
+        'orders_sum': orders * rng.integers(300, 5000, rows),
+        'buyout_count': orders // 2,
+        'buyout_sum': orders * 500,
+        'cancel_count': orders // 10,
+        'cancel_sum': orders * 100,
+        'avg_price': rng.random(rows) * 5000,
+        'avg_orders_count_per_day': orders / 30,
+        'share_order_percent': 1.5,
+        'add_to_wish_list': orders,
+        'time_to_ready': 1563,
+        'localization_percent': 80,
+        'date': np.asarray(dates, dtype=object),
+    })
+    df['month'] = df['date'].str[5:7] + '-' + df['date'].str[:4]
+    df['wild'] = df['vendor_code'].str.extract(r'(wild\d+)', expand=False)
+    return df
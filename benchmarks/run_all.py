@@ -0,0 +1,187 @@
+"""Набор бенчмарков этапов пайплайнов: получение → преобразование → запись в БД
+
+Каждый этап замеряется отдельно на синтетических данных 10k / 100k / 1M строк;
+результаты (строк/сек, пиковая память) пишутся в JSON, чтобы сравнивать коммиты.
+
+Этапы:
+    fin_fetch       get_fin_reports_async против локального имитатора WB (wb_simulator.py)
+    fin_types       приведение типов fin_reports_full (TypeConverter)
+    funnel_flatten  разворот ответа sales-funnel/products (process_funnel_month/daily)
+    funnel_dedup    удаление дубликатов ежедневной воронки (main_funnel_daily)
+    db_sync         create_insert_table_db_sync (db_sync.py, схема funnel_daily), нужен --db
+    db_async        create_insert_table_db_async (fin_reports), нужен --db
+
+Этапы с БД пишут в таблицы bench_* и удаляют их после прогона. Подключение —
+те же переменные окружения, что и у загрузчиков (USER_2, PASSWORD_2, NAME_2,
+HOST_2, PORT_2); направляйте их на локальный Postgres.
+
+Запуск из корня проекта:
+    python benchmarks/run_all.py
+    python benchmarks/run_all.py --sizes 10000 100000 --stages fin_types funnel_dedup
+    python benchmarks/run_all.py --db --compare benchmarks/results/<прошлый>.json
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from common import compare, load_results, measure, write_results
+from datasets import DEFAULT_SIZES, make_fin_reports_frame, make_funnel_daily_frame, make_funnel_products
+
+# Сколько строк максимум гонять через имитатор API (генерация ответа 1M строк слишком долгая)
+FETCH_MAX_ROWS = 100_000
+BENCH_FIN_TABLE = 'bench_fin_reports_full'
+BENCH_FUNNEL_TABLE = 'bench_funnel_daily'
+
+
+class StageSkipped(Exception):
+    """Этап нельзя выполнить в этом окружении (нет зависимости или БД)."""
+
+
+def stage_fin_fetch(rows: int, args):
+    if rows > FETCH_MAX_ROWS:
+        raise StageSkipped(f"больше {FETCH_MAX_ROWS} строк через имитатор не гоняем")
+    import my_fin_rep_utils
+    from rate_limiter import RateLimiter
+    from wb_simulator import SimulatorConfig, SimulatorThread
+
+    config = SimulatorConfig(fin_rows=rows, rate_interval=0.001, cache_pages=True)
+    simulator = SimulatorThread(config).__enter__()
+    my_fin_rep_utils.STATISTICS_API_URL = simulator.base_url
+
+    async def fetch(_):
+        return await my_fin_rep_utils.get_fin_reports_async(
+            'bench', 'bench-token', '2025-10-20', '2025-10-26', rate_limiter=RateLimiter(default_interval=0))
+
+    # Первый прогон наполняет кэш страниц имитатора и в замер не входит
+    asyncio.run(fetch(None))
+    return fetch, lambda: None, lambda: simulator.__exit__(None, None, None)
+
+
+def stage_fin_types(rows: int, args):
+    from my_fin_rep_utils import fin_reports_converter
+    df = make_fin_reports_frame(rows)
+    return fin_reports_converter.convert, df.copy, None
+
+
+def _import_funnel():
+    try:
+        import utils_my_funnel
+    except ImportError as e:
+        raise StageSkipped(f"не импортируется utils_my_funnel: {e}")
+    return utils_my_funnel
+
+
+def stage_funnel_flatten(rows: int, args):
+    from funnel_normalize import normalize_funnel_products
+    products = make_funnel_products(rows)
+    return normalize_funnel_products, lambda: products, None
+
+
+def stage_funnel_dedup(rows: int, args):
+    from funnel_normalize import dedup_funnel_daily
+    df = make_funnel_daily_frame(rows)
+    return dedup_funnel_daily, df.copy, None
+
+
+async def _drop_table(table_name: str):
+    from db_async import connect_async
+    conn = await connect_async()
+    try:
+        await conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+    finally:
+        await conn.close()
+
+
+def stage_db_sync(rows: int, args):
+    if not args.db:
+        raise StageSkipped("нужен --db и локальный Postgres")
+    funnel = _import_funnel()
+    df = funnel.dedup_funnel_daily(make_funnel_daily_frame(rows))
+
+    def load(data):
+        funnel.create_insert_table_db_sync(data, BENCH_FUNNEL_TABLE, funnel.FUNNEL_COLUMNS_TYPE, ('nm_id', 'date'))
+
+    asyncio.run(_drop_table(BENCH_FUNNEL_TABLE))
+    return load, df.copy, lambda: asyncio.run(_drop_table(BENCH_FUNNEL_TABLE))
+
+
+def stage_db_async(rows: int, args):
+    if not args.db:
+        raise StageSkipped("нужен --db и локальный Postgres")
+    import db_async
+    from my_fin_rep_utils import (FIN_REPORTS_COLUMNS_TYPE, FIN_REPORTS_KEY_COLUMNS,
+                                  create_insert_table_db_async, fin_reports_converter)
+    df = fin_reports_converter.convert(make_fin_reports_frame(rows))
+
+    async def load(data):
+        await create_insert_table_db_async(data, BENCH_FIN_TABLE, FIN_REPORTS_COLUMNS_TYPE,
+                                           FIN_REPORTS_KEY_COLUMNS, method=args.load_method)
+
+    def cleanup():
+        asyncio.run(_drop_table(BENCH_FIN_TABLE))
+        db_async._ensured_tables.discard(BENCH_FIN_TABLE)
+
+    cleanup()
+    return load, df.copy, cleanup
+
+
+STAGES = {
+    'fin_fetch': stage_fin_fetch,
+    'fin_types': stage_fin_types,
+    'funnel_flatten': stage_funnel_flatten,
+    'funnel_dedup': stage_funnel_dedup,
+    'db_sync': stage_db_sync,
+    'db_async': stage_db_async,
+}
+
+
+def run_stage(name: str, rows: int, args) -> dict:
+    try:
+        func, make_input, cleanup = STAGES[name](rows, args)
+    except StageSkipped as e:
+        print(f"  {name:15} {rows:>9,} строк  пропущен: {e}")
+        return {'stage': name, 'rows': rows, 'skipped': str(e)}
+    try:
+        result = measure(func, make_input, rows, repeat=args.repeat, memory=not args.no_memory)
+    finally:
+        if cleanup:
+            cleanup()
+    peak = f"{result['peak_mb']:9.1f} МБ" if result['peak_mb'] is not None else ''
+    print(f"  {name:15} {rows:>9,} строк  {result['seconds']:9.3f} сек  {result['rows_per_sec']:>14,.0f} строк/сек  {peak}")
+    return {'stage': name, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES))
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-memory', action='store_true', help="не замерять пиковую память (tracemalloc)")
+    parser.add_argument('--db', action='store_true', help="включить этапы записи в БД")
+    parser.add_argument('--load-method', default='copy', choices=('copy', 'insert'))
+    parser.add_argument('--output', help="путь к JSON с результатами (по умолчанию benchmarks/results/)")
+    parser.add_argument('--compare', help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    results = []
+    for rows in args.sizes:
+        print(f"📏 {rows:,} строк")
+        for name in args.stages:
+            results.append(run_stage(name, rows, args))
+
+    path = write_results(results, args.output)
+    print(f"💾 Результаты: {path}")
+
+    if args.compare:
+        baseline = load_results(args.compare)
+        print(f"Сравнение с {args.compare} (коммит {baseline['meta'].get('commit')}):")
+        for stage, rows, current, old, change in compare(results, baseline['results']):
+            print(f"  {stage:15} {rows:>9,} строк  {old:>14,.0f} → {current:>14,.0f} строк/сек  {change:+6.1f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,12 @@
+import os
+import sys
 import pandas as pd
 from utils_sql import create_connection, get_db_table
 from datetime import datetime, timedelta
 from utils_gs import safe_open_spreadsheet
-from gspread_dataframe import set_with_dataframe
+# Добавляем в sys.path корень проекта (где лежит gs_sync.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gs_sync import sync_dataframe
 
 
 # Создание подключения к базе данных
@@ -24,4 +28,5 @@ connection.close()
 # Доступ к Google Sheets
 table_name = safe_open_spreadsheet('Условный расчет')
 sheet = table_name.worksheet('Справочная информация')
-set_with_dataframe(sheet, df)
+# Отправляем только изменившиеся строки
+sync_dataframe(table_name, sheet, df)
@@ -1,7 +1,12 @@
+import os
+import sys
 from utils_sql import create_connection, get_db_table
 from utils_gs import safe_open_spreadsheet
-from gspread_dataframe import set_with_dataframe
 from datetime import datetime
+# Добавляем в sys.path корень проекта (где лежит gs_sync.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gs_sync import sync_dataframe
+from gspread.utils import rowcol_to_a1
 
 def main():
 	# Устанавливаем соединение с базой данных
@@ -25,17 +30,27 @@ def main():
                 SUM(f.credit_transfers) AS "Кредит",
                 f.account
         FROM fin_rep_to_pay f
-        GROUP BY f.date_from, account;"""
+        GROUP BY f.date_from, account
+        ORDER BY f.date_from, account;"""
 	# Получаем данные из базы данных в виде DataFrame
 	df = get_db_table(query, connection)
-	df['updatet_at'] = datetime.now().strftime('%Y-%m-%d %H-%M-%S')
 	# # Преобразуем столбец date_from в строковый тип
 	# df['date_from'] = df['date_from'].astype(str)
 	# Открываем таблицу Google Sheets и выбираем нужный лист   
 	table = safe_open_spreadsheet("Условный расчет")
 	# Выбираем лист "ВБ_к_оплате"
 	sheet = table.worksheet("ВБ_к_оплате")
-	set_with_dataframe(sheet, df)
+	# Отправляем только изменившиеся ячейки (постоянный порядок строк — ORDER BY в запросе)
+	result = sync_dataframe(table, sheet, df)
+	# Время обновления — одна ячейка справа от заголовка, а не колонка в каждой строке,
+	# иначе каждый запуск переписывал бы всю колонку
+	timestamp_col = df.shape[1] + 1
+	if sheet.col_count < timestamp_col:
+		sheet.add_cols(timestamp_col - sheet.col_count)
+	if result['mode'] == 'full':
+		# Прежние значения колонки updatet_at под заголовком
+		sheet.batch_clear([f"{rowcol_to_a1(2, timestamp_col)}:{rowcol_to_a1(sheet.row_count, timestamp_col)}"])
+	sheet.update_cell(1, timestamp_col, datetime.now().strftime('%Y-%m-%d %H-%M-%S'))
 	print(f"Датафрейм загружен в гугл таблицу")
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+"""Синхронная загрузка DataFrame в PostgreSQL (UPSERT через временную таблицу)
+
+Общий загрузчик для funnel_v3 и conditional_calculation: подключение из .env
+(NAME_2, USER_2, ...), один движок SQLAlchemy на процесс, COPY во временную
+таблицу сессии и перенос в целевую таблицу одним запросом (см. upsert_sql.py).
+"""
+import io
+import logging
+import os
+import uuid
+
+import pandas as pd
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from upsert_sql import conflict_update_sql, counted_upsert_sql, upsert_counts
+
+# Способы загрузки данных в create_insert_table_db_sync
+LOAD_METHODS = ('copy', 'to_sql')
+INTEGER_TYPES = ('INTEGER', 'BIGINT', 'SMALLINT')
+
+# Движок SQLAlchemy (с пулом соединений) создаётся один раз на процесс, а не на каждую загрузку
+_engine = None
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        load_dotenv()
+        user = os.getenv('USER_2')
+        password = os.getenv('PASSWORD_2')
+        database = os.getenv('NAME_2')
+        host = os.getenv('HOST_2')
+        port = os.getenv('PORT_2')
+        _engine = create_engine(f"postgresql://{user}:{password}@{host}:{port}/{database}", pool_pre_ping=True)
+    return _engine
+
+
+def frame_to_csv(df: pd.DataFrame, columns_type: dict) -> io.StringIO:
+    """
+    CSV для COPY ... FROM STDIN: колонки в порядке columns_type, пропуски — \\N.
+    Целые колонки переводятся в Int64, чтобы float с NaN не выгружались как '12.0'.
+    """
+    data = {}
+    for col, dtype in columns_type.items():
+        column = df[col]
+        if dtype.split('(')[0].strip().upper() in INTEGER_TYPES and not pd.api.types.is_integer_dtype(column):
+            column = pd.to_numeric(column, errors='coerce').round().astype('Int64')
+        data[col] = column
+    buffer = io.StringIO()
+    pd.DataFrame(data).to_csv(buffer, index=False, header=False, na_rep='\\N')
+    buffer.seek(0)
+    return buffer
+
+
+def create_insert_table_db_sync(df: pd.DataFrame, table_name: str, columns_type: dict, key_columns: tuple,
+                                method: str = 'copy'):
+    """
+    Создаёт таблицу при необходимости и делает UPSERT df через временную таблицу.
+    Строки, совпадающие с уже записанными, не переписываются (условие IS DISTINCT FROM).
+
+    Данные идут во временную таблицу сессии с уникальным именем и типами из
+    columns_type (CREATE TEMP TABLE ... ON COMMIT DROP), и из неё одним запросом
+    переносятся в целевую таблицу — всё в одной транзакции одного соединения.
+    Поэтому несколько загрузчиков могут писать в одну таблицу одновременно.
+    method='copy' — временная таблица заполняется потоком COPY (CSV),
+    method='to_sql' — через df.to_sql на том же соединении (запасной путь).
+    Возвращает {'inserted', 'updated', 'unchanged'}.
+    """
+    if method not in LOAD_METHODS:
+        raise ValueError(f"Неизвестный способ загрузки {method}, допустимые: {LOAD_METHODS}")
+
+    try:
+        engine = get_engine()
+        
+        # Проверка типов данных
+        valid_types = ['INTEGER', 'BIGINT', 'SMALLINT', 'NUMERIC', 'DATE', 'TIMESTAMP', 'BOOLEAN', 'TEXT', 'VARCHAR']
+        for col, dtype in columns_type.items():
+            if not dtype.strip():
+                raise ValueError(f"Пустой тип данных для колонки {col}")
+            base_type = dtype.split('(')[0].strip().upper()
+            if base_type not in valid_types:
+                raise ValueError(f"Недопустимый тип данных для колонки {col}: {dtype}")
+
+        # Проверка и добавление отсутствующих колонок
+        missing_cols = set(columns_type.keys()) - set(df.columns)
+        for col in missing_cols:
+            df[col] = None
+            logging.info(f"Добавлена отсутствующая колонка {col} с None")
+        
+        extra_cols = set(df.columns) - set(columns_type.keys())
+        if extra_cols:
+            logging.warning(f"Лишние колонки в DataFrame: {extra_cols}, они будут проигнорированы")
+
+        # Формирование SQL для создания таблицы
+        columns_definition = ", ".join([f"{col} {dtype}" for col, dtype in columns_type.items()])
+        unique_constraint = f", CONSTRAINT unique_{table_name} UNIQUE ({', '.join(key_columns)})" if key_columns else ""
+
+        create_table_query = f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                {columns_definition}{unique_constraint}
+            )
+        """
+
+        # Подготовка данных для вставки
+        columns = list(columns_type.keys())
+        
+        # Временная таблица для UPSERT: своя у каждого вызова, видна только этому соединению
+        temp_table = f"temp_{table_name[:40]}_{uuid.uuid4().hex[:12]}"
+        create_temp_query = f"CREATE TEMP TABLE {temp_table} ({columns_definition}) ON COMMIT DROP"
+
+        # INSERT ... SELECT из временной таблицы: меняются только отличающиеся строки,
+        # запрос возвращает число вставленных и изменённых
+        conflict_sql = conflict_update_sql(table_name, columns, key_columns, on_constraint=False) if key_columns else ""
+        upsert_query = counted_upsert_sql(f"""
+            INSERT INTO {table_name} ({', '.join(columns)})
+            SELECT {', '.join(columns)} FROM {temp_table}
+            {conflict_sql}
+        """)
+
+        if method == 'copy':
+            connection = engine.raw_connection()
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(create_table_query)
+                    cursor.execute(create_temp_query)
+                    cursor.copy_expert(
+                        f"COPY {temp_table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                        frame_to_csv(df, columns_type),
+                    )
+                    cursor.execute(upsert_query)
+                    result = cursor.fetchone()
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                connection.close()
+        else:
+            # Одна транзакция: временная таблица живёт до её COMMIT и видна to_sql на том же соединении
+            with engine.begin() as conn:
+                conn.execute(text(create_table_query))
+                conn.execute(text(create_temp_query))
+                df[columns].to_sql(temp_table, conn, if_exists='append', index=False)
+                result = conn.execute(text(upsert_query)).one()
+
+        counts = upsert_counts(len(df), result[0], result[1])
+        logging.info(f"Успешно сохранено {len(df)} строк в {table_name} ({method}): новых {counts['inserted']}, "
+                     f"изменённых {counts['updated']}, без изменений {counts['unchanged']}")
+        return counts
+        
+    except SQLAlchemyError as e:
+        logging.error(f"Ошибка при работе с БД: {str(e)}")
+        raise
+    except Exception as e:
+        logging.error(f"Неожиданная ошибка: {str(e)}")
+        raise
@@ -0,0 +1,104 @@
+"""Чекпоинты пагинации отчётов: докачка с последней записанной страницы"""
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+
+import asyncpg
+
+
+CHECKPOINTS_TABLE = 'fin_reports_checkpoints'
+
+
+def _to_date(value) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+class CheckpointStore:
+    """
+    Хранит по каждому периоду (account, date_from, date_to) последний rrdid,
+    до которого данные уже записаны в БД, число загруженных строк и признак
+    того, что период выгружен полностью.
+
+    В потоковом режиме страницы одного периода могут записываться разными
+    писателями не по порядку, поэтому чекпоинт продвигается только по
+    непрерывной последовательности записанных страниц (page_done). После
+    ошибки записи страницы чекпоинт периода больше не двигается в этом запуске.
+    Сохранения одного периода идут строго по очереди (блокировка на период):
+    иначе более ранний чекпоинт, закоммиченный позже, затёр бы более поздний.
+    """
+
+    def __init__(self, pool: asyncpg.Pool, table_name: str = CHECKPOINTS_TABLE):
+        self.pool = pool
+        self.table_name = table_name
+        # Прогресс записи страниц по периодам в текущем запуске
+        self._progress = {}
+        self._locks = {}
+
+    async def ensure_table(self):
+        async with self.pool.acquire() as conn:
+            await conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.table_name} (
+                    account VARCHAR(50) NOT NULL,
+                    date_from DATE NOT NULL,
+                    date_to DATE NOT NULL,
+                    last_rrdid BIGINT NOT NULL DEFAULT 0,
+                    rows_loaded BIGINT NOT NULL DEFAULT 0,
+                    completed BOOLEAN NOT NULL DEFAULT FALSE,
+                    updated_at TIMESTAMP NOT NULL DEFAULT now(),
+                    CONSTRAINT unique_{self.table_name} UNIQUE (account, date_from, date_to)
+                )
+            """)
+
+    async def get(self, account: str, date_from: str, date_to: str) -> dict | None:
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow(f"""
+                SELECT last_rrdid, rows_loaded, completed, updated_at FROM {self.table_name}
+                WHERE account = $1 AND date_from = $2 AND date_to = $3
+            """, account, _to_date(date_from), _to_date(date_to))
+        return dict(row) if row else None
+
+    async def save(self, account: str, date_from: str, date_to: str, last_rrdid: int, rows_loaded: int,
+                   completed: bool = False):
+        async with self.pool.acquire() as conn:
+            await conn.execute(f"""
+                INSERT INTO {self.table_name} (account, date_from, date_to, last_rrdid, rows_loaded, completed, updated_at)
+                VALUES ($1, $2, $3, $4, $5, $6, now())
+                ON CONFLICT ON CONSTRAINT unique_{self.table_name}
+                DO UPDATE SET last_rrdid = EXCLUDED.last_rrdid,
+                              rows_loaded = EXCLUDED.rows_loaded,
+                              completed = EXCLUDED.completed,
+                              updated_at = EXCLUDED.updated_at
+            """, account, _to_date(date_from), _to_date(date_to), int(last_rrdid), int(rows_loaded), completed)
+
+    def reset(self, account: str, date_from: str, date_to: str):
+        """Сбрасывает прогресс записи периода перед новой выгрузкой."""
+        self._progress.pop((account, date_from, date_to), None)
+
+    async def page_done(self, page, ok: bool):
+        """
+        Отмечает результат записи страницы (FinReportPage). Когда все страницы
+        до page.seq включительно записаны, сохраняет чекпоинт по последней из них.
+        """
+        key = (page.account, page.date_from, page.date_to)
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            progress = self._progress.setdefault(key, {'next_seq': 0, 'pending': {}, 'failed': False})
+            if progress['failed']:
+                return
+            if not ok:
+                progress['failed'] = True
+                logging.warning(f"⛔ {page.account} | Чекпоинт {page.date_from}–{page.date_to} остановлен на странице {progress['next_seq']}")
+                return
+
+            progress['pending'][page.seq] = page
+            last_done = None
+            while progress['next_seq'] in progress['pending']:
+                last_done = progress['pending'].pop(progress['next_seq'])
+                progress['next_seq'] += 1
+            if last_done is not None:
+                await self.save(page.account, page.date_from, page.date_to,
+                                last_done.rrdid, last_done.rows_total, last_done.completed)
+
+
+def is_settled(date_to: str, settle_days: int) -> bool:
+    """Период считается окончательным, если закончился больше settle_days дней назад."""
+    return _to_date(date_to) < (datetime.now() - timedelta(days=settle_days)).date()
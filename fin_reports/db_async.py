@@ -0,0 +1,246 @@
+"""Асинхронная работа с БД: общий пул соединений asyncpg и однократная проверка таблиц"""
+import asyncio
+import logging
+import os
+from datetime import date
+
+import asyncpg
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _connection_params() -> dict:
+    return dict(
+        user=os.getenv('USER_2'),
+        password=os.getenv('PASSWORD_2'),
+        database=os.getenv('NAME_2'),
+        host=os.getenv('HOST_2'),
+        port=os.getenv('PORT_2'),
+    )
+
+
+async def connect_async(timeout: int = 10) -> asyncpg.Connection:
+    """Одиночное соединение (для разовых вызовов без пула)."""
+    return await asyncpg.connect(**_connection_params(), timeout=timeout)
+
+
+async def create_pool_async(min_size: int = 1, max_size: int = 5, timeout: int = 10) -> asyncpg.Pool:
+    """
+    Пул соединений на весь пайплайн. Соединения (вместе с TLS-рукопожатием)
+    открываются один раз и переиспользуются всеми задачами записи;
+    max_size ограничивает число одновременных соединений с БД.
+    """
+    pool = await asyncpg.create_pool(**_connection_params(), min_size=min_size, max_size=max_size, timeout=timeout)
+    logging.info(f"🔌 Пул соединений с БД создан (min={min_size}, max={max_size})")
+    return pool
+
+
+# Таблицы, существование которых уже проверено в этом процессе
+_ensured_tables = set()
+# Месячные секции (table_name, первый день месяца), уже созданные в этом процессе
+_ensured_partitions = set()
+# Глобальный лок для создания таблицы
+table_creation_lock = asyncio.Lock()
+
+
+def partition_key_columns(key_columns, partition_by: str | None) -> tuple:
+    """
+    Колонки уникального ограничения. В секционированной таблице UNIQUE обязан
+    включать ключ секционирования, поэтому он добавляется в конец.
+    """
+    key_columns = tuple(key_columns or ())
+    if partition_by and key_columns and partition_by not in key_columns:
+        key_columns += (partition_by,)
+    return key_columns
+
+
+def partition_name(table_name: str, month: date) -> str:
+    return f"{table_name}_p{month.year}{month.month:02d}"
+
+
+async def ensure_table_async(conn: asyncpg.Connection, table_name: str, columns_type: dict, key_columns: tuple,
+                             partition_by: str | None = None):
+    """
+    Создаёт таблицу, если её нет. Проверка (DDL) выполняется один раз на имя
+    таблицы за время жизни процесса, дальше результат берётся из кэша.
+
+    partition_by — колонка-дата для секционирования по месяцам (PARTITION BY RANGE).
+    Месячные секции создаются по мере загрузки (ensure_partitions_async), строки
+    без даты попадают в секцию {table_name}_default. Существующая обычная таблица
+    не перестраивается — см. migrate_to_partitioned_async.
+    """
+    if table_name in _ensured_tables:
+        return
+
+    # Формирование SQL для колонок
+    columns_definition = ", ".join([f"{col} {dtype}" for col, dtype in columns_type.items()])
+    # создает SQL-выражение для уникального ограничения (UNIQUE constraint) в таблице базы данных.
+    key_columns = partition_key_columns(key_columns, partition_by)
+    unique_constraint = f"CONSTRAINT unique_{table_name} UNIQUE ({', '.join(key_columns)})" if key_columns else ""
+    partition_clause = f" PARTITION BY RANGE ({partition_by})" if partition_by else ""
+    default_partition = (f"CREATE TABLE {table_name}_default PARTITION OF {table_name} DEFAULT;"
+                         if partition_by else "")
+
+    create_table_query = f"""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT FROM pg_tables WHERE tablename = '{table_name}') THEN
+                CREATE TABLE {table_name} (
+                    {columns_definition}{', ' + unique_constraint if unique_constraint else ''}
+                ){partition_clause};
+                {default_partition}
+            END IF;
+        END$$;
+    """
+
+    # Безопасное создание таблицы
+    async with table_creation_lock:
+        if table_name in _ensured_tables:
+            return
+        await conn.execute(create_table_query)
+        if partition_by:
+            is_partitioned = await conn.fetchval("""
+                SELECT EXISTS (
+                    SELECT 1 FROM pg_partitioned_table pt
+                    JOIN pg_class c ON c.oid = pt.partrelid
+                    WHERE c.relname = $1
+                )
+            """, table_name)
+            if not is_partitioned:
+                raise RuntimeError(f"Таблица {table_name} уже существует и не секционирована. "
+                                   f"Перенесите данные через migrate_to_partitioned_async")
+        _ensured_tables.add(table_name)
+
+
+def partition_months(values) -> list[date]:
+    """Первые дни месяцев, в которые попадают значения (даты или строки), без пропусков."""
+    months = pd.to_datetime(pd.Series(values), errors='coerce').dropna().dt.to_period('M').unique()
+    return sorted(month.start_time.date() for month in months)
+
+
+async def ensure_partitions_async(conn: asyncpg.Connection, table_name: str, values):
+    """
+    Создаёт недостающие месячные секции под значения ключа секционирования
+    (перед загрузкой). Уже созданные секции берутся из кэша процесса.
+    """
+    months = [month for month in partition_months(values) if (table_name, month) not in _ensured_partitions]
+    if not months:
+        return
+    async with table_creation_lock:
+        for month in months:
+            if (table_name, month) in _ensured_partitions:
+                continue
+            next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+            await conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {partition_name(table_name, month)}
+                PARTITION OF {table_name}
+                FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')
+            """)
+            _ensured_partitions.add((table_name, month))
+            logging.info(f"🧩 Секция {partition_name(table_name, month)} готова")
+
+
+async def dependent_matviews_async(conn: asyncpg.Connection, table_name: str) -> list[dict]:
+    """
+    Материализованные представления, построенные непосредственно на table_name:
+    [{'name', 'definition', 'populated', 'indexes'}] в порядке создания. Определение
+    и индексы берутся как есть (pg_matviews.definition, pg_indexes.indexdef), чтобы
+    пересоздать представление без изменений.
+    """
+    rows = await conn.fetch("""
+        SELECT DISTINCT c.oid, n.nspname AS schema, c.relname AS name, m.definition, m.ispopulated
+        FROM pg_depend d
+        JOIN pg_rewrite r ON r.oid = d.objid AND d.classid = 'pg_rewrite'::regclass
+        JOIN pg_class c ON c.oid = r.ev_class AND c.relkind = 'm'
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_matviews m ON m.schemaname = n.nspname AND m.matviewname = c.relname
+        WHERE d.refobjid = to_regclass($1)
+        ORDER BY c.oid
+    """, table_name)
+    views = []
+    for row in rows:
+        indexes = await conn.fetch("SELECT indexdef FROM pg_indexes WHERE schemaname = $1 AND tablename = $2",
+                                   row['schema'], row['name'])
+        views.append({'name': f"{row['schema']}.{row['name']}",
+                      'definition': row['definition'].strip().rstrip(';'),
+                      'populated': row['ispopulated'],
+                      'indexes': [index['indexdef'] for index in indexes]})
+    return views
+
+
+async def migrate_to_partitioned_async(conn: asyncpg.Connection, table_name: str, columns_type: dict,
+                                       key_columns: tuple, partition_by: str) -> str:
+    """
+    Переносит обычную таблицу в секционированную по месяцам: старая таблица
+    переименовывается в {table_name}_heap (и остаётся как резервная копия),
+    создаётся секционированная с тем же именем, секции под все месяцы данных,
+    и строки переносятся одним INSERT ... SELECT в одной транзакции.
+
+    Материализованные представления на этой таблице пересоздаются в той же
+    транзакции по своим определениям и индексам, иначе после переименования они
+    продолжили бы читать {table_name}_heap. Права на представления не переносятся.
+    Если на них построены другие представления, DROP завершится ошибкой и миграция
+    откатится целиком. Возвращает имя старой таблицы.
+    """
+    heap_table = f"{table_name}_heap"
+    async with conn.transaction():
+        # Определения читаем до переименования: в них ещё стоит имя table_name
+        views = await dependent_matviews_async(conn, table_name)
+        for view in reversed(views):
+            await conn.execute(f"DROP MATERIALIZED VIEW {view['name']}")
+        await conn.execute(f"ALTER TABLE {table_name} RENAME TO {heap_table}")
+        await conn.execute(f"ALTER TABLE {heap_table} RENAME CONSTRAINT unique_{table_name} TO unique_{heap_table}")
+        _ensured_tables.discard(table_name)
+        await ensure_table_async(conn, table_name, columns_type, key_columns, partition_by)
+        months = await conn.fetch(f"SELECT DISTINCT date_trunc('month', {partition_by})::date AS month FROM {heap_table}")
+        await ensure_partitions_async(conn, table_name, [row['month'] for row in months])
+        columns_sql = ', '.join(columns_type)
+        await conn.execute(f"INSERT INTO {table_name} ({columns_sql}) SELECT {columns_sql} FROM {heap_table}")
+        for view in views:
+            # Опустошённые (например, *_mv_definition из summaries.py) остаются без данных
+            await conn.execute(f"CREATE MATERIALIZED VIEW {view['name']} AS {view['definition']}"
+                               f"{'' if view['populated'] else ' WITH NO DATA'}")
+            for indexdef in view['indexes']:
+                await conn.execute(indexdef)
+    if views:
+        logging.info(f"🧩 Пересозданы на {table_name}: {', '.join(view['name'] for view in views)}")
+    logging.info(f"🧩 {table_name} перенесена в секционированную таблицу, прежняя — {heap_table}")
+    return heap_table
+
+
+class WriteTracker:
+    """
+    Учёт записей за запуск: сколько строк записано в каждую таблицу и какие
+    срезы (account, date_from) были затронуты. По нему пересчитываются только
+    изменившиеся части сводных таблиц и пропускаются лишние обновления.
+
+    Если загрузчик передал counts (inserted/updated/unchanged), записанными
+    считаются только вставленные и изменённые строки: порция, в которой ничего
+    не поменялось, не помечает ни таблицу, ни свои срезы.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.counts = {}
+        self._slices = {}
+
+    def record(self, table_name: str, df, counts: dict | None = None,
+               slice_columns: tuple = ('account', 'date_from')):
+        written = len(df)
+        if counts is not None:
+            written = counts['inserted'] + counts['updated']
+            totals = self.counts.setdefault(table_name, {'inserted': 0, 'updated': 0, 'unchanged': 0})
+            for key in totals:
+                totals[key] += counts[key]
+        self.rows[table_name] = self.rows.get(table_name, 0) + written
+        if written and all(col in df.columns for col in slice_columns):
+            touched = self._slices.setdefault(table_name, set())
+            touched.update(df[list(slice_columns)].drop_duplicates().itertuples(index=False, name=None))
+
+    def slices(self, table_name: str) -> set:
+        return self._slices.get(table_name, set())
+
+    def written_tables(self) -> set:
+        return {table for table, rows in self.rows.items() if rows}
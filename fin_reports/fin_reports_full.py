@@ -1,7 +1,12 @@
+import argparse
 import asyncio
 import logging
-from my_fin_rep_utils import fetch_all_data, load_api_tokens
-from utils_sql import create_connection_to_vector_db, execute_query
+from my_fin_rep_utils import (fetch_all_data, load_api_tokens, FIN_REPORTS_TABLE, FIN_REPORTS_ENDPOINT,
+                              FIN_REPORTS_COLUMNS_TYPE, FIN_REPORTS_KEY_COLUMNS, FIN_REPORTS_PARTITION_COLUMN)
+from db_async import create_pool_async, migrate_to_partitioned_async
+from mv_refresher import MV_DEPENDENCIES, refresh_materialized_views_async
+from summaries import refresh_summaries_async
+from wb_archive import add_archive_arguments, configure_archive, get_archive
 
 
 # Настройка логирования
@@ -14,20 +19,62 @@ logging.basicConfig(
     ], encoding='utf-8'
 )
 
-if __name__ == "__main__":
-    asyncio.run(fetch_all_data(load_api_tokens(), num_weeks=2))
-    logging.info("✅ Загрузка данных завершена")
-    # Устанавливаем соединение с БД
-    connection = create_connection_to_vector_db()
-    # Обновляем материализованные представления
-    query_penalties = """REFRESH MATERIALIZED VIEW CONCURRENTLY public.penalties_mv;"""
-    execute_query(connection, query_penalties)
-    logging.info("Материализованное представление penalties_mv 🔁")
 
-    query_fin_deductions = """REFRESH MATERIALIZED VIEW CONCURRENTLY public.fin_deductions_mv;"""
-    execute_query(connection, query_fin_deductions)
-    logging.info("Материализованное представление fin_deductions_mv 🔁")
+async def main(summary_mode: str, replay: bool = False, partitioned: bool = False, migrate: bool = False,
+               stream: bool = True, queue_size: int = 4, writers_count: int = 2):
+    periods = None
+    if replay:
+        # Воспроизводим все недели, которые есть в архиве (ключ периода — "date_from_date_to")
+        periods = [tuple(key.split('_')) for key in reversed(get_archive().periods(FIN_REPORTS_ENDPOINT))]
+    partition_by = FIN_REPORTS_PARTITION_COLUMN if partitioned or migrate else None
+    if not stream and not replay:
+        # Чекпоинт страницы сохраняется только после её записи в БД; в пакетном режиме
+        # неделя пишется целиком, и при падении процесса посреди недели она скачивается заново
+        logging.warning("⚠️ Пакетный режим: докачка с последней страницы работает только для потоковой записи")
+    pool = await create_pool_async()
+    try:
+        if migrate:
+            # Разовый перенос существующей таблицы в секционированную
+            async with pool.acquire() as conn:
+                await migrate_to_partitioned_async(conn, FIN_REPORTS_TABLE, FIN_REPORTS_COLUMNS_TYPE,
+                                                   FIN_REPORTS_KEY_COLUMNS, FIN_REPORTS_PARTITION_COLUMN)
+        # При воспроизведении периоды пересобираются целиком, без чекпоинтов
+        tracker = await fetch_all_data(load_api_tokens(), num_weeks=2, pool=pool,
+                                       stream=stream, queue_size=queue_size, writers_count=writers_count,
+                                       resume=not replay, force=replay, periods=periods,
+                                       partition_by=partition_by)
+        logging.info("✅ Загрузка данных завершена")
+        # Представления, переведённые на таблицы *_summary, пересчитываются только по срезам,
+        # затронутым этой загрузкой; incremental переводит ещё не переведённые
+        maintained = await refresh_summaries_async(pool, tracker.slices(FIN_REPORTS_TABLE),
+                                                   switch=summary_mode == 'incremental')
+        # Остальные материализованные представления обновляем, если их источники менялись в этом запуске
+        dependencies = {mv: sources for mv, sources in MV_DEPENDENCIES.items() if mv not in maintained}
+        await refresh_materialized_views_async(pool, tracker.written_tables() | maintained, dependencies)
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Загрузка финансовых отчётов WB")
+    parser.add_argument('--summary-mode', choices=('mv', 'incremental'), default='mv',
+                        help="mv — REFRESH материализованных представлений, "
+                             "incremental — перевести их на таблицы *_summary с пересчётом только затронутых срезов "
+                             "(перевод однократный, дальше они так обслуживаются в любом режиме)")
+    parser.add_argument('--partitioned', action='store_true',
+                        help="fin_reports_full секционирована по месяцам date_from, секции создаются при загрузке")
+    parser.add_argument('--migrate-partitioned', action='store_true',
+                        help="перед загрузкой перенести существующую fin_reports_full в секционированную")
+    parser.add_argument('--no-stream', dest='stream', action='store_false',
+                        help="пакетный режим: неделя собирается в памяти и пишется целиком")
+    parser.add_argument('--queue-size', type=int, default=4,
+                        help="потоковый режим: сколько страниц может ждать записи")
+    parser.add_argument('--writers', type=int, default=2,
+                        help="потоковый режим: число параллельных писателей в БД")
+    add_archive_arguments(parser)
+    args = parser.parse_args()
 
-    query_fin_weekly_fin_rep = """REFRESH MATERIALIZED VIEW CONCURRENTLY public.weekly_fin_reports_mv;"""
-    execute_query(connection, query_fin_weekly_fin_rep)
-    logging.info("Материализованное представление weekly_fin_reports_mv 🔁")
+    archive = configure_archive(args.archive_mode, args.archive_dir)
+    asyncio.run(main(args.summary_mode, replay=archive.replaying, partitioned=args.partitioned,
+                     migrate=args.migrate_partitioned, stream=args.stream, queue_size=args.queue_size,
+                     writers_count=args.writers))
@@ -0,0 +1,94 @@
+"""Обновление материализованных представлений с учётом зависимостей и записей за запуск"""
+import asyncio
+import logging
+import time
+
+import asyncpg
+
+
+# Материализованное представление -> таблицы/представления, из которых оно строится.
+# Если источник — другое представление, оно обновляется раньше.
+MV_DEPENDENCIES = {
+    'public.penalties_mv': {'fin_reports_full'},
+    'public.fin_deductions_mv': {'fin_reports_full'},
+    'public.weekly_fin_reports_mv': {'fin_reports_full'},
+}
+
+
+def refresh_levels(dependencies: dict) -> list[list[str]]:
+    """
+    Раскладывает представления по уровням: на каждом уровне только те, чьи
+    источники-представления уже обновлены на предыдущих уровнях.
+    Представления одного уровня независимы и обновляются параллельно.
+    """
+    remaining = dict(dependencies)
+    levels = []
+    while remaining:
+        level = [mv for mv, sources in remaining.items() if not (sources & remaining.keys())]
+        if not level:
+            raise ValueError(f"Циклическая зависимость материализованных представлений: {sorted(remaining)}")
+        levels.append(sorted(level))
+        for mv in level:
+            del remaining[mv]
+    return levels
+
+
+def views_to_refresh(written_tables: set, dependencies: dict = MV_DEPENDENCIES) -> set:
+    """
+    Представления, у которых хотя бы один источник изменился в этом запуске
+    (в том числе транзитивно — через другое обновляемое представление).
+    """
+    changed = set(written_tables)
+    stale = set()
+    for level in refresh_levels(dependencies):
+        for mv in level:
+            if dependencies[mv] & changed:
+                stale.add(mv)
+                changed.add(mv)
+    return stale
+
+
+async def refresh_view(pool: asyncpg.Pool, view: str, concurrently: bool = True) -> float:
+    start = time.perf_counter()
+    async with pool.acquire() as conn:
+        await conn.execute(f"REFRESH MATERIALIZED VIEW {'CONCURRENTLY ' if concurrently else ''}{view}")
+    elapsed = time.perf_counter() - start
+    logging.info(f"Материализованное представление {view} 🔁 за {elapsed:.1f} сек")
+    return elapsed
+
+
+async def refresh_materialized_views_async(pool: asyncpg.Pool, written_tables: set,
+                                           dependencies: dict = MV_DEPENDENCIES,
+                                           concurrently: bool = True) -> dict:
+    """
+    Обновляет только представления, чьи источники получили записи в этом запуске
+    (written_tables — см. WriteTracker.written_tables). Независимые представления
+    обновляются параллельно на отдельных соединениях пула. Ошибки не глушатся:
+    после завершения уровня первая ошибка пробрасывается дальше.
+
+    Возвращает {представление: время обновления в секундах}.
+    """
+    stale = views_to_refresh(written_tables, dependencies)
+    skipped = sorted(set(dependencies) - stale)
+    if skipped:
+        logging.info(f"⏭️ Источники не менялись, пропускаем: {', '.join(skipped)}")
+    if not stale:
+        return {}
+
+    timings = {}
+    for level in refresh_levels(dependencies):
+        views = [mv for mv in level if mv in stale]
+        if not views:
+            continue
+        results = await asyncio.gather(*(refresh_view(pool, mv, concurrently) for mv in views),
+                                       return_exceptions=True)
+        errors = []
+        for mv, result in zip(views, results):
+            if isinstance(result, BaseException):
+                logging.error(f"❌ Ошибка обновления {mv}: {result}")
+                errors.append(result)
+            else:
+                timings[mv] = result
+        if errors:
+            raise errors[0]
+    return timings
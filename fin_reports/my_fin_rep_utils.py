@@ -1,3 +1,5 @@
+import os
+import sys
 import asyncio
 import aiohttp
 import pandas as pd
@@ -5,9 +7,18 @@ import logging
 from datetime import datetime, timedelta
 import json
 import traceback
-from dotenv import load_dotenv
-import os
 import asyncpg
+from dataclasses import dataclass, field
+from rate_limiter import RateLimiter
+from type_converter import compile_converter, frame_to_records
+from db_async import (WriteTracker, connect_async, create_pool_async, ensure_partitions_async, ensure_table_async,
+                      partition_key_columns)
+from checkpoints import CheckpointStore, is_settled
+from page_decoder import JSONDecodeError, PageDecoder
+# Добавляем в sys.path корень проекта (где лежат wb_archive.py и upsert_sql.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wb_archive import ArchiveMissError, get_archive
+from upsert_sql import conflict_update_sql, counted_upsert_sql, upsert_counts
 
 
 
@@ -17,29 +28,164 @@ def load_api_tokens():
     with open('tokens.json', encoding= 'utf-8') as f:
         tokens = json.load(f)
         return tokens
-# next_request_time будет хранить время, когда можно сделать следующий запрос для каждого аккаунта
-# Это нужно для соблюдения рейт-лимита Wildberries API
-next_request_time = {}
-# request_lock используется для синхронизации доступа к next_request_time
-# Это нужно, чтобы избежать гонок при обновлении времени следующего запроса
-# Если несколько корутин одновременно попытаются обновить время, это может привести к ошибкам
-request_lock = asyncio.Lock()
-# semaphore ограничивает количество одновременных запросов к API
-# semaphore = asyncio.Semaphore(8)  # максимум 8 одновременных запросов
-
-async def get_fin_reports_async(account: str, api_token: str, date_from: str, date_to: str, request_lock: asyncio.Lock, next_request_time: dict):
-    """Получаем финансовые отчёты с правильной пагинацией и retry."""
-    # Глобальный словарь: когда можно следующий запрос по аккаунту
-
-    async with asyncio.Semaphore(17) as semaphore:
-        print(f"🔍 {account} | Запрос за {date_from} – {date_to}")
-
-    url = "https://statistics-api.wildberries.ru/api/v5/supplier/reportDetailByPeriod"
+
+# Таблица и схема для финансовых отчётов
+FIN_REPORTS_TABLE = 'fin_reports_full'
+FIN_REPORTS_COLUMNS_TYPE = {
+    "realizationreport_id": "INTEGER",
+    "date_from": "DATE",
+    "date_to": "DATE",
+    "create_dt": "DATE",
+    "currency_name": "TEXT",
+    "suppliercontract_code": "TEXT",
+    "rrd_id": "BIGINT",
+    "gi_id": "BIGINT",
+    "dlv_prc": "TEXT",
+    "fix_tariff_date_from": "DATE",
+    "fix_tariff_date_to": "DATE",
+    "subject_name": "TEXT",
+    "nm_id": "BIGINT",
+    "brand_name": "TEXT",
+    "sa_name": "TEXT",
+    "ts_name": "TEXT",
+    "barcode": "TEXT",
+    "doc_type_name": "TEXT",
+    "quantity": "INTEGER",
+    "retail_price": "NUMERIC(12,2)",
+    "retail_amount": "NUMERIC(12,2)",
+    "sale_percent": "SMALLINT",
+    "commission_percent": "NUMERIC(5,2)",
+    "office_name": "TEXT",
+    "supplier_oper_name": "TEXT",
+    "order_dt": "TIMESTAMP",
+    "sale_dt": "TIMESTAMP",
+    "rr_dt": "DATE",
+    "shk_id": "BIGINT",
+    "retail_price_withdisc_rub": "NUMERIC(12,2)",
+    "delivery_amount": "INTEGER",
+    "return_amount": "INTEGER",
+    "delivery_rub": "NUMERIC(12,2)",
+    "gi_box_type_name": "TEXT",
+    "product_discount_for_report": "NUMERIC(5,2)",
+    "supplier_promo": "NUMERIC(12,2)",
+    "ppvz_spp_prc": "NUMERIC(5,2)",
+    "ppvz_kvw_prc_base": "NUMERIC(5,2)",
+    "ppvz_kvw_prc": "NUMERIC(5,2)",
+    "sup_rating_prc_up": "NUMERIC(5,2)",
+    "is_kgvp_v2": "BOOLEAN",
+    "ppvz_sales_commission": "NUMERIC(12,2)",
+    "ppvz_for_pay": "NUMERIC(12,2)",
+    "ppvz_reward": "NUMERIC(12,2)",
+    "acquiring_fee": "NUMERIC(12,2)",
+    "acquiring_percent": "NUMERIC(5,2)",
+    "payment_processing": "TEXT",
+    "acquiring_bank": "TEXT",
+    "ppvz_vw": "NUMERIC(12,2)",
+    "ppvz_vw_nds": "NUMERIC(12,2)",
+    "ppvz_office_name": "TEXT",
+    "ppvz_office_id": "INTEGER",
+    "ppvz_supplier_id": "INTEGER",
+    "ppvz_supplier_name": "TEXT",
+    "ppvz_inn": "TEXT",
+    "declaration_number": "TEXT",
+    "bonus_type_name": "TEXT",
+    "sticker_id": "TEXT",
+    "site_country": "TEXT",
+    "srv_dbs": "BOOLEAN",
+    "penalty": "NUMERIC(12,2)",
+    "additional_payment": "NUMERIC(12,2)",
+    "rebill_logistic_cost": "NUMERIC(12,2)",
+    "rebill_logistic_org": "TEXT",
+    "storage_fee": "NUMERIC(12,2)",
+    "deduction": "NUMERIC(12,2)",
+    "acceptance": "NUMERIC(12,2)",
+    "assembly_id": "BIGINT",
+    "srid": "TEXT",
+    "report_type": "SMALLINT",
+    "is_legal_entity": "BOOLEAN",
+    "trbx_id": "TEXT",
+    "installment_cofinancing_amount": "NUMERIC(12,2)",
+    "wibes_wb_discount_percent": "SMALLINT",
+    "cashback_amount": "NUMERIC(12,2)",
+    "cashback_discount": "NUMERIC(12,2)",
+    "account": "VARCHAR(50)",
+    "payment_schedule": 'NUMERIC(10,2)', 
+    "order_uid": "TEXT",
+    "kiz":"TEXT", 
+    "cashback_commission_change" : "INTEGER", 
+    "delivery_method": "TEXT"
+    }
+FIN_REPORTS_KEY_COLUMNS = ['realizationreport_id', 'rrd_id', 'srid']
+# Колонка помесячного секционирования fin_reports_full (при загрузке с partition_by)
+FIN_REPORTS_PARTITION_COLUMN = 'date_from'
+# Конвертер типов собирается из схемы один раз при импорте
+fin_reports_converter = compile_converter(FIN_REPORTS_COLUMNS_TYPE)
+# Колонки ответа API (account добавляется загрузчиком)
+fin_reports_decoder = PageDecoder([col for col in FIN_REPORTS_COLUMNS_TYPE if col != 'account'])
+
+# Базовый URL statistics-api (переопределяется, например, для локального имитатора wb_simulator.py)
+STATISTICS_API_URL = os.getenv('WB_STATISTICS_API_URL', 'https://statistics-api.wildberries.ru')
+# Эндпоинт отчёта о реализации (ключ для рейт-лимитера и архива ответов)
+FIN_REPORTS_ENDPOINT = 'reportDetailByPeriod'
+# rate_limiter хранит отдельный token bucket на каждую пару (аккаунт, эндпоинт).
+# Ожидание одного аккаунта (например, 65 сек после 429) не блокирует запросы остальных.
+# WB разрешает 1 запрос в минуту к reportDetailByPeriod на один токен.
+rate_limiter = RateLimiter(default_interval=60)
+
+
+@dataclass
+class FinReportPage:
+    """Одна страница отчёта (до 50 000 строк), уже приведённая к типам БД.
+    Страница с df=None — маркер конца периода (completed=True, если выгрузка дошла до конца)."""
+    account: str
+    date_from: str
+    date_to: str
+    df: pd.DataFrame | None
+    # порядковый номер страницы в текущей выгрузке периода
+    seq: int = 0
+    # rrdid последней строки страницы — с него продолжается пагинация
+    rrdid: int = 0
+    # всего строк периода с учётом этой страницы (включая загруженные в прошлых запусках)
+    rows_total: int = 0
+    completed: bool = False
+
+
+async def get_fin_reports_async(account: str, api_token: str, date_from: str, date_to: str,
+                                rate_limiter: RateLimiter = rate_limiter, page_queue: asyncio.Queue | None = None,
+                                start_rrdid: int = 0, start_rows: int = 0):
+    """Получаем финансовые отчёты с правильной пагинацией и retry.
+
+    Если передана page_queue, работает в потоковом режиме: каждая страница сразу
+    приводится к типам и кладётся в очередь на запись (FinReportPage), а функция
+    возвращает только количество полученных строк. Очередь ограничена по размеру,
+    поэтому при медленной записи загрузка страниц приостанавливается.
+    Без page_queue возвращает DataFrame за весь период; в df.attrs кладутся
+    last_rrdid и completed (дошла ли пагинация до конца).
+
+    start_rrdid/start_rows позволяют продолжить выгрузку с чекпоинта.
+    """
+
+    logging.info(f"🔍 {account} | Запрос за {date_from} – {date_to}")
+
+    url = f"{STATISTICS_API_URL}/api/v5/supplier/reportDetailByPeriod"
     headers = {"Authorization": api_token}
     #  указатель на последнюю обработанную строку, используется для пагинации.
-    rrdid = 0
+    rrdid = start_rrdid
+    if start_rrdid:
+        logging.info(f"⏩ {account} | Продолжаем {date_from} – {date_to} с rrdid={start_rrdid} ({start_rows} строк уже загружено)")
     # список, в который будут складываться все DataFrame с данными.
     all_data = []
+    # количество строк, отправленных в очередь (потоковый режим)
+    rows_streamed = 0
+    # номер следующей страницы для очереди записи
+    seq = 0
+    # True, если пагинация закончилась штатно (данных больше нет), а не из-за ошибки
+    completed = False
+    # суммарное время разбора JSON за период, мс
+    parse_ms_total = 0.0
+    # архив сырых страниц: запись (record) или воспроизведение без HTTP (replay)
+    archive = get_archive()
+    period_key = f"{date_from}_{date_to}"
 
     timeout = aiohttp.ClientTimeout(total=120, connect=30, sock_read=60, sock_connect=15)
     # Создаётся асинхронная HTTP-сессия. Все запросы будут идти через неё.
@@ -50,17 +196,10 @@ async def get_fin_reports_async(account: str, api_token: str, date_from: str, da
 
         while attempt < max_attempts:
             try:
-                # Проверяем, когда можно сделать следующий запрос для этого аккаунта
-                async with request_lock:
-                    now = datetime.now()
-                    # Если для аккаунта нет времени следующего запроса, устанавливаем его в текущее время
-                    last_call = next_request_time.get(account, now)
-                    # Если сейчас меньше времени следующего запроса, ждём
-                    if now < last_call:
-                        # Вычисляем, сколько нужно подождать
-                        wait = (last_call - now).total_seconds()
-                        logging.warning(f"[{account}] Ждём {wait:.1f} сек до следующего запроса")
-                        await asyncio.sleep(wait)
+                # Ждём свободный слот в token bucket'е этого аккаунта (без общего лока).
+                # При воспроизведении из архива запросов к API нет — лимит не нужен.
+                if not archive.replaying:
+                    await rate_limiter.acquire(account, FIN_REPORTS_ENDPOINT)
                 params = {
                     "dateFrom": date_from,
                     "dateTo": date_to,
@@ -68,14 +207,18 @@ async def get_fin_reports_async(account: str, api_token: str, date_from: str, da
                     "rrdid": rrdid,
                 }
                 # Отправляем GET-запрос к API Wildberries
-                async with session.get(url, headers=headers, params=params) as response:
+                if archive.replaying:
+                    # Страница архива с тем же rrdid вместо запроса к API
+                    request = archive.response(FIN_REPORTS_ENDPOINT, account, period_key, rrdid)
+                else:
+                    request = session.get(url, headers=headers, params=params)
+                async with request as response:
                     # ✅ Если получаем 429 ошибку, значит превысили лимит запросов.
                     if response.status == 429:
-                        logging.warning(f"[429] {account} | Лимит. Ждём 65 сек...")
-                        async with request_lock:
-                            next_request_time[account] = datetime.now() + timedelta(seconds=65)
+                        # Учитываем X-Ratelimit-Retry / Retry-After, если WB их прислал
+                        wait = rate_limiter.update_from_headers(account, FIN_REPORTS_ENDPOINT, response.headers, default=65)
+                        logging.warning(f"[429] {account} | Лимит. Ждём {wait:.0f} сек...")
                         attempt += 1
-                        await asyncio.sleep(1)
                         continue
 
                     # ✅ Если выходит 400 ошибка, проверяем не связана ли она с критическими ошибками.
@@ -92,14 +235,16 @@ async def get_fin_reports_async(account: str, api_token: str, date_from: str, da
 
                         # Если не критично — пробуем повторить
                         logging.info(f"[400] Повторяем запрос через задержку...")
-                        async with request_lock:
-                            next_request_time[account] = datetime.now() + timedelta(seconds=65)
+                        rate_limiter.penalize(account, FIN_REPORTS_ENDPOINT, 65)
                         attempt += 1
                         await asyncio.sleep(2 * attempt)
                         continue
 
                     if response.status == 204:
                         logging.info(f"🟢 {account}: Нет данных за этот период (API вернул 204)")
+                        # В архиве 204 хранится как пустой список — при воспроизведении это тот же конец данных
+                        archive.record(FIN_REPORTS_ENDPOINT, account, period_key, rrdid, b'[]')
+                        completed = True
                         break                    
 
                     # Остальные статусы
@@ -109,43 +254,55 @@ async def get_fin_reports_async(account: str, api_token: str, date_from: str, da
                         break
 
 
-                    raw_text = await response.text()
-                    if not raw_text.strip():
+                    raw = await response.read()
+                    archive.record(FIN_REPORTS_ENDPOINT, account, period_key, rrdid, raw)
+                    if not raw.strip():
                         logging.warning(f"📡 {account}: Пустой ответ")
                         break
 
                     try:
-                        data = json.loads(raw_text)
+                        data, parse_ms = fin_reports_decoder.loads(raw)
                         if isinstance(data, list) and not data:
+                            completed = True
                             break
-                        print(f"Получены сырые данные ({len(data)} строк):", data[:1])  # Первая строка для примера
-                    except json.JSONDecodeError as je:
+                    except JSONDecodeError as je:
                         logging.error(f"💥 JSON Error {account}: {je}")
-                        logging.error(f"Raw (first 1000): {raw_text[:1000]}")
+                        logging.error(f"Raw (first 1000): {raw[:1000].decode('utf-8', errors='replace')}")
                         break
 
                     if not data or (isinstance(data, dict) and data.get("errors")):
                         logging.info(f"🟢 {account}: Нет данных за {date_from}")
+                        completed = not data
                         break
 
-                    df = pd.DataFrame(data)
+                    df, frame_ms = fin_reports_decoder.to_frame(data)
+                    parse_ms += frame_ms
+                    parse_ms_total += parse_ms
                     if df.empty:
                         logging.info(f"🟡 {account}: Пустой DataFrame")
+                        completed = True
                         break
-                    print("Создан DataFrame с колонками:", df.columns.tolist())
-                    print("Пример данных:", df.iloc[0].to_dict())
 
                     df["account"] = account
                     df['dlv_prc'] = df['dlv_prc'].astype(str)
-                    all_data.append(df)
-
-                    logging.info(f"📥 {account} | +{len(df)} строк | {date_from}–{date_to}")
-                    print(f'По {account} получаем rrdid->{df["rrd_id"].iloc[-1]}')
-
                     next_rrdid = df["rrd_id"].iloc[-1]
+                    if page_queue is not None:
+                        # Потоковый режим: страница уходит на запись, пока мы ждём следующий слот
+                        rows_streamed += len(df)
+                        await page_queue.put(FinReportPage(account, date_from, date_to, convert_fin_report_types(df),
+                                                           seq, next_rrdid, start_rows + rows_streamed))
+                        seq += 1
+                    else:
+                        all_data.append(df)
+
+                    logging.info(f"📥 {account} | +{len(df)} строк | {date_from}–{date_to} | "
+                                 f"разбор {parse_ms:.0f} мс | rrdid->{next_rrdid}")
+
                     if next_rrdid == rrdid or next_rrdid == last_rrdid:
+                        completed = True
                         break
                     if next_rrdid <= rrdid:
+                        completed = True
                         break
                     rrdid = next_rrdid
                     last_rrdid = next_rrdid
@@ -154,8 +311,7 @@ async def get_fin_reports_async(account: str, api_token: str, date_from: str, da
                     if len(df) >= 25000:
                         delay = 70
 
-                    async with request_lock:
-                        next_request_time[account] = datetime.now() + timedelta(seconds=delay)
+                    rate_limiter.update_from_headers(account, FIN_REPORTS_ENDPOINT, response.headers, default=delay)
 
             except aiohttp.ClientPayloadError as e:
                 logging.warning(f"📡 [Payload] {account}: {e}. Попытка {attempt + 1}")
@@ -175,100 +331,97 @@ async def get_fin_reports_async(account: str, api_token: str, date_from: str, da
                 await asyncio.sleep(5 * attempt)
                 continue
 
+            except ArchiveMissError as e:
+                logging.warning(f"🗄️ {account} | Страницы нет в архиве: {e}. Период воспроизведён не полностью")
+                break
+
             except Exception as e:
                 logging.error(f"❌ Ошибка {account}: {type(e).__name__}: {e}")
                 logging.error(f"TRACEBACK:\n{traceback.format_exc()}")
                 break
 
+        if page_queue is not None:
+            # Маркер конца периода: после записи всех страниц чекпоинт получит признак completed
+            await page_queue.put(FinReportPage(account, date_from, date_to, None,
+                                               seq, rrdid, start_rows + rows_streamed, completed))
+            logging.info(f"✅ {account} | Отправлено на запись {rows_streamed} строк за {date_from}–{date_to} "
+                         f"(разбор JSON {parse_ms_total:.0f} мс)")
+            return rows_streamed
+
         result = pd.concat(all_data, ignore_index=True) if all_data else pd.DataFrame()
-        # Преобразование дат
-        date_cols_list = ['date_from', 'date_to', 'create_dt', 'fix_tariff_date_from',
-                        'fix_tariff_date_to', 'rr_dt', 'order_dt', 'sale_dt'] 
-
-        for col in date_cols_list:
-            if col in result.columns:
-                result[col] = pd.to_datetime(result[col], errors='coerce')
-                if pd.api.types.is_datetime64tz_dtype(result[col]):
-                    result[col] = result[col].dt.tz_localize(None)
-                if col in ['order_dt', 'sale_dt']:
-                    result[col] = pd.Series(
-                        [x.to_pydatetime() if pd.notna(x) else None for x in result[col]],
-                        index=result.index,
-                        dtype='object'
-                    )
-                else:
-                    result[col] = result[col].apply(
-                        lambda x: x.date() if pd.notna(x) else None
-                    )
-
-        # Преобразование числовых типов
-        for col in result.columns:
-            if result[col].dtype in ['int64', 'int32', 'int16', 'int8']:
-                result[col] = pd.Series(
-                    [None if pd.isna(x) else int(x) for x in result[col]],
-                    index=result.index,
-                    dtype='object'
-                )
-            elif result[col].dtype in ['float64', 'float32', 'float16']:
-                result[col] = pd.Series(
-                    [None if pd.isna(x) else float(x) for x in result[col]],
-                    index=result.index,
-                    dtype='object'
-                )
-            elif result[col].dtype == 'bool':
-                result[col] = pd.Series(
-                    [None if pd.isna(x) else bool(x) for x in result[col]],
-                    index=result.index,
-                    dtype='object'
-                )
-
-        # Явная конвертация BOOLEAN-колонок (для надёжности, из предыдущей ошибки)
-        bool_cols = ['is_kgvp_v2', 'srv_dbs', 'is_legal_entity']
-        for col in bool_cols:
-            if col in result.columns:
-                result[col] = pd.Series(
-                    [None if pd.isna(x) else bool(x) for x in result[col]],
-                    index=result.index,
-                    dtype='object'
-                )
-
-        # Преобразование текстовых колонок (VARCHAR/TEXT)
-        text_cols = [
-            'currency_name', 'suppliercontract_code', 'dlv_prc', 'subject_name', 'brand_name',
-            'sa_name', 'ts_name', 'barcode', 'doc_type_name', 'office_name', 'supplier_oper_name',
-            'gi_box_type_name', 'payment_processing', 'acquiring_bank', 'ppvz_office_name',
-            'ppvz_supplier_name', 'ppvz_inn', 'declaration_number', 'bonus_type_name',
-            'sticker_id', 'site_country', 'rebill_logistic_org', 'kiz', 'trbx_id', 'account'
-        ]
-        for col in text_cols:
-            if col in result.columns:
-                result[col] = pd.Series(
-                    [None if pd.isna(x) else str(x) for x in result[col]],
-                    index=result.index,
-                    dtype='object'
-                )
-
-        logging.info(f"✅ {account} | Загружено {len(result)} строк за {date_from}–{date_to}")
-        print(result.info())
-        print(result.dtypes)
+        result = convert_fin_report_types(result)
+        result.attrs['last_rrdid'] = int(rrdid)
+        result.attrs['rows_total'] = start_rows + len(result)
+        result.attrs['completed'] = completed
+        result.attrs['parse_ms'] = parse_ms_total
+        logging.info(f"✅ {account} | Загружено {len(result)} строк за {date_from}–{date_to} "
+                     f"(разбор JSON {parse_ms_total:.0f} мс)")
         return result
 
-# Глобальный лок для создания таблицы
-table_creation_lock = asyncio.Lock()
 
-async def create_insert_table_db_async(df: pd.DataFrame, table_name: str, columns_type: dict, key_columns: tuple):
-    load_dotenv()
+def convert_fin_report_types(result: pd.DataFrame) -> pd.DataFrame:
+    """Приводит колонки отчёта к python-типам, которые принимает asyncpg (None вместо NaN)."""
+    return fin_reports_converter.convert(result)
+
+async def copy_upsert_async(conn: asyncpg.Connection, df: pd.DataFrame, table_name: str, columns_type: dict,
+                            key_columns: tuple) -> dict:
+    """
+    UPSERT через бинарный COPY: строки потоком копируются во временную таблицу
+    сессии (удаляется при COMMIT), затем переносятся в целевую таблицу одним
+    INSERT ... SELECT ... ON CONFLICT ON CONSTRAINT unique_{table_name} DO UPDATE.
+    Строки, совпадающие с уже записанными, не обновляются.
+
+    Возвращает {'inserted', 'updated', 'unchanged'}.
+    """
+    columns = list(columns_type.keys())
+    columns_sql = ', '.join(columns)
+    staging_table = f"staging_{table_name}"
+
+    # Повтор ключа внутри одного INSERT ... ON CONFLICT DO UPDATE вызывает ошибку,
+    # поэтому оставляем последнюю строку — как и при построчном executemany
+    if key_columns:
+        df = df.drop_duplicates(subset=list(key_columns), keep='last')
+
+    conflict_sql = conflict_update_sql(table_name, columns, key_columns) if key_columns else ""
+
+    async with conn.transaction():
+        await conn.execute(f"""
+            CREATE TEMP TABLE {staging_table} (
+                {', '.join([f"{col} {dtype}" for col, dtype in columns_type.items()])}
+            ) ON COMMIT DROP
+        """)
+        await conn.copy_records_to_table(staging_table, records=frame_to_records(df, columns), columns=columns)
+        row = await conn.fetchrow(counted_upsert_sql(f"""
+            INSERT INTO {table_name} ({columns_sql})
+            SELECT {columns_sql} FROM {staging_table}
+            {conflict_sql}
+        """))
+    return upsert_counts(len(df), row['inserted'], row['updated'])
+
+# Способы загрузки данных в create_insert_table_db_async
+LOAD_METHODS = ('copy', 'insert')
+
+async def create_insert_table_db_async(df: pd.DataFrame, table_name: str, columns_type: dict, key_columns: tuple,
+                                       method: str = 'copy', pool: asyncpg.Pool | None = None,
+                                       tracker: WriteTracker | None = None, partition_by: str | None = None):
+    """Создаёт таблицу при необходимости и делает UPSERT данных df.
+
+    method='copy' — бинарный COPY во временную таблицу сессии и один
+    INSERT ... SELECT ... ON CONFLICT DO UPDATE (быстрый путь).
+    method='insert' — прежний построчный executemany (запасной путь).
+    Если передан pool, соединение берётся из него, иначе открывается новое.
+    tracker (если передан) учитывает записанные строки и затронутые срезы.
+    Обновляются только строки, отличающиеся от записанных. Для method='copy'
+    возвращает {'inserted', 'updated', 'unchanged'}, для 'insert' — None.
+    partition_by — таблица секционирована по месяцам этой колонки: недостающие
+    секции создаются перед загрузкой, а колонка входит в уникальный ключ.
+    """
+    if method not in LOAD_METHODS:
+        raise ValueError(f"Неизвестный способ загрузки {method}, допустимые: {LOAD_METHODS}")
 
     conn = None
     try:
-        conn = await asyncpg.connect(
-            user=os.getenv('USER_2'),
-            password=os.getenv('PASSWORD_2'),
-            database=os.getenv('NAME_2'),
-            host=os.getenv('HOST_2'),
-            port=os.getenv('PORT_2'),
-            timeout=10
-        )
+        conn = await pool.acquire() if pool is not None else await connect_async()
 
         # Проверка типов данных
         valid_types = ['INTEGER', 'BIGINT', 'SMALLINT', 'NUMERIC', 'DATE', 'TIMESTAMP', 'BOOLEAN', 'TEXT', 'VARCHAR']
@@ -290,176 +443,236 @@ async def create_insert_table_db_async(df: pd.DataFrame, table_name: str, column
         if extra_cols:
             logging.warning(f"Лишние колонки в DataFrame: {extra_cols}, они будут проигнорированы")
 
-        # Формирование SQL для колонок
-        columns_definition = ", ".join([f"{col} {dtype}" for col, dtype in columns_type.items()])
-        # создает SQL-выражение для уникального ограничения (UNIQUE constraint) в таблице базы данных.
-        unique_constraint = f"CONSTRAINT unique_{table_name} UNIQUE ({', '.join(key_columns)})" if key_columns else ""
+        # Создание таблицы (проверяется один раз за процесс)
+        await ensure_table_async(conn, table_name, columns_type, key_columns, partition_by)
+        if partition_by:
+            # Секции под месяцы этой порции создаются до записи
+            await ensure_partitions_async(conn, table_name, df[partition_by])
+            key_columns = partition_key_columns(key_columns, partition_by)
 
-        # Отладка: вывод SQL-запроса
-        create_table_query = f"""
-            DO $$
-            BEGIN
-                IF NOT EXISTS (SELECT FROM pg_tables WHERE tablename = '{table_name}') THEN
-                    CREATE TABLE {table_name} (
-                        {columns_definition}{', ' + unique_constraint if unique_constraint else ''}
-                    );
-                END IF;
-            END$$;
-        """
-
-
-
-        # Безопасное создание таблицы
-        async with table_creation_lock:
-            await conn.execute(create_table_query)
-        
         # Подготовка данных для вставки
         columns = list(columns_type.keys())  # Используем только колонки из columns_type
-        records = [tuple(None if pd.isna(x) else x for x in row) for row in df[columns].to_records(index=False)]
-
-        # Формирование UPSERT-запроса
-        updates = ', '.join([f"{col}=EXCLUDED.{col}" for col in columns if col not in key_columns])
-        query = f"""
-            INSERT INTO {table_name} ({', '.join(columns)})
-            VALUES ({', '.join([f'${i+1}' for i in range(len(columns))])})
-            ON CONFLICT ON CONSTRAINT unique_{table_name}
-            DO UPDATE SET {updates}
-        """
-        
-        await conn.executemany(query, records)
-        logging.info(f"Успешно сохранено {len(df)} строк в {table_name}")
+
+        counts = None
+        if method == 'copy':
+            counts = await copy_upsert_async(conn, df, table_name, columns_type, key_columns)
+        else:
+            records = list(frame_to_records(df, columns))
+
+            # Формирование UPSERT-запроса (executemany не возвращает результат,
+            # поэтому разбивки на вставленные/обновлённые здесь нет)
+            query = f"""
+                INSERT INTO {table_name} ({', '.join(columns)})
+                VALUES ({', '.join([f'${i+1}' for i in range(len(columns))])})
+                {conflict_update_sql(table_name, columns, key_columns)}
+            """
+
+            await conn.executemany(query, records)
+        if tracker is not None:
+            tracker.record(table_name, df, counts)
+        if counts is not None:
+            logging.info(f"Успешно сохранено {len(df)} строк в {table_name} ({method}): "
+                         f"новых {counts['inserted']}, изменённых {counts['updated']}, без изменений {counts['unchanged']}")
+        else:
+            logging.info(f"Успешно сохранено {len(df)} строк в {table_name} ({method})")
+        return counts
         
     except Exception as e:
         logging.error(f"Ошибка при работе с БД: {str(e)}")
         raise
     finally:
         if conn:
-            await conn.close()
-
-
-
-async def fetch_all_data(accounts_tokens, num_weeks=1):
+            if pool is not None:
+                await pool.release(conn)
+            else:
+                await conn.close()
+
+
+
+@dataclass
+class FinReportsLoad:
+    """Куда и как записывать отчёты: таблица, схема, способ загрузки и общие объекты запуска."""
+    table_name: str = FIN_REPORTS_TABLE
+    columns_type: dict = field(default_factory=lambda: FIN_REPORTS_COLUMNS_TYPE)
+    key_columns: list = field(default_factory=lambda: FIN_REPORTS_KEY_COLUMNS)
+    method: str = 'copy'
+    pool: asyncpg.Pool | None = None
+    checkpoints: CheckpointStore | None = None
+    tracker: WriteTracker | None = None
+    partition_by: str | None = None
+
+    async def save(self, df: pd.DataFrame):
+        await create_insert_table_db_async(df, self.table_name, self.columns_type, self.key_columns,
+                                           self.method, self.pool, self.tracker, self.partition_by)
+
+
+async def fin_reports_writer(page_queue: asyncio.Queue, load: FinReportsLoad):
+    """Забирает страницы из очереди и сразу сохраняет их в БД.
+    После записи страницы отмечает её в чекпоинтах (если они включены).
+    Завершается, получив None, и возвращает количество записанных строк."""
+    saved_rows = 0
+    while True:
+        page = await page_queue.get()
+        try:
+            if page is None:
+                return saved_rows
+            ok = True
+            if page.df is not None:
+                try:
+                    await load.save(page.df)
+                    saved_rows += len(page.df)
+                except Exception as e:
+                    ok = False
+                    logging.error(f"Ошибка записи страницы {page.account} {page.date_from}–{page.date_to}: {e}")
+            if load.checkpoints is not None:
+                await load.checkpoints.page_done(page, ok)
+        except Exception as e:
+            logging.error(f"Ошибка сохранения чекпоинта {page.account} {page.date_from}–{page.date_to}: {e}")
+        finally:
+            page_queue.task_done()
+
+
+async def save_fin_report_period(df: pd.DataFrame, account: str, date_from: str, date_to: str, load: FinReportsLoad):
+    """Пакетный режим: записывает период целиком и после успешной записи сохраняет чекпоинт."""
+    last_rrdid, rows_total = df.attrs.get('last_rrdid', 0), df.attrs.get('rows_total', len(df))
+    completed = df.attrs.get('completed', False)
+    if not df.empty:
+        await load.save(df)
+    if load.checkpoints is not None and (completed or not df.empty):
+        await load.checkpoints.save(account, date_from, date_to, last_rrdid, rows_total, completed)
+
+
+def week_periods(num_weeks: int) -> list:
+    """Список недель (date_from, date_to) от последней закрытой к более ранним."""
     today = datetime.today()
     weekday = today.weekday()
     current_sunday = today - timedelta(days=(weekday + 1) % 7)
-    processed_weeks = 0
-
-    for week in range(num_weeks):
+    periods = []
+    for _ in range(num_weeks):
         current_monday = current_sunday - timedelta(days=6)
-        date_from = current_monday.strftime('%Y-%m-%d')
-        date_to = current_sunday.strftime('%Y-%m-%d')
+        periods.append((current_monday.strftime('%Y-%m-%d'), current_sunday.strftime('%Y-%m-%d')))
+        current_sunday -= timedelta(days=7)
+    return periods
+
+
+async def account_worker(account: str, api_token: str, work_queue: asyncio.Queue, page_queue: asyncio.Queue | None,
+                         save_tasks: list, load: FinReportsLoad, force: bool = False, settle_days: int = 14):
+    """
+    Воркер одного аккаунта: по очереди забирает недели из work_queue и загружает их.
+    В пакетном режиме запись недели запускается фоновой задачей (save_tasks),
+    чтобы воркер сразу перешёл к следующей неделе. Возвращает число обработанных недель.
+
+    С чекпоинтами незаконченная выгрузка продолжается с последнего записанного rrdid,
+    а полностью выгруженные недели старше settle_days дней пропускаются (если не force).
+    Постранично чекпоинт двигается только в потоковом режиме (page_queue): в пакетном
+    он сохраняется после записи всей скачанной части недели.
+    """
+    checkpoints = load.checkpoints
+    processed = 0
+    while True:
+        try:
+            date_from, date_to = work_queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return processed
+        start_rrdid, start_rows = 0, 0
+        if checkpoints is not None and not force:
+            checkpoint = await checkpoints.get(account, date_from, date_to)
+            if checkpoint and checkpoint['completed']:
+                if is_settled(date_to, settle_days):
+                    logging.info(f"⏭ {account} | Неделя {date_from} – {date_to} уже выгружена полностью, пропускаем")
+                    processed += 1
+                    continue
+            elif checkpoint:
+                start_rrdid, start_rows = checkpoint['last_rrdid'], checkpoint['rows_loaded']
+        if checkpoints is not None:
+            checkpoints.reset(account, date_from, date_to)
+
+        try:
+            result = await get_fin_reports_async(account, api_token, date_from, date_to, rate_limiter, page_queue,
+                                                 start_rrdid, start_rows)
+        except Exception as e:
+            logging.error(f"Ошибка при загрузке {account} за {date_from} – {date_to}: {e}")
+            continue
+        if isinstance(result, pd.DataFrame):
+            save_tasks.append(asyncio.create_task(save_fin_report_period(result, account, date_from, date_to, load)))
+        processed += 1
+        logging.info(f"✅ {account} | Неделя {date_from} – {date_to} обработана, осталось {work_queue.qsize()}")
+
+
+async def fetch_all_data(accounts_tokens, num_weeks=1, stream=True, queue_size=4, writers_count=2, load_method='copy',
+                         pool: asyncpg.Pool | None = None, pool_size: int = 5,
+                         resume: bool = True, force: bool = False, settle_days: int = 14,
+                         periods: list | None = None, partition_by: str | None = None) -> WriteTracker:
+    """Загружает отчёты по всем аккаунтам за num_weeks последних недель и сохраняет в БД.
+
+    stream=True (по умолчанию) — постраничная запись: страницы идут через ограниченную очередь
+    (queue_size) к writers_count писателям, поэтому память не растёт с числом аккаунтов
+    и недель, а запись в БД идёт параллельно с паузами между запросами к API.
+    stream=False — пакетный режим: неделя собирается в памяти и записывается целиком.
+    load_method выбирает способ записи: 'copy' (по умолчанию) или 'insert'.
+    Все записи идут через один пул соединений: переданный pool или созданный
+    здесь на pool_size соединений (закрывается по завершении).
+    resume=True включает чекпоинты (fin_reports_checkpoints): прерванные недели
+    докачиваются с последней записанной страницы, а полностью выгруженные недели
+    старше settle_days дней пропускаются. force=True выгружает всё заново.
+    periods — явный список недель (date_from, date_to) вместо num_weeks последних.
+    partition_by — писать в таблицу, секционированную по месяцам этой колонки
+    (FIN_REPORTS_PARTITION_COLUMN); секции создаются по мере загрузки.
+
+    Возвращает WriteTracker: сколько строк записано и какие срезы (account, date_from) затронуты.
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = await create_pool_async(max_size=pool_size)
 
-        logging.info(f"📅 Загружаем неделю {week + 1}/{num_weeks}: {date_from} – {date_to}")
+    try:
+        load = FinReportsLoad(method=load_method, pool=pool, tracker=WriteTracker(), partition_by=partition_by)
+        if resume:
+            load.checkpoints = CheckpointStore(pool)
+            await load.checkpoints.ensure_table()
+
+        page_queue = None
+        writers = []
+        if stream:
+            page_queue = asyncio.Queue(maxsize=queue_size)
+            writers = [asyncio.create_task(fin_reports_writer(page_queue, load)) for _ in range(writers_count)]
+
+        # Очередь работ: все пары (аккаунт, неделя). У каждого аккаунта свой воркер,
+        # который берёт следующую неделю, как только освободится его рейт-лимит,
+        # не дожидаясь остальных аккаунтов.
+        if periods is None:
+            periods = week_periods(num_weeks)
+        work_queues = {}
+        for account in accounts_tokens:
+            work_queues[account] = asyncio.Queue()
+            for period in periods:
+                work_queues[account].put_nowait(period)
+        logging.info(f"📅 Загружаем {len(periods)} недель по {len(accounts_tokens)} аккаунтам: "
+                     f"{periods[-1][0] if periods else ''} – {periods[0][1] if periods else ''}")
 
-        tasks = [
-            get_fin_reports_async(account, token, date_from, date_to, request_lock, next_request_time)
+        save_tasks = []
+        workers = [
+            account_worker(account, token, work_queues[account], page_queue, save_tasks, load, force, settle_days)
             for account, token in accounts_tokens.items()
         ]
-
-        weekly_results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        table_name = 'fin_reports_full'
-        columns_type = {
-            "realizationreport_id": "INTEGER",
-            "date_from": "DATE",
-            "date_to": "DATE",
-            "create_dt": "DATE",
-            "currency_name": "TEXT",
-            "suppliercontract_code": "TEXT",
-            "rrd_id": "BIGINT",
-            "gi_id": "BIGINT",
-            "dlv_prc": "TEXT",
-            "fix_tariff_date_from": "DATE",
-            "fix_tariff_date_to": "DATE",
-            "subject_name": "TEXT",
-            "nm_id": "BIGINT",
-            "brand_name": "TEXT",
-            "sa_name": "TEXT",
-            "ts_name": "TEXT",
-            "barcode": "TEXT",
-            "doc_type_name": "TEXT",
-            "quantity": "INTEGER",
-            "retail_price": "NUMERIC(12,2)",
-            "retail_amount": "NUMERIC(12,2)",
-            "sale_percent": "SMALLINT",
-            "commission_percent": "NUMERIC(5,2)",
-            "office_name": "TEXT",
-            "supplier_oper_name": "TEXT",
-            "order_dt": "TIMESTAMP",
-            "sale_dt": "TIMESTAMP",
-            "rr_dt": "DATE",
-            "shk_id": "BIGINT",
-            "retail_price_withdisc_rub": "NUMERIC(12,2)",
-            "delivery_amount": "INTEGER",
-            "return_amount": "INTEGER",
-            "delivery_rub": "NUMERIC(12,2)",
-            "gi_box_type_name": "TEXT",
-            "product_discount_for_report": "NUMERIC(5,2)",
-            "supplier_promo": "NUMERIC(12,2)",
-            "ppvz_spp_prc": "NUMERIC(5,2)",
-            "ppvz_kvw_prc_base": "NUMERIC(5,2)",
-            "ppvz_kvw_prc": "NUMERIC(5,2)",
-            "sup_rating_prc_up": "NUMERIC(5,2)",
-            "is_kgvp_v2": "BOOLEAN",
-            "ppvz_sales_commission": "NUMERIC(12,2)",
-            "ppvz_for_pay": "NUMERIC(12,2)",
-            "ppvz_reward": "NUMERIC(12,2)",
-            "acquiring_fee": "NUMERIC(12,2)",
-            "acquiring_percent": "NUMERIC(5,2)",
-            "payment_processing": "TEXT",
-            "acquiring_bank": "TEXT",
-            "ppvz_vw": "NUMERIC(12,2)",
-            "ppvz_vw_nds": "NUMERIC(12,2)",
-            "ppvz_office_name": "TEXT",
-            "ppvz_office_id": "INTEGER",
-            "ppvz_supplier_id": "INTEGER",
-            "ppvz_supplier_name": "TEXT",
-            "ppvz_inn": "TEXT",
-            "declaration_number": "TEXT",
-            "bonus_type_name": "TEXT",
-            "sticker_id": "TEXT",
-            "site_country": "TEXT",
-            "srv_dbs": "BOOLEAN",
-            "penalty": "NUMERIC(12,2)",
-            "additional_payment": "NUMERIC(12,2)",
-            "rebill_logistic_cost": "NUMERIC(12,2)",
-            "rebill_logistic_org": "TEXT",
-            "storage_fee": "NUMERIC(12,2)",
-            "deduction": "NUMERIC(12,2)",
-            "acceptance": "NUMERIC(12,2)",
-            "assembly_id": "BIGINT",
-            "srid": "TEXT",
-            "report_type": "SMALLINT",
-            "is_legal_entity": "BOOLEAN",
-            "trbx_id": "TEXT",
-            "installment_cofinancing_amount": "NUMERIC(12,2)",
-            "wibes_wb_discount_percent": "SMALLINT",
-            "cashback_amount": "NUMERIC(12,2)",
-            "cashback_discount": "NUMERIC(12,2)",
-            "account": "VARCHAR(50)",
-            "payment_schedule": 'NUMERIC(10,2)', 
-            "order_uid": "TEXT",
-            "kiz":"TEXT", 
-            "cashback_commission_change" : "INTEGER", 
-            "delivery_method": "TEXT"
-            }
-        key_columns = ['realizationreport_id', 'rrd_id', 'srid']
-
-        save_tasks = []
-        for result in weekly_results:
-            if isinstance(result, Exception):
-                logging.error(f"Ошибка при загрузке недели {week + 1}: {result}")
-                continue
-            if isinstance(result, pd.DataFrame) and not result.empty:
-                save_tasks.append(
-                    create_insert_table_db_async(result, table_name, columns_type, key_columns)
-                )
+        processed = await asyncio.gather(*workers, return_exceptions=True)
 
         if save_tasks:
             await asyncio.gather(*save_tasks, return_exceptions=True)
-        processed_weeks += 1
-        logging.info(f"✅ Завершена обработка недели {week + 1}/{num_weeks}")
-
-        current_sunday -= timedelta(days=7)
 
-    logging.info(f"✅ Все данные сохранены в БД. Обработано {processed_weeks}/{num_weeks} недель")
\ No newline at end of file
+        if stream:
+            # Сигнал писателям о завершении: по одному None на каждого
+            for _ in writers:
+                await page_queue.put(None)
+            saved = await asyncio.gather(*writers)
+            logging.info(f"💾 Потоковая запись завершена: {sum(saved)} строк")
+
+        processed_pairs = sum(p for p in processed if isinstance(p, int))
+        logging.info(f"✅ Все данные сохранены в БД. Обработано {processed_pairs}/{len(periods) * len(accounts_tokens)} пар (аккаунт, неделя)")
+        for table_name, counts in load.tracker.counts.items():
+            logging.info(f"📊 {table_name}: новых {counts['inserted']}, изменённых {counts['updated']}, "
+                         f"без изменений {counts['unchanged']}")
+        return load.tracker
+    finally:
+        if own_pool:
+            await pool.close()
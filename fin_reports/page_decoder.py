@@ -0,0 +1,47 @@
+"""Разбор страницы reportDetailByPeriod из байтов ответа в DataFrame по схеме колонок"""
+import json
+import time
+
+import pandas as pd
+
+try:
+    # orjson разбирает байты в несколько раз быстрее стандартного json
+    import orjson
+    _loads = orjson.loads
+    JSONDecodeError = orjson.JSONDecodeError  # наследник json.JSONDecodeError
+except ImportError:
+    orjson = None
+    _loads = json.loads
+    JSONDecodeError = json.JSONDecodeError
+
+
+def records_to_frame(data: list, columns: list) -> pd.DataFrame:
+    """
+    Собирает DataFrame из списка строк ответа по заранее известному списку
+    колонок: набор ключей не выводится по всем строкам, отсутствующие в строке
+    поля — пропуски, поля вне схемы отбрасываются. Разбор не колоночный —
+    страница по-прежнему проходит через список словарей; выигрыш по сравнению
+    с json.loads(text) даёт в основном orjson по байтам. Замер разбора без
+    приведения типов — benchmarks/bench_fin_decode.py.
+    """
+    return pd.DataFrame(data, columns=columns)
+
+
+class PageDecoder:
+    """
+    Декодер страниц для фиксированной схемы колонок. Возвращает разобранный
+    JSON (список строк или объект ошибки) и время разбора страницы в мс.
+    """
+
+    def __init__(self, columns: list):
+        self.columns = list(columns)
+
+    def loads(self, raw: bytes) -> tuple[object, float]:
+        start = time.perf_counter()
+        data = _loads(raw)
+        return data, (time.perf_counter() - start) * 1000
+
+    def to_frame(self, data: list) -> tuple[pd.DataFrame, float]:
+        start = time.perf_counter()
+        df = records_to_frame(data, self.columns)
+        return df, (time.perf_counter() - start) * 1000
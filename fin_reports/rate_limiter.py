@@ -0,0 +1,97 @@
+"""Рейт-лимитер для API Wildberries: отдельный token bucket на каждый аккаунт и эндпоинт"""
+import asyncio
+import logging
+import os
+import sys
+import time
+
+
+# Добавляем в sys.path корень проекта (где лежит wb_rate_headers.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wb_rate_headers import retry_after_from_headers
+
+
+class TokenBucket:
+    """
+    Token bucket для одного ключа (аккаунт + эндпоинт).
+
+    Реализован через «теоретическое время прихода» (GCRA): вместо счётчика
+    токенов храним момент, когда освободится следующий слот. Слот резервируется
+    под коротким локом, а ожидание идёт уже без него — поэтому ожидающая
+    корутина никого не блокирует.
+
+    :param interval: минимальный интервал между запросами в секундах
+    :param capacity: размер всплеска (сколько запросов можно сделать подряд)
+    """
+
+    def __init__(self, interval: float, capacity: int = 1):
+        self.interval = interval
+        self.capacity = capacity
+        # Момент (по time.monotonic), с которого ведётся отсчёт следующего слота
+        self._tat = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        """Ждёт свободный слот и возвращает, сколько секунд пришлось ждать."""
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._tat - (self.capacity - 1) * self.interval)
+            self._tat = max(self._tat, now) + self.interval
+        wait = slot - now
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return max(wait, 0.0)
+
+    def penalize(self, seconds: float):
+        """Запрещает запросы по ключу ближайшие seconds секунд (например, после 429)."""
+        self._tat = max(self._tat, time.monotonic() + seconds)
+
+    @property
+    def delay(self) -> float:
+        """Сколько секунд осталось до следующего свободного слота."""
+        return max(self._tat - (self.capacity - 1) * self.interval - time.monotonic(), 0.0)
+
+
+class RateLimiter:
+    """
+    Реестр token bucket'ов по ключу (account, endpoint).
+    Бакеты независимы: ожидание одного аккаунта не задерживает остальные.
+
+    :param default_interval: интервал между запросами для эндпоинтов без отдельной настройки
+    :param intervals: словарь {endpoint: интервал в секундах}
+    :param capacity: размер всплеска для всех бакетов
+    """
+
+    def __init__(self, default_interval: float = 60, intervals: dict | None = None, capacity: int = 1):
+        self.default_interval = default_interval
+        self.intervals = intervals or {}
+        self.capacity = capacity
+        self._buckets = {}
+
+    def bucket(self, account: str, endpoint: str) -> TokenBucket:
+        key = (account, endpoint)
+        if key not in self._buckets:
+            interval = self.intervals.get(endpoint, self.default_interval)
+            self._buckets[key] = TokenBucket(interval, self.capacity)
+        return self._buckets[key]
+
+    async def acquire(self, account: str, endpoint: str) -> float:
+        wait = self.bucket(account, endpoint).delay
+        if wait > 0:
+            logging.warning(f"[{account}] Ждём {wait:.1f} сек до следующего запроса")
+        return await self.bucket(account, endpoint).acquire()
+
+    def penalize(self, account: str, endpoint: str, seconds: float):
+        self.bucket(account, endpoint).penalize(seconds)
+
+    def update_from_headers(self, account: str, endpoint: str, headers, default: float | None = None) -> float | None:
+        """
+        Учитывает заголовки ответа WB. Если сервер не прислал время ожидания,
+        используется default (если задан). Возвращает применённую задержку.
+        """
+        seconds = retry_after_from_headers(headers)
+        if seconds is None:
+            seconds = default
+        if seconds is not None:
+            self.penalize(account, endpoint, seconds)
+        return seconds
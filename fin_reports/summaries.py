@@ -0,0 +1,184 @@
+"""Инкрементальное обслуживание материализованных представлений по fin_reports_full
+
+REFRESH MATERIALIZED VIEW пересчитывает всю историю, сколько бы строк ни пришло.
+Представление из MV_DEPENDENCIES, которое строится только из fin_reports_full,
+можно один раз перевести на инкрементальное обслуживание (switch_to_summary):
+    public.penalties_mv             — обычное представление SELECT * FROM penalties_summary,
+                                      читатели продолжают обращаться к нему по прежнему имени;
+    public.penalties_summary        — таблица с колонками представления, в ней
+                                      пересчитываются только затронутые срезы;
+    public.penalties_mv_definition  — исходное материализованное представление,
+                                      опустошённое (WITH NO DATA): хранит запрос
+                                      (pg_matviews.definition) и зависимость от fin_reports_full.
+Формулы остаются в определении представления и в коде не дублируются. Каждый
+запуск удаляет из таблицы срезы (account, date_from), в которые писал загрузчик,
+и вставляет их заново из определения в одной транзакции.
+
+Допущение: каждая строка представления зависит только от строк fin_reports_full
+своего среза (account, date_from) — оба поля есть в выходе и в группировке.
+Представления без этих колонок и представления, на которых построены другие
+объекты, не переводятся (с предупреждением) и обновляются REFRESH, как раньше.
+Права на прежнее материализованное представление не переносятся на новое.
+Обратный перевод — вручную: DROP VIEW, переименовать *_mv_definition обратно и REFRESH.
+"""
+import logging
+import time
+
+import asyncpg
+
+from mv_refresher import MV_DEPENDENCIES
+
+
+SOURCE_TABLE = 'fin_reports_full'
+SLICE_COLUMNS = ('account', 'date_from')
+
+# Фильтр по срезам поверх результата определения представления. Пары (account, date_from) передаются
+# двумя массивами; account и date_from — ключи группировки, поэтому планировщик опускает условие
+# внутрь запроса до fin_reports_full, а отдельное условие по date_from отсекает лишние секции
+SLICE_FILTER = ("d.date_from = ANY($2::date[]) "
+                "AND (d.account, d.date_from) IN (SELECT * FROM unnest($1::text[], $2::date[]))")
+
+
+def summary_table_name(view: str) -> str:
+    """public.penalties_mv -> public.penalties_summary"""
+    schema, _, name = view.rpartition('.')
+    name = name[:-len('_mv')] if name.endswith('_mv') else name
+    return f"{schema + '.' if schema else ''}{name}_summary"
+
+
+def definition_view_name(view: str) -> str:
+    """public.penalties_mv -> public.penalties_mv_definition"""
+    return f"{view}_definition"
+
+
+def summary_views(dependencies: dict = MV_DEPENDENCIES) -> list:
+    """Представления, которые строятся только из fin_reports_full."""
+    return sorted(mv for mv, sources in dependencies.items() if sources == {SOURCE_TABLE})
+
+
+async def relation_kind(conn: asyncpg.Connection, relation: str) -> str | None:
+    """'m' — материализованное представление, 'v' — представление, 'r' — таблица; None — её нет."""
+    return await conn.fetchval("SELECT relkind::text FROM pg_class WHERE oid = to_regclass($1)", relation)
+
+
+async def relation_columns(conn: asyncpg.Connection, relation: str) -> list:
+    """Колонки таблицы или представления в порядке объявления; [] — если её нет."""
+    rows = await conn.fetch("""
+        SELECT a.attname
+        FROM pg_attribute a
+        WHERE a.attrelid = to_regclass($1) AND a.attnum > 0 AND NOT a.attisdropped
+        ORDER BY a.attnum
+    """, relation)
+    return [row['attname'] for row in rows]
+
+
+async def has_dependents(conn: asyncpg.Connection, relation: str) -> bool:
+    """Построены ли на relation другие представления."""
+    return await conn.fetchval("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_depend d
+            JOIN pg_rewrite r ON r.oid = d.objid AND d.classid = 'pg_rewrite'::regclass
+            WHERE d.refobjid = to_regclass($1) AND r.ev_class <> d.refobjid
+        )
+    """, relation)
+
+
+async def view_definition(conn: asyncpg.Connection, view: str) -> str | None:
+    schema, _, name = view.rpartition('.')
+    definition = await conn.fetchval("""
+        SELECT definition FROM pg_matviews
+        WHERE schemaname = COALESCE(NULLIF($1, ''), 'public') AND matviewname = $2
+    """, schema, name)
+    # pg_get_viewdef заканчивает запрос точкой с запятой — в подзапросе она не нужна
+    return definition.strip().rstrip(';') if definition else None
+
+
+async def build_summary_table(conn: asyncpg.Connection, view: str, definition_view: str):
+    """Создаёт таблицу с колонками definition_view и заполняет её целиком (внутри транзакции вызывающего)."""
+    table_name = summary_table_name(view)
+    definition = await view_definition(conn, definition_view)
+    await conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+    await conn.execute(f"CREATE TABLE {table_name} AS SELECT d.* FROM ({definition}) d WITH NO DATA")
+    index_name = f"idx_{table_name.rpartition('.')[2]}_slice"
+    await conn.execute(f"CREATE INDEX {index_name} ON {table_name} ({', '.join(SLICE_COLUMNS)})")
+    await conn.execute(f"INSERT INTO {table_name} SELECT d.* FROM ({definition}) d")
+
+
+async def switch_to_summary(conn: asyncpg.Connection, view: str) -> bool:
+    """
+    Переводит материализованное представление view на инкрементальное обслуживание
+    (см. описание модуля). Всё в одной транзакции: читатели видят либо прежнее
+    представление, либо новое, заполненное целиком. Возвращает True, если перевод выполнен.
+    """
+    columns = await relation_columns(conn, view)
+    if not set(SLICE_COLUMNS) <= set(columns):
+        logging.warning(f"⚠️ В {view} нет колонок {', '.join(SLICE_COLUMNS)} — "
+                        f"инкрементальный пересчёт невозможен, остаётся REFRESH")
+        return False
+    if await has_dependents(conn, view):
+        logging.warning(f"⚠️ На {view} построены другие представления — перевод не выполняется, остаётся REFRESH")
+        return False
+
+    definition_view = definition_view_name(view)
+    table_name = summary_table_name(view)
+    start = time.perf_counter()
+    async with conn.transaction():
+        await conn.execute(f"ALTER MATERIALIZED VIEW {view} RENAME TO {definition_view.rpartition('.')[2]}")
+        await build_summary_table(conn, view, definition_view)
+        # Данные исходного представления больше не нужны — остаются запрос и зависимости
+        await conn.execute(f"REFRESH MATERIALIZED VIEW {definition_view} WITH NO DATA")
+        await conn.execute(f"CREATE VIEW {view} AS SELECT * FROM {table_name}")
+    logging.info(f"🧮 {view} переведено на {table_name}: заполнена за {time.perf_counter() - start:.1f} сек")
+    return True
+
+
+async def refresh_summary_table(conn: asyncpg.Connection, view: str, slices: set):
+    """Пересчитывает в таблице переведённого представления view только срезы (account, date_from)."""
+    definition_view = definition_view_name(view)
+    table_name = summary_table_name(view)
+    start = time.perf_counter()
+    if await relation_columns(conn, table_name) != await relation_columns(conn, definition_view):
+        # Определение поменяли — таблицу и представление над ней собираем заново
+        logging.warning(f"⚠️ Колонки {definition_view} изменились — {table_name} пересобирается")
+        async with conn.transaction():
+            await conn.execute(f"DROP VIEW {view}")
+            await build_summary_table(conn, view, definition_view)
+            await conn.execute(f"CREATE VIEW {view} AS SELECT * FROM {table_name}")
+        logging.info(f"🧮 {table_name}: заполнена целиком за {time.perf_counter() - start:.1f} сек")
+        return
+    if not slices:
+        return
+
+    definition = await view_definition(conn, definition_view)
+    accounts = [account for account, _ in slices]
+    dates = [date_from for _, date_from in slices]
+    async with conn.transaction():
+        await conn.execute(f"""
+            DELETE FROM {table_name}
+            WHERE (account, date_from) IN (SELECT * FROM unnest($1::text[], $2::date[]))
+        """, accounts, dates)
+        await conn.execute(f"INSERT INTO {table_name} SELECT d.* FROM ({definition}) d WHERE {SLICE_FILTER}",
+                           accounts, dates)
+    logging.info(f"🔁 {table_name}: пересчитано {len(slices)} срезов за {time.perf_counter() - start:.1f} сек")
+
+
+async def refresh_summaries_async(pool: asyncpg.Pool, slices: set, switch: bool = False,
+                                  views: list | None = None) -> set:
+    """
+    Пересчитывает затронутые срезы (см. WriteTracker.slices) во всех переведённых
+    представлениях; switch=True — сначала переводит ещё не переведённые.
+    Возвращает представления, которые обслуживаются инкрементально: REFRESH для них
+    не нужен (и невозможен — это уже обычные представления).
+    """
+    maintained = set()
+    for view in views or summary_views():
+        async with pool.acquire() as conn:
+            kind = await relation_kind(conn, view)
+            if kind == 'v' and await relation_kind(conn, definition_view_name(view)) == 'm':
+                await refresh_summary_table(conn, view, slices)
+                maintained.add(view)
+            elif kind == 'm' and switch and await switch_to_summary(conn, view):
+                maintained.add(view)
+    if not slices:
+        logging.info("Нет затронутых срезов — сводные таблицы не пересчитываются")
+    return maintained
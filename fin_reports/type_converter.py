@@ -0,0 +1,140 @@
+"""Векторное приведение колонок DataFrame к типам БД по схеме columns_type"""
+import numpy as np
+import pandas as pd
+
+
+INTEGER_TYPES = ('INTEGER', 'BIGINT', 'SMALLINT')
+FLOAT_TYPES = ('NUMERIC',)
+DATE_TYPES = ('DATE',)
+TIMESTAMP_TYPES = ('TIMESTAMP',)
+BOOL_TYPES = ('BOOLEAN',)
+TEXT_TYPES = ('TEXT', 'VARCHAR')
+
+
+def base_type(dtype: str) -> str:
+    """'NUMERIC(12,2)' -> 'NUMERIC'"""
+    return dtype.split('(')[0].strip().upper()
+
+
+def _to_datetime(s: pd.Series) -> pd.Series:
+    values = pd.to_datetime(s, errors='coerce')
+    if isinstance(values.dtype, pd.DatetimeTZDtype):
+        values = values.dt.tz_localize(None)
+    return values
+
+
+def _convert_integer(s: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    values = pd.to_numeric(s, errors='coerce')
+    mask = values.isna().to_numpy()
+    if values.dtype.kind in 'iu':
+        return values.to_numpy().astype(object), mask
+    floats = values.to_numpy(dtype='float64', na_value=0.0)
+    return np.rint(np.where(mask, 0.0, floats)).astype('int64').astype(object), mask
+
+
+def _convert_float(s: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    values = pd.to_numeric(s, errors='coerce')
+    return values.to_numpy(dtype='float64', na_value=np.nan).astype(object), values.isna().to_numpy()
+
+
+def _convert_date(s: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    values = _to_datetime(s)
+    return values.dt.date.to_numpy(dtype=object), values.isna().to_numpy()
+
+
+def _convert_timestamp(s: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    values = _to_datetime(s)
+    return np.asarray(values.array.to_pydatetime(), dtype=object), values.isna().to_numpy()
+
+
+def _convert_bool(s: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    mask = s.isna().to_numpy()
+    values = np.where(mask, False, s.to_numpy(dtype=object))
+    return values.astype(bool).astype(object), mask
+
+
+def _convert_text(s: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    mask = s.isna().to_numpy()
+    # Ответ API почти всегда уже содержит строки — тогда str() по ячейкам не нужен
+    if pd.api.types.infer_dtype(s, skipna=True) in ('string', 'empty'):
+        return s.to_numpy(dtype=object), mask
+    return s.astype(str).to_numpy(dtype=object), mask
+
+
+_CONVERTERS = {}
+for _types, _func in ((INTEGER_TYPES, _convert_integer), (FLOAT_TYPES, _convert_float),
+                      (DATE_TYPES, _convert_date), (TIMESTAMP_TYPES, _convert_timestamp),
+                      (BOOL_TYPES, _convert_bool), (TEXT_TYPES, _convert_text)):
+    for _type in _types:
+        _CONVERTERS[_type] = _func
+
+
+class TypeConverter:
+    """
+    Конвертер, собранный один раз из схемы {колонка: тип БД}.
+
+    Каждая колонка обрабатывается целиком средствами numpy/pandas: значения
+    приводятся к нужному python-типу (int, float, date, datetime, bool, str),
+    а пропуски по единой маске заменяются на None. Результат можно сразу
+    отдавать в asyncpg (executemany или COPY).
+    """
+
+    def __init__(self, columns_type: dict):
+        self.columns_type = columns_type
+        self._converters = {}
+        for col, dtype in columns_type.items():
+            if not dtype.strip():
+                raise ValueError(f"Пустой тип данных для колонки {col}")
+            converter = _CONVERTERS.get(base_type(dtype))
+            if converter is None:
+                raise ValueError(f"Недопустимый тип данных для колонки {col}: {dtype}")
+            self._converters[col] = converter
+
+    def convert_column(self, col: str, s: pd.Series) -> np.ndarray:
+        """Возвращает object-массив значений колонки с None вместо пропусков."""
+        values, mask = self._converters[col](s)
+        if mask.any():
+            if not values.flags.writeable:
+                values = values.copy()
+            values[mask] = None
+        return values
+
+    def convert(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Приводит колонки схемы, присутствующие в df. Остальные колонки не меняются."""
+        converted_cols = [col for col in df.columns if col in self._converters]
+        # Собираем сконвертированные колонки одним object-блоком вместо присваивания по одной
+        result = pd.DataFrame(
+            {col: self.convert_column(col, df[col]) for col in converted_cols},
+            index=df.index, dtype='object'
+        )
+        if len(converted_cols) < len(df.columns):
+            other_cols = [col for col in df.columns if col not in self._converters]
+            result = pd.concat([result, df[other_cols]], axis=1)[list(df.columns)]
+        return result
+
+    def to_records(self, df: pd.DataFrame, columns: list | None = None):
+        """Итератор кортежей по колонкам columns (по умолчанию — вся схема), см. frame_to_records."""
+        return frame_to_records(df, columns or list(self.columns_type))
+
+
+def frame_to_records(df: pd.DataFrame, columns: list):
+    """
+    Итератор кортежей для вставки в БД (executemany или copy_records_to_table).
+    Пропуски (NaN/NaT) заменяются на None целиком по колонке, отсутствующие колонки — None.
+    """
+    arrays = []
+    for col in columns:
+        if col not in df.columns:
+            arrays.append(np.full(len(df), None, dtype=object))
+            continue
+        values = df[col].to_numpy(dtype=object)
+        mask = pd.isna(values)
+        if mask.any():
+            values = values.copy()
+            values[mask] = None
+        arrays.append(values)
+    return zip(*arrays)
+
+
+def compile_converter(columns_type: dict) -> TypeConverter:
+    return TypeConverter(columns_type)
@@ -0,0 +1,139 @@
+"""Адаптивное (AIMD) ограничение одновременных запросов к seller-analytics-api по токену и эндпоинту"""
+import asyncio
+import logging
+import os
+import sys
+import time
+
+
+# Добавляем в sys.path корень проекта (где лежит wb_rate_headers.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wb_rate_headers import retry_after_from_headers
+
+
+class AimdSlot:
+    """Один выполняемый запрос: помнит, когда он начался, и передаёт результат контроллеру."""
+
+    def __init__(self, controller: 'AimdController'):
+        self.controller = controller
+        self.started = 0.0
+
+    async def __aenter__(self):
+        self.started = await self.controller.acquire()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.controller.release()
+        return False
+
+    def feedback(self, status: int, headers):
+        self.controller.feedback(self.started, status, headers)
+
+
+class AimdController:
+    """
+    Лимит одновременных запросов для одного ключа (токен + эндпоинт) по схеме AIMD:
+    каждый успешный ответ увеличивает лимит на increase / limit (то есть примерно
+    на increase за «окно» из limit запросов), а 429 умножает его на decrease.
+    После 429 запросы по ключу приостанавливаются на время из заголовков
+    (X-Ratelimit-Retry, Retry-After) или на backoff секунд. Если в успешном ответе
+    X-Ratelimit-Remaining = 0, пауза до X-Ratelimit-Reset берётся заранее.
+
+    Одна волна 429 уменьшает лимит один раз: ответы на запросы, отправленные
+    до последнего уменьшения, лимит повторно не режут.
+    """
+
+    def __init__(self, name: str, initial: float = 1, minimum: float = 1, maximum: float = 8,
+                 increase: float = 1, decrease: float = 0.5, backoff: float = 20):
+        self.name = name
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.backoff = backoff
+        self.in_flight = 0
+        self.throttled = 0
+        # Момент (по time.monotonic), до которого новые запросы по ключу не отправляются
+        self.blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = None
+        self._loop = None
+
+    def slot(self) -> AimdSlot:
+        return AimdSlot(self)
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Контроллер переживает asyncio.run (месячная и дневная воронка в одном процессе),
+        # а примитивы asyncio привязаны к циклу событий — пересоздаём их для нового цикла
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._condition = asyncio.Condition()
+            self.in_flight = 0
+        return self._condition
+
+    async def acquire(self) -> float:
+        """Ждёт, пока истечёт пауза и освободится место в лимите; возвращает момент начала запроса."""
+        while True:
+            condition = self._get_condition()
+            async with condition:
+                wait = self.blocked_until - time.monotonic()
+                if wait <= 0:
+                    if self.in_flight < int(self.limit):
+                        self.in_flight += 1
+                        return time.monotonic()
+                    await condition.wait()
+                    continue
+            await asyncio.sleep(wait)
+
+    async def release(self):
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    def feedback(self, started: float, status: int, headers):
+        now = time.monotonic()
+        previous = int(self.limit)
+        retry_after = retry_after_from_headers(headers)
+        if status == 429:
+            self.throttled += 1
+            self.blocked_until = max(self.blocked_until, now + (retry_after if retry_after is not None else self.backoff))
+            if started >= self._last_decrease:
+                self.limit = max(self.minimum, self.limit * self.decrease)
+                self._last_decrease = now
+        elif 200 <= status < 300:
+            self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+            if retry_after is not None:
+                # Квота исчерпана, но запрос прошёл — ждём сброса, не уменьшая лимит
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+        if int(self.limit) != previous:
+            logging.info(f"🎚️ {self.name}: лимит одновременных запросов {previous} → {int(self.limit)}")
+
+
+class AimdLimiter:
+    """
+    Реестр AIMD-контроллеров по ключу (account, endpoint). Один экземпляр на процесс
+    используется и помесячной, и ежедневной воронкой, поэтому подобранный лимит
+    сохраняется между запусками в одном процессе.
+
+    Ограничение: состояние живёт в памяти процесса. funnel_month.py и funnel_daily.py
+    запускаются отдельными процессами и лимит с паузами после 429 не делят — если
+    они идут одновременно, каждый подбирает свой лимит, и одновременных запросов
+    по токену может быть вдвое больше maximum. Лимит общий, только когда обе
+    воронки запускаются в одном процессе (последовательными asyncio.run).
+    """
+
+    def __init__(self, **controller_options):
+        self.controller_options = controller_options
+        self._controllers = {}
+
+    def controller(self, account: str, endpoint: str) -> AimdController:
+        key = (account, endpoint)
+        if key not in self._controllers:
+            self._controllers[key] = AimdController(f"{account}/{endpoint}", **self.controller_options)
+        return self._controllers[key]
+
+    def slot(self, account: str, endpoint: str) -> AimdSlot:
+        return self.controller(account, endpoint).slot()
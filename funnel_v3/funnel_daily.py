@@ -1,5 +1,15 @@
+import argparse
 import asyncio
-from utils_my_funnel import main_funnel_daily
+from utils_my_funnel import main_funnel_daily, FUNNEL_DAILY_DAYS, FUNNEL_DAILY_SETTLE_DAYS
+from wb_archive import add_archive_arguments, configure_archive
 
 if __name__ == "__main__":
-    asyncio.run(main_funnel_daily())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Ежедневная воронка продаж WB")
+    parser.add_argument('--full', action='store_true',
+                        help=f"загрузить все {FUNNEL_DAILY_DAYS} дней (например, раз в неделю)")
+    parser.add_argument('--settle-days', type=int, default=FUNNEL_DAILY_SETTLE_DAYS,
+                        help="сколько последних дней перезагружать при каждом запуске")
+    add_archive_arguments(parser)
+    args = parser.parse_args()
+    configure_archive(args.archive_mode, args.archive_dir)
+    asyncio.run(main_funnel_daily(full=args.full, settle_days=args.settle_days))
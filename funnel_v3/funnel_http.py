@@ -0,0 +1,64 @@
+"""Общая HTTP-сессия для запросов воронки продаж (seller-analytics-api)"""
+import logging
+
+import aiohttp
+
+from aimd_limiter import AimdLimiter, AimdSlot
+
+
+# Всего одновременных соединений и соединений к одному хосту
+FUNNEL_CONNECTIONS_LIMIT = 20
+FUNNEL_CONNECTIONS_PER_HOST = 10
+# Верхняя граница одновременных запросов одного аккаунта (токена); рабочий
+# лимит подбирается адаптивно (AIMD) по ответам API, начиная с одного запроса
+FUNNEL_ACCOUNT_CONCURRENCY = 6
+FUNNEL_REQUEST_TIMEOUT = 120
+
+# Реестр лимитов по (аккаунт, эндпоинт): общий для помесячной и ежедневной воронки
+# только внутри одного процесса (см. ограничение в AimdLimiter)
+funnel_limiter = AimdLimiter(maximum=FUNNEL_ACCOUNT_CONCURRENCY, backoff=20)
+
+
+class FunnelSession:
+    """
+    Одна aiohttp-сессия с пулом соединений на весь запуск воронки (все месяцы
+    или дни и все аккаунты) и общий адаптивный лимит запросов по аккаунтам.
+
+    Соединения к API переиспользуются (без TLS-рукопожатия на каждую задачу),
+    а слот аккаунта (AIMD-контроллер) ограничивает число одновременных запросов
+    по токену во всех задачах сразу. Токен передаётся в заголовке каждого запроса.
+
+    Использование:
+        async with FunnelSession() as http:
+            async with http.account_slot(account, endpoint) as slot:
+                async with http.session.post(url, json=payload, headers=http.headers(token)) as res:
+                    slot.feedback(res.status, res.headers)
+    """
+
+    def __init__(self, limit: int = FUNNEL_CONNECTIONS_LIMIT, limit_per_host: int = FUNNEL_CONNECTIONS_PER_HOST,
+                 limiter: AimdLimiter = funnel_limiter, timeout: float = FUNNEL_REQUEST_TIMEOUT):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.limiter = limiter
+        self.timeout = timeout
+        self.session: aiohttp.ClientSession | None = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host, ttl_dns_cache=300)
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout))
+        logging.info(f"🔌 Сессия воронки: до {self.limit} соединений ({self.limit_per_host} на хост)")
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+        self.session = None
+        return False
+
+    def account_slot(self, account: str, endpoint: str) -> AimdSlot:
+        """Слот запроса по аккаунту и эндпоинту; результат ответа передаётся через slot.feedback."""
+        return self.limiter.slot(account, endpoint)
+
+    @staticmethod
+    def headers(api_token: str) -> dict:
+        return {"Authorization": api_token}
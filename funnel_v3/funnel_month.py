@@ -1,5 +1,13 @@
+import argparse
 import asyncio
 from utils_my_funnel import main_funnel
+from wb_archive import add_archive_arguments, configure_archive
 
 if __name__ == "__main__":
-    asyncio.run(main_funnel())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Помесячная воронка продаж WB")
+    parser.add_argument('--full', action='store_true',
+                        help="загрузить все 13 месяцев, а не только открытые и неокончательные")
+    add_archive_arguments(parser)
+    args = parser.parse_args()
+    configure_archive(args.archive_mode, args.archive_dir)
+    asyncio.run(main_funnel(full=args.full))
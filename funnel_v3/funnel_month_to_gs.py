@@ -1,4 +1,10 @@
+import argparse
 from utils_my_funnel import funnel_month_to_gs
 
 if __name__ == "__main__":
-    funnel_month_to_gs()
+    parser = argparse.ArgumentParser(description="Выгрузка помесячной воронки в гугл-таблицу")
+    parser.add_argument('--full', action='store_true',
+                        help="пересобрать funnel_monthly_rollup по всей funnel_daily перед выгрузкой "
+                             "(после ручных записей в funnel_daily)")
+    args = parser.parse_args()
+    funnel_month_to_gs(full=args.full)
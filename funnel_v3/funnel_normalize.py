@@ -0,0 +1,144 @@
+"""Разворот товаров ответа sales-funnel/products в типизированный колоночный DataFrame и отбор строк воронки"""
+import numpy as np
+import pandas as pd
+
+
+# Поля API -> колонки DataFrame по разделам товара: product — карточка,
+# product.stocks — остатки, statistic.selected — метрики за выбранный период
+PRODUCT_FIELDS = {
+    'nmId': 'nm_id',
+    'vendorCode': 'vendor_code',
+    'title': 'title',
+    'subjectId': 'subject_id',
+    'subjectName': 'subject_name',
+    'brandName': 'brand_name',
+    'productRating': 'product_rating',
+    'feedbackRating': 'feedback_rating',
+}
+STOCKS_FIELDS = {
+    'wb': 'stocks_wb',
+    'mp': 'stocks_mp',
+    'balanceSum': 'balance_sum',
+}
+SELECTED_FIELDS = {
+    'openCount': 'open_count',
+    'cartCount': 'cart_count',
+    'orderCount': 'order_count',
+    'orderSum': 'orders_sum',
+    'buyoutCount': 'buyout_count',
+    'buyoutSum': 'buyout_sum',
+    'cancelCount': 'cancel_count',
+    'cancelSum': 'cancel_sum',
+    'avgPrice': 'avg_price',
+    'avgOrdersCountPerDay': 'avg_orders_count_per_day',
+    'shareOrderPercent': 'share_order_percent',
+    'addToWishlist': 'add_to_wish_list',
+    'localizationPercent': 'localization_percent',
+}
+# Порядок колонок результата (как в FUNNEL_COLUMNS_TYPE)
+FUNNEL_FRAME_COLUMNS = (
+    ['account'] + list(PRODUCT_FIELDS.values()) + list(STOCKS_FIELDS.values())
+    + [col for col in SELECTED_FIELDS.values() if col != 'localization_percent']
+    + ['time_to_ready', 'localization_percent', 'date', 'month', 'wild']
+)
+
+# Целочисленные колонки: nullable Int64, чтобы пропуски не превращали их в float
+FUNNEL_INT_COLUMNS = (
+    'nm_id', 'subject_id', 'stocks_wb', 'stocks_mp', 'balance_sum', 'open_count', 'cart_count',
+    'order_count', 'orders_sum', 'buyout_count', 'buyout_sum', 'cancel_count', 'cancel_sum',
+    'add_to_wish_list', 'time_to_ready',
+)
+FUNNEL_TEXT_COLUMNS = ('account', 'vendor_code', 'title', 'subject_name', 'brand_name', 'date')
+FUNNEL_FLOAT_COLUMNS = (
+    'product_rating', 'feedback_rating', 'avg_price', 'avg_orders_count_per_day', 'share_order_percent',
+    'localization_percent',
+)
+
+
+def _section(items: list, fields: dict) -> pd.DataFrame:
+    """
+    Раздел товара в колонки: pandas раскладывает словари по заданным полям
+    в C-коде одним проходом и сам выводит int64/float64 там, где нет пропусков.
+    """
+    return pd.DataFrame(items, columns=list(fields)).rename(columns=fields)
+
+
+def _as_int(column: pd.Series) -> pd.Series:
+    if pd.api.types.is_integer_dtype(column):
+        return column.astype('Int64')
+    # Пропуски или значения не того типа: приводим через числа, не теряя строки
+    return pd.to_numeric(column, errors='coerce').round().astype('Int64')
+
+
+def _as_float(column: pd.Series) -> pd.Series:
+    if pd.api.types.is_float_dtype(column) or pd.api.types.is_integer_dtype(column):
+        return column.astype('float64')
+    return pd.to_numeric(column, errors='coerce').astype('float64')
+
+
+def normalize_funnel_products(products: list) -> pd.DataFrame:
+    """
+    Разворачивает товары из ответа sales-funnel/products (с полем account)
+    в плоский DataFrame воронки с колонками month и wild. Общий шаг для
+    помесячной и ежедневной воронки.
+
+    Каждый вложенный раздел (product, product.stocks, statistic.selected)
+    раскладывается в колонки одним конструктором DataFrame, после чего колонки
+    получают типы: целые — Int64, дробные — float64, date — строка 'YYYY-MM-DD'
+    (как в ответе). month ('MM-YYYY') строится срезом строки даты, wild — одним
+    векторным str.extract.
+    """
+    if not products:
+        return pd.DataFrame()
+
+    product_items = [p.get('product') or {} for p in products]
+    selected_items = [(p.get('statistic') or {}).get('selected') or {} for p in products]
+
+    product = _section(product_items, PRODUCT_FIELDS)
+    stocks = _section([info.get('stocks') or {} for info in product_items], STOCKS_FIELDS)
+    selected = _section(selected_items, SELECTED_FIELDS)
+
+    df = pd.concat([product, stocks, selected], axis=1)
+    df['account'] = [p.get('account') for p in products]
+    # timeToReady {days, hours, mins} -> минуты
+    ready = _section([s.get('timeToReady') or {} for s in selected_items], {'days': 'days', 'hours': 'hours', 'mins': 'mins'})
+    df['time_to_ready'] = (ready['days'].fillna(0) * 24 * 60 + ready['hours'].fillna(0) * 60 + ready['mins'].fillna(0))
+    df['date'] = [(s.get('period') or {}).get('end') for s in selected_items]
+
+    for column in FUNNEL_INT_COLUMNS:
+        df[column] = _as_int(df[column])
+    for column in FUNNEL_FLOAT_COLUMNS:
+        df[column] = _as_float(df[column])
+    for column in FUNNEL_TEXT_COLUMNS:
+        # Поле, которого нет ни в одном товаре, приходит как float NaN — строковые операции на нём не работают
+        if not pd.api.types.is_string_dtype(df[column]):
+            df[column] = df[column].astype('object')
+
+    # Дата в ответе — 'YYYY-MM-DD' (иногда с временем): месяц 'MM-YYYY' берём срезом строки
+    df['month'] = df['date'].str[5:7] + '-' + df['date'].str[:4]
+    df['wild'] = df['vendor_code'].str.extract(r'(wild\d+)', expand=False)
+    return df[FUNNEL_FRAME_COLUMNS]
+
+
+def dedup_funnel_daily(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Оставляет одну строку ежедневной воронки на пару (nm_id, date): с наибольшим
+    orders_sum, при равенстве — с наибольшим open_count. Колонка date приводится к дате.
+
+    Один проход: стабильная сортировка позиций только по двум метрикам (по убыванию,
+    пропуски в конце) и хэш-удаление повторов ключа с keep='first'. Строки
+    выбираются по позициям, поэтому повторяющиеся метки индекса (после pd.concat)
+    не размножают строки. Полные дубли строк отдельно не удаляются — у них один
+    ключ, и остаётся одна копия.
+    """
+    # Ключ — нормализованная дата (datetime64 хэшируется быстрее строк); в date приводим уже после отбора
+    day = pd.to_datetime(df['date']).dt.normalize().to_numpy()
+    orders_sum = df['orders_sum'].to_numpy(dtype='float64', na_value=np.nan)
+    open_count = df['open_count'].to_numpy(dtype='float64', na_value=np.nan)
+    # lexsort стабилен, сортирует по последнему ключу первым; минус — убывание, NaN остаются в конце
+    order = np.lexsort((-open_count, -orders_sum))
+    keys = pd.DataFrame({'nm_id': df['nm_id'].to_numpy()[order], 'day': day[order]})
+    winners = order[~keys.duplicated(keep='first').to_numpy()]
+    result = df.iloc[winners].copy()
+    result['date'] = pd.Series(day[winners]).dt.date.to_numpy()
+    return result
@@ -0,0 +1,99 @@
+"""Помесячная сводка ежедневной воронки для выгрузки в Google Sheets
+
+funnel_monthly_rollup хранит суммы funnel_daily по (month, wild, account) —
+ровно то, что раньше считалось GROUP BY по всей funnel_daily при каждой
+выгрузке. Ежедневная загрузка пересчитывает только затронутые месяцы, поэтому
+выгрузка читает готовую упорядоченную таблицу и не зависит от объёма истории.
+"""
+import logging
+from datetime import date
+
+from watermarks import month_start
+
+
+DAILY_TABLE = 'funnel_daily'
+ROLLUP_TABLE = 'funnel_monthly_rollup'
+ROLLUP_SUM_COLUMNS = ('open_count', 'cart_count', 'order_count', 'orders_sum', 'buyout_count', 'buyout_sum',
+                      'cancel_count', 'cancel_sum')
+# Колонки сводки в порядке выгрузки на лист
+ROLLUP_COLUMNS = ('month', 'wild', 'account') + ROLLUP_SUM_COLUMNS + ('avg_price',)
+
+
+def ensure_rollup(connection):
+    with connection.cursor() as cursor:
+        sums = ",\n".join(f"{col} NUMERIC" for col in ROLLUP_SUM_COLUMNS)
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+                month TEXT NOT NULL,
+                month_start DATE NOT NULL,
+                wild TEXT,
+                account VARCHAR(255),
+                {sums},
+                avg_price NUMERIC(12,2),
+                refreshed_at TIMESTAMP NOT NULL DEFAULT now()
+            )
+        """)
+        # Порядок выгрузки: индекс отдаёт строки уже отсортированными
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {ROLLUP_TABLE}_order_idx
+            ON {ROLLUP_TABLE} (month, orders_sum DESC, account)
+        """)
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {ROLLUP_TABLE}_month_start_idx ON {ROLLUP_TABLE} (month_start)")
+        # Пересчёт месяца читает funnel_daily по диапазону дат
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {DAILY_TABLE}_date_idx ON {DAILY_TABLE} (date)")
+    connection.commit()
+
+
+def next_month(first_day: date) -> date:
+    return date(first_day.year + (first_day.month == 12), first_day.month % 12 + 1, 1)
+
+
+def refresh_monthly_rollup(connection, days=None):
+    """
+    Пересчитывает сводку за месяцы, в которые попадают days (даты, загруженные
+    в funnel_daily). days=None или пустая сводка — пересборка по всей funnel_daily;
+    пустой набор дней только создаёт сводку, если её ещё нет.
+    Удаление и вставка идут в одной транзакции под advisory-блокировкой,
+    так что выгрузка всегда видит месяц целиком, а параллельные загрузки не
+    задваивают строки.
+    """
+    ensure_rollup(connection)
+    sums = ", ".join(f"SUM({col})" for col in ROLLUP_SUM_COLUMNS)
+    insert_sql = f"""
+        INSERT INTO {ROLLUP_TABLE} (month, month_start, wild, account, {', '.join(ROLLUP_SUM_COLUMNS)}, avg_price)
+        SELECT to_char(date, 'MM-YYYY'), date_trunc('month', date)::date, wild, account, {sums},
+               ROUND(AVG(avg_price), 2)
+        FROM {DAILY_TABLE}
+        {{where}}
+        GROUP BY to_char(date, 'MM-YYYY'), date_trunc('month', date)::date, wild, account
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (ROLLUP_TABLE,))
+            cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {ROLLUP_TABLE})")
+            if days is None or not cursor.fetchone()[0]:
+                cursor.execute(f"DELETE FROM {ROLLUP_TABLE}")
+                cursor.execute(insert_sql.format(where=""))
+                logging.info(f"🧮 {ROLLUP_TABLE}: пересобрана целиком, {cursor.rowcount} строк")
+            else:
+                months = sorted({month_start(day) for day in days})
+                if not months:
+                    connection.commit()
+                    return
+                for first_day in months:
+                    cursor.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE month_start = %s", (first_day,))
+                    cursor.execute(insert_sql.format(where="WHERE date >= %s AND date < %s"),
+                                   (first_day, next_month(first_day)))
+                logging.info(f"🧮 {ROLLUP_TABLE}: пересчитано месяцев {len(months)} "
+                             f"({', '.join(m.strftime('%m-%Y') for m in months)})")
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+
+def rollup_export_query() -> str:
+    """Сводка для листа «БД Воронка месяц» в порядке прежней выгрузки."""
+    return f"""SELECT {', '.join(ROLLUP_COLUMNS)}
+        FROM {ROLLUP_TABLE}
+        ORDER BY month, orders_sum DESC, account;"""
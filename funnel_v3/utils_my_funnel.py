@@ -1,4 +1,5 @@
 import os
+import sys
 import json
 import aiohttp
 import asyncio
@@ -12,12 +13,26 @@ from dotenv import load_dotenv
 from sqlalchemy import create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
 from utils_sql import create_connection, get_db_table
-from gspread_dataframe import set_with_dataframe
 from datetime import datetime
 import os
+# Добавляем в sys.path корень проекта (где лежат wb_archive.py, gs_sync.py и db_sync.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wb_archive import ArchiveMissError, get_archive
+from gs_sync import sync_dataframe
+from db_sync import create_insert_table_db_sync
+from funnel_http import FunnelSession
+from funnel_normalize import dedup_funnel_daily, normalize_funnel_products
+from funnel_rollup import refresh_monthly_rollup, rollup_export_query
+from watermarks import (load_final_days, load_final_months, month_start, previous_month, save_daily_watermarks,
+                        save_month_watermarks)
 
 load_dotenv()
 
+# Базовый URL seller-analytics-api (переопределяется, например, для локального имитатора wb_simulator.py)
+ANALYTICS_API_URL = os.getenv('WB_ANALYTICS_API_URL', 'https://seller-analytics-api.wildberries.ru')
+# Эндпоинт воронки продаж (ключ архива ответов)
+FUNNEL_ENDPOINT = 'sales-funnel-products'
+
 
 # === НАСТРОЙКА ЛОГИРОВАНИЯ ===
 logger = logging.getLogger("funnel_logger")
@@ -45,6 +60,45 @@ if not logger.handlers:
     logger.addHandler(console_handler)
 
 
+# Сколько дней ежедневной воронки (funnel_daily) охватывает полная загрузка
+FUNNEL_DAILY_DAYS = 28
+# Последние дни, которые WB ещё досчитывает: перезагружаются при каждом запуске
+FUNNEL_DAILY_SETTLE_DAYS = 3
+
+# Схема таблиц воронки (funnel_month и funnel_daily)
+FUNNEL_COLUMNS_TYPE = {
+    'account': 'VARCHAR(255)',
+    'nm_id': 'BIGINT',
+    'vendor_code': 'VARCHAR(255)',
+    'title': 'VARCHAR(255)',
+    'subject_id': 'BIGINT',
+    'subject_name': 'VARCHAR(255)',
+    'brand_name': 'VARCHAR(255)',
+    'product_rating': 'NUMERIC(5,2)',
+    'feedback_rating': 'NUMERIC(5,2)',
+    'stocks_wb': 'BIGINT',
+    'stocks_mp': 'BIGINT',
+    'balance_sum': 'BIGINT',
+    'open_count': 'BIGINT',
+    'cart_count': 'BIGINT',
+    'order_count': 'BIGINT',
+    'orders_sum': 'BIGINT',
+    'buyout_count': 'BIGINT',
+    'buyout_sum': 'BIGINT',
+    'cancel_count': 'BIGINT',
+    'cancel_sum': 'BIGINT',
+    'avg_price': 'NUMERIC(12,2)',
+    'avg_orders_count_per_day': 'NUMERIC(10,2)',
+    'share_order_percent': 'NUMERIC(10,2)',
+    'add_to_wish_list': 'BIGINT',
+    'time_to_ready': 'BIGINT',
+    'localization_percent': 'NUMERIC(10,2)',
+    'date': 'DATE',
+    'month': 'TEXT',
+    'wild': 'TEXT'
+}
+
+
 def load_api_tokens():
     # Путь к файлу относительно корня проекта
     tokens_path = os.path.join(os.path.dirname(__file__), 'tokens.json')
@@ -52,18 +106,19 @@ def load_api_tokens():
         return json.load(f)
     
 
-def get_first_and_last_day(month: int):
+def get_first_and_last_day(month: int, year: int | None = None):
     """
     Возвращает первую и последнюю дату месяца по номеру месяца и году.
     
     Args:
-        year (int): Год (например, 2025)
         month (int): Месяц (1–12)
+        year (int): Год (например, 2025), по умолчанию текущий
     
     Returns:
         tuple: (первая_дата, последняя_дата) в формате datetime.date
     """
-    year = datetime.now().year
+    if year is None:
+        year = datetime.now().year
 
     # Первое число месяца
     first_day = datetime(year, month, 1).date()
@@ -119,127 +174,184 @@ def safe_open_spreadsheet(title, retries=5, delay=5):
             else:
                 raise RuntimeError(f"Не удалось открыть таблицу '{title}' после {retries} попыток.")
 
-async def get_funnel_v3(date_start: None, date_end: None, account: str, api_token: str):
-    """Получение статистики по воронке продаж Wildberries"""
+async def get_funnel_v3(date_start: None, date_end: None, account: str, api_token: str, http: FunnelSession,
+                        fetched: dict | None = None):
+    """
+    Получение статистики по воронке продаж Wildberries.
+    Запросы идут через общую сессию http: соединения переиспользуются, а число
+    одновременных запросов по аккаунту подбирает общий AIMD-контроллер — растёт,
+    пока ответы успешные, и уменьшается вдвое на 429 с паузой по заголовкам лимита.
+    Если период выгружен полностью (до последней страницы), в fetched
+    записывается {(account, date_start): число товаров}.
+    """
     products_list = []
-    headers = {"Authorization": api_token}
-    normal_delay = 2
-    retry_delay = 20
-    url = "https://seller-analytics-api.wildberries.ru/api/analytics/v3/sales-funnel/products"
+    url = f"{ANALYTICS_API_URL}/api/analytics/v3/sales-funnel/products"
     start = date_start
     end = date_end
     limit = 1000
     offset = 0
     max_attempts = 30
     attempt = 0
-    semaphore = asyncio.Semaphore(10)
-    
-    async with semaphore:
-        async with aiohttp.ClientSession(headers=headers) as session:
-            while True:
-                payload = {
-                    "selectedPeriod": {
-                        "start": start.strftime("%Y-%m-%d"),
-                        "end": end.strftime("%Y-%m-%d")
-                    },
-                    "limit": limit,
-                    "offset": offset
-                }
-
-                try:
-                    async with session.post(url, json=payload) as res:
-                        if res.status == 200:
-                            data = await res.json()
-                            products = data.get("data", {}).get("products", [])
-
-                            if not products:
-                                logging.info(f"📭 Нет данных для {account}")
-                                break
-
-                            for p in products:
-                                p["account"] = account
-                            products_list.extend(products)
-
-                            logging.info(f"✅ Получено {len(products_list)} товаров ({len(products)} новых) для {account} за период {payload['selectedPeriod']}")
-
-                            if len(products) < limit:
-                                break
-
-                            offset += len(products)
-                            attempt = 0
-                            await asyncio.sleep(normal_delay)
-
-                        elif res.status == 429:
-                            logging.info(f"⚠️ Ошибка 429 для {account}: слишком много запросов, ждем {retry_delay} сек.")
-                            await asyncio.sleep(retry_delay)
-                            retry_delay += 0.1
-                            attempt += 1
-                            if attempt >= max_attempts:
-                                logging.info(f"🚫 Превышено число попыток ({max_attempts}) для {account}")
-                                break
-                            continue
-
-                        elif res.status in (400, 401, 403):
-                            err = await res.json()
-                            logging.info(f"⚠️ Ошибка {res.status} для {account}: {err.get('detail', 'Ошибка доступа')}")
-                            return None
-
-                        else:
-                            logging.info(f"⚠️ Неожиданный статус {res.status} для {account}")
-                            attempt += 1
-                            if attempt >= max_attempts:
-                                break
-
-                except aiohttp.ClientError as err:
-                    logging.info(f"🌐 Сетевая ошибка: {err}")
-                    attempt += 1
-                    if attempt >= max_attempts:
-                        break
-
-                except Exception as e:
-                    logging.info(f"💥 Неожиданная ошибка: {e}")
+    # архив сырых страниц: запись (record) или воспроизведение без HTTP (replay)
+    archive = get_archive()
+    period_key = f"{start.strftime('%Y-%m-%d')}_{end.strftime('%Y-%m-%d')}"
+    completed = False
+
+    while True:
+        payload = {
+            "selectedPeriod": {
+                "start": start.strftime("%Y-%m-%d"),
+                "end": end.strftime("%Y-%m-%d")
+            },
+            "limit": limit,
+            "offset": offset
+        }
+
+        try:
+            # Слот аккаунта занят только на время запроса
+            # (пауза после 429 выдерживается внутри контроллера при получении слота)
+            async with http.account_slot(account, FUNNEL_ENDPOINT) as slot:
+                if archive.replaying:
+                    request = archive.response(FUNNEL_ENDPOINT, account, period_key, offset)
+                else:
+                    request = http.session.post(url, json=payload, headers=http.headers(api_token))
+                async with request as res:
+                    status = res.status
+                    body = await res.read()
+                    if not archive.replaying:
+                        slot.feedback(status, res.headers)
+
+            if status == 200:
+                archive.record(FUNNEL_ENDPOINT, account, period_key, offset, body)
+                data = json.loads(body)
+                products = data.get("data", {}).get("products", [])
+
+                if not products:
+                    logging.info(f"📭 Нет данных для {account}")
+                    completed = True
                     break
 
-        if products_list:
-            logging.info(f"🟢 Завершено получение данных по {account}. Всего товаров: {len(products_list)}")
-            return products_list
-        else:
-            logging.info(f"❌ Не удалось получить данные по воронке продаж для {account}")
-            return None
+                for p in products:
+                    p["account"] = account
+                products_list.extend(products)
+
+                logging.info(f"✅ Получено {len(products_list)} товаров ({len(products)} новых) для {account} за период {payload['selectedPeriod']}")
+
+                if len(products) < limit:
+                    completed = True
+                    break
+
+                offset += len(products)
+                attempt = 0
+
+            elif status == 429:
+                logging.info(f"⚠️ Ошибка 429 для {account}: слишком много запросов, повтор после паузы лимита")
+                attempt += 1
+                if attempt >= max_attempts:
+                    logging.info(f"🚫 Превышено число попыток ({max_attempts}) для {account}")
+                    break
+                continue
+
+            elif status in (400, 401, 403):
+                err = json.loads(body)
+                logging.info(f"⚠️ Ошибка {status} для {account}: {err.get('detail', 'Ошибка доступа')}")
+                return None
+
+            else:
+                logging.info(f"⚠️ Неожиданный статус {status} для {account}")
+                attempt += 1
+                if attempt >= max_attempts:
+                    break
+
+        except ArchiveMissError as e:
+            logging.info(f"🗄️ Страницы нет в архиве: {e}")
+            break
+
+        except aiohttp.ClientError as err:
+            logging.info(f"🌐 Сетевая ошибка: {err}")
+            attempt += 1
+            if attempt >= max_attempts:
+                break
 
-async def fetch_all(date_start: int, date_end: None):
-    # Создаем задачник для получения данных о поставках по всем аккаунтам асинхронно
-    tasks = [get_funnel_v3(date_start, date_end, account, api_token) for account, api_token in load_api_tokens().items()]
+        except Exception as e:
+            logging.info(f"💥 Неожиданная ошибка: {e}")
+            break
+
+    if completed and fetched is not None:
+        fetched[(account, start)] = len(products_list)
+
+    if products_list:
+        logging.info(f"🟢 Завершено получение данных по {account}. Всего товаров: {len(products_list)}")
+        return products_list
+    else:
+        logging.info(f"❌ Не удалось получить данные по воронке продаж для {account}")
+        return None
+
+async def fetch_all(date_start: int, date_end: None, http: FunnelSession, accounts: list | None = None,
+                    fetched: dict | None = None):
+    # Создаем задачник для получения данных о поставках по всем аккаунтам (или только accounts) асинхронно
+    tasks = [get_funnel_v3(date_start, date_end, account, api_token, http, fetched)
+             for account, api_token in load_api_tokens().items() if accounts is None or account in accounts]
     res = await asyncio.gather(*tasks)
     return res
 
 
-async def process_funnel_month():
+def funnel_month_ranges(months_back: int = 12) -> list:
     """
-    Оптимизированная версия: собираем ВСЕ данные в один DataFrame за 3 месяца
+    Периоды (первый день, последний день) текущего месяца и months_back предыдущих,
+    от нового к старому. Текущий месяц — по вчерашний день.
     """
-    # === 1. ПОЛУЧАЕМ ДАТЫ ДЛЯ 12 МЕСЯЦЕВ до текущего ===
-    current_month = datetime.now().month
+    yesterday = (datetime.now() - timedelta(days=1)).date()
+    first_date = month_start(datetime.now().date())
     date_ranges = []
-    for month_num in range(0, 13):
-        year = datetime.now().year
-        month = current_month - month_num
-        if month <= 0:
-            month += 12
-            year -= 1
-        first_date, last_date = get_first_and_last_day(month)
-        if month == current_month:
-            last_date = (datetime.now()-timedelta(days=1)).date()
-        date_ranges.append((first_date, last_date))
-    
-    logging.info(f"📅 Запрашиваем данные за {len(date_ranges)} месяцев...")
-    
-    # === 2. ПАРАЛЛЕЛЬНЫЙ ЗАПРОС ВСЕХ МЕСЯЦЕВ ===
-    tasks = [fetch_all(first, last) for first, last in date_ranges]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
+    for _ in range(months_back + 1):
+        _, last_date = get_first_and_last_day(first_date.month, first_date.year)
+        last_date = min(last_date, yesterday)
+        # 1-го числа в текущем месяце ещё нет полных дней
+        if last_date >= first_date:
+            date_ranges.append((first_date, last_date))
+        first_date = previous_month(first_date)
+    return date_ranges
+
+
+async def process_funnel_month(full: bool = False, final_months: set | None = None):
+    """
+    Собираем данные воронки по месяцам в один DataFrame.
+
+    Текущий и предыдущий месяц (открытое окно) загружаются всегда, более ранние
+    из 13 месяцев — только для аккаунтов, у которых месяц ещё не отмечен
+    окончательным (final_months — пары (account, первый день месяца), см. watermarks).
+    full=True — полная загрузка всех 13 месяцев по всем аккаунтам.
+
+    Возвращает DataFrame и {(account, первый день месяца): число товаров} полностью
+    выгруженных периодов — по ним обновляются водяные знаки.
+    """
+    # === 1. ПОЛУЧАЕМ ДАТЫ ДЛЯ 12 МЕСЯЦЕВ до текущего ===
+    date_ranges = funnel_month_ranges()
+    accounts = list(load_api_tokens())
+    current = month_start(datetime.now().date())
+    open_months = {current, previous_month(current)}
+    final_months = set() if full else (final_months or set())
+
+    plan = []
+    for first, last in date_ranges:
+        month_accounts = [account for account in accounts
+                          if first in open_months or (account, first) not in final_months]
+        if month_accounts:
+            plan.append((first, last, month_accounts))
+    requests_count = sum(len(month_accounts) for _, _, month_accounts in plan)
+    logging.info(f"📅 Запрашиваем данные за {len(plan)} месяцев: {requests_count} из "
+                 f"{len(date_ranges) * len(accounts)} пар (аккаунт, месяц){' — полная загрузка' if full else ''}")
+
+    # === 2. ПАРАЛЛЕЛЬНЫЙ ЗАПРОС ВСЕХ МЕСЯЦЕВ (одна сессия на все месяцы и аккаунты) ===
+    fetched = {}
+    async with FunnelSession() as http:
+        tasks = [fetch_all(first, last, http, month_accounts, fetched) for first, last, month_accounts in plan]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
     for r in results:
         if isinstance(r, Exception):
             logger.error(f"Ошибка при получении данных: {r}")
+    results = [r for r in results if not isinstance(r, Exception)]
     
     logging.info(f"✅ Получено {sum(len(r) for r in results)} записей")
     
@@ -252,224 +364,70 @@ async def process_funnel_month():
     
     logging.info(f"📦 Обработано {len(all_products)} товаров")
     
-    # === 4. ОБРАБОТКА ВСЕХ ДАННЫХ ===
-    rows = []
-    for product in all_products:
-        # Извлекаем данные 
-        prod_info = product.get("product", {})
-        stat = product.get("statistic", {})
-        selected = stat.get("selected", {})
-        time_to_ready = selected.get("timeToReady", {})
-        
-        # Базовая информация
-        row = {
-            "account": product.get("account"),
-            "nm_id": prod_info.get("nmId"),
-            "vendor_code": prod_info.get("vendorCode"),  
-            "title": prod_info.get("title"),
-            "subject_id": prod_info.get("subjectId"),
-            "subject_name": prod_info.get("subjectName"),
-            "brand_name": prod_info.get("brandName"),
-            "product_rating": prod_info.get("productRating"),
-            "feedback_rating": prod_info.get("feedbackRating"),
-            "stocks_wb": prod_info.get("stocks", {}).get("wb"),
-            "stocks_mp": prod_info.get("stocks", {}).get("mp"),
-            "balance_sum": prod_info.get("stocks", {}).get("balanceSum"),
-        }
-        
-        # Метрики selected
-        row.update({
-            "open_count": selected.get("openCount"),
-            "cart_count": selected.get("cartCount"),
-            "order_count": selected.get("orderCount"),
-            "orders_sum": selected.get("orderSum"),
-            "buyout_count": selected.get("buyoutCount"),
-            "buyout_sum": selected.get("buyoutSum"),
-            "cancel_count": selected.get("cancelCount"),
-            "cancel_sum": selected.get("cancelSum"),
-            "avg_price": selected.get("avgPrice"),
-            "avg_orders_count_per_day": selected.get("avgOrdersCountPerDay"),
-            "share_order_percent": selected.get("shareOrderPercent"),
-            "add_to_wish_list": selected.get("addToWishlist"),
-            "time_to_ready": (
-                time_to_ready.get("days", 0) * 24 * 60 +
-                time_to_ready.get("hours", 0) * 60 +
-                time_to_ready.get("mins", 0)
-            ),
-            "localization_percent": selected.get("localizationPercent"),
-            "date": selected.get("period", {}).get("end"),
-        })
-        
-        rows.append(row)
-            
-    # === 5. ОДИН DataFrame ===
-    df_full = pd.DataFrame(rows)
-    
-    # === 6. Создаем новые колонки ===
-    df_full['month'] = pd.to_datetime(df_full['date']).dt.strftime('%m-%Y')
-    df_full['wild'] = df_full['vendor_code'].str.extract(r'(wild\d+)')
-    
-    logging.info(f"⚡ DataFrame создан: {len(df_full)} строк за {len(date_ranges)} месяцев")
-    
-    return df_full
-
-def create_insert_table_db_sync(df: pd.DataFrame, table_name: str, columns_type: dict, key_columns: tuple):
-    load_dotenv()
-    
-    user = os.getenv('USER_2')
-    password = os.getenv('PASSWORD_2')
-    database = os.getenv('NAME_2') 
-    host = os.getenv('HOST_2')
-    port = os.getenv('PORT_2')
+    # === 4. ОБРАБОТКА ВСЕХ ДАННЫХ В ОДИН DataFrame ===
+    df_full = normalize_funnel_products(all_products)
     
-    connection_string = f"postgresql://{user}:{password}@{host}:{port}/{database}"
-    engine = None
+    logging.info(f"⚡ DataFrame создан: {len(df_full)} строк за {len(plan)} месяцев")
     
-    try:
-        engine = create_engine(connection_string)
-        
-        # Проверка типов данных
-        valid_types = ['INTEGER', 'BIGINT', 'SMALLINT', 'NUMERIC', 'DATE', 'TIMESTAMP', 'BOOLEAN', 'TEXT', 'VARCHAR']
-        for col, dtype in columns_type.items():
-            if not dtype.strip():
-                raise ValueError(f"Пустой тип данных для колонки {col}")
-            base_type = dtype.split('(')[0].strip().upper()
-            if base_type not in valid_types:
-                raise ValueError(f"Недопустимый тип данных для колонки {col}: {dtype}")
-
-        # Проверка и добавление отсутствующих колонок
-        missing_cols = set(columns_type.keys()) - set(df.columns)
-        for col in missing_cols:
-            df[col] = None
-            logging.info(f"Добавлена отсутствующая колонка {col} с None")
-        
-        extra_cols = set(df.columns) - set(columns_type.keys())
-        if extra_cols:
-            logging.warning(f"Лишние колонки в DataFrame: {extra_cols}, они будут проигнорированы")
-
-        # Формирование SQL для создания таблицы
-        columns_definition = ", ".join([f"{col} {dtype}" for col, dtype in columns_type.items()])
-        unique_constraint = f", CONSTRAINT unique_{table_name} UNIQUE ({', '.join(key_columns)})" if key_columns else ""
-
-        create_table_query = f"""
-            CREATE TABLE IF NOT EXISTS {table_name} (
-                {columns_definition}{unique_constraint}
-            )
-        """
-
-        # Создание таблицы
-        with engine.connect() as conn:
-            conn.execute(text(create_table_query))
-            conn.commit()
-        
-        # Подготовка данных для вставки
-        columns = list(columns_type.keys())
-        
-        # Создание временной таблицы для UPSERT
-        temp_table = f"temp_{table_name}"
-        
-        # Вставляем данные во временную таблицу
-        df[columns].to_sql(temp_table, engine, if_exists='replace', index=False)
-        
-        # Выполняем UPSERT из временной таблицы с явным преобразованием типов
-        with engine.connect() as conn:
-            if key_columns:
-                # Формируем SELECT с явным преобразованием типов
-                select_columns = []
-                for col in columns:
-                    if columns_type[col].upper() == 'TIMESTAMP':
-                        select_columns.append(f"CAST({col} AS TIMESTAMP)")  # Явное преобразование
-                    else:
-                        select_columns.append(col)
-                
-                updates = ', '.join([f"{col}=EXCLUDED.{col}" for col in columns if col not in key_columns])
-                upsert_query = f"""
-                    INSERT INTO {table_name} ({', '.join(columns)})
-                    SELECT {', '.join(select_columns)} FROM {temp_table}
-                    ON CONFLICT ({', '.join(key_columns)}) 
-                    DO UPDATE SET {updates}
-                """
-            else:
-                # Простая вставка с преобразованием типов
-                select_columns = []
-                for col in columns:
-                    if columns_type[col].upper() == 'TIMESTAMP':
-                        select_columns.append(f"CAST({col} AS TIMESTAMP)")
-                    else:
-                        select_columns.append(col)
-                
-                upsert_query = f"""
-                    INSERT INTO {table_name} ({', '.join(columns)})
-                    SELECT {', '.join(select_columns)} FROM {temp_table}
-                """
-            
-            conn.execute(text(upsert_query))
-            # Удаляем временную таблицу
-            conn.execute(text(f"DROP TABLE {temp_table}"))
-            conn.commit()
-        
-        logging.info(f"Успешно сохранено {len(df)} строк в {table_name}")
-        
-    except SQLAlchemyError as e:
-        logging.error(f"Ошибка при работе с БД: {str(e)}")
-        raise
-    except Exception as e:
-        logging.error(f"Неожиданная ошибка: {str(e)}")
-        raise
-    finally:
-        if engine:
-            engine.dispose()
+    return df_full, fetched
 
 # === Исполняемая функция для получения данных по воронке продаж по месяцам ===
-async def main_funnel():
+def funnel_db_connection():
+    """Соединение psycopg2 с БД воронки (параметры из .env)."""
+    return create_connection(os.getenv('NAME_2'), os.getenv('USER_2'), os.getenv('PASSWORD_2'),
+                             os.getenv('HOST_2'), os.getenv('PORT_2'))
+
+
+async def main_funnel(full: bool = False):
+    """
+    Помесячная воронка. Обычный запуск перезагружает текущий и предыдущий месяц
+    и месяцы, ещё не отмеченные окончательными в funnel_month_watermarks;
+    full=True — все 13 месяцев.
+    """
+    # === Окончательные месяцы по водяным знакам ===
+    final_months = set()
+    if not full:
+        connection = funnel_db_connection()
+        try:
+            final_months = load_final_months(connection)
+        finally:
+            connection.close()
+
     # === Запускаем и функцию и получаем данные ===
-    df_result = await process_funnel_month()
-    # Удаляем дубликаты
-    df_result = df_result.drop_duplicates()
-    # Приводим колонку к типу данных дата
-    df_result['date'] = pd.to_datetime(df_result['date']).dt.date
-    # === Добавляем данные в БД ===
+    df_result, fetched = await process_funnel_month(full, final_months)
     table_name = 'funnel_month'
-    columns_type = {
-        'account': 'VARCHAR(255)',
-        'nm_id': 'BIGINT',
-        'vendor_code': 'VARCHAR(255)',
-        'title': 'VARCHAR(255)',
-        'subject_id': 'BIGINT',
-        'subject_name': 'VARCHAR(255)',
-        'brand_name': 'VARCHAR(255)',
-        'product_rating': 'NUMERIC(5,2)',
-        'feedback_rating': 'NUMERIC(5,2)',
-        'stocks_wb': 'BIGINT',
-        'stocks_mp': 'BIGINT',
-        'balance_sum': 'BIGINT',
-        'open_count': 'BIGINT',
-        'cart_count': 'BIGINT',
-        'order_count': 'BIGINT',
-        'orders_sum': 'BIGINT',
-        'buyout_count': 'BIGINT',
-        'buyout_sum': 'BIGINT',
-        'cancel_count': 'BIGINT',
-        'cancel_sum': 'BIGINT',
-        'avg_price': 'NUMERIC(12,2)',
-        'avg_orders_count_per_day': 'NUMERIC(10,2)',
-        'share_order_percent': 'NUMERIC(10,2)',
-        'add_to_wish_list': 'BIGINT',
-        'time_to_ready': 'BIGINT',
-        'localization_percent': 'NUMERIC(10,2)',
-        'date': 'DATE',
-        'month': 'TEXT',
-        'wild': 'TEXT'
-    }
-
-    # Ключевые колонки для UPSERT
-    key_columns = ('nm_id', 'date', 'account')  # как первичный ключ
-    create_insert_table_db_sync(df_result, table_name, columns_type, key_columns)
-    print(f"Данные добавлены в БД {table_name}")
-
-def funnel_month_to_gs():
-    """ Выгрузка данных из БД funnel_month
-    в гугл-таблицу"""
+    if df_result.empty:
+        print(f"Новых данных для {table_name} нет")
+    else:
+        # Удаляем дубликаты
+        df_result = df_result.drop_duplicates()
+        # Приводим колонку к типу данных дата
+        df_result['date'] = pd.to_datetime(df_result['date']).dt.date
+        # === Добавляем данные в БД ===
+        columns_type = FUNNEL_COLUMNS_TYPE
+
+        # Ключевые колонки для UPSERT
+        key_columns = ('nm_id', 'date', 'account')  # как первичный ключ
+        create_insert_table_db_sync(df_result, table_name, columns_type, key_columns)
+        print(f"Данные добавлены в БД {table_name}")
+
+    # === Водяные знаки — только после успешной записи в БД ===
+    current = month_start(datetime.now().date())
+    connection = funnel_db_connection()
+    try:
+        save_month_watermarks(connection, fetched, {current, previous_month(current)})
+    finally:
+        connection.close()
+
+def funnel_month_to_gs(full=False):
+    """ Выгрузка помесячной сводки ежедневной воронки (funnel_monthly_rollup)
+    в гугл-таблицу. Сводку поддерживает main_funnel_daily (пересчитывает все
+    месяцы загруженных дней); при первом запуске она
+    собирается здесь целиком.
+    Любая другая запись в funnel_daily (ручная догрузка, правка, удаление)
+    сводку не обновляет — после неё нужен запуск с full=True
+    (python funnel_month_to_gs.py --full): сводка пересобирается по всей
+    funnel_daily перед выгрузкой."""
     # === Работа с БД
     # Параметры подключения к БД
     name = os.getenv('NAME_2')
@@ -477,35 +435,20 @@ def funnel_month_to_gs():
     password = os.getenv('PASSWORD_2')
     host = os.getenv('HOST_2')
     port = os.getenv('PORT_2')
-    table_name = "funnel_daily"
     # Получаем нужные данные
     connection = create_connection(name, user, password, host, port)
-    query_1 = f"""SELECT to_char(date, 'MM-YYYY') AS month, 
-                wild,
-                account,
-                SUM(open_count) AS open_count,
-                SUM(cart_count) AS cart_count, 
-                SUM(order_count) AS order_count,
-                SUM(orders_sum) AS orders_sum,
-                SUM(buyout_count) AS buyout_count,
-                SUM(buyout_sum) AS buyout_sum,
-                SUM(cancel_count) AS cancel_count,
-                SUM(cancel_sum) AS cancel_sum,
-                ROUND(AVG(avg_price),2) AS avg_price
-        FROM {table_name}
-        GROUP BY to_char(date, 'MM-YYYY'),
-                wild, account
-        ORDER BY "month", orders_sum DESC, account;"""
+    # Готовая сводка по месяцам вместо GROUP BY по всей funnel_daily;
+    # days=None — пересборка целиком, пустой набор — только создать, если её нет
+    refresh_monthly_rollup(connection, days=None if full else ())
+    query_1 = rollup_export_query()
     # Помещаем данные в датафрейм
     df_month = get_db_table(query_1, connection)
     table = safe_open_spreadsheet("План РК")
     sheet_profit = table.worksheet("БД Воронка месяц")
 
-    # Полная замена листа
-    sheet_profit.clear()
-    # === 2. ЗАПИСЫВАЕМ DataFrame ЦЕЛИКОМ ===
-    # Метод set_with_dataframe библиотеки gspread_dataframe
-    set_with_dataframe(sheet_profit, df_month, resize=True)
+    # === 2. ЗАПИСЫВАЕМ ТОЛЬКО ИЗМЕНЕНИЯ относительно прошлой выгрузки ===
+    # Размер листа подгоняется под DataFrame, как раньше с set_with_dataframe(resize=True)
+    sync_dataframe(table, sheet_profit, df_month, resize=True)
 
     formatted_time = (datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
     max_columns = sheet_profit.col_count
@@ -527,161 +470,113 @@ def batchify(data, batch_size):
     for i in range(0, len(data), batch_size):
         yield data[i:i + batch_size]
 
-async def process_funnel_daily():
+def settled_before(settle_days: int = FUNNEL_DAILY_SETTLE_DAYS):
+    """Первый день окна досчёта: дни раньше него считаются устоявшимися."""
+    return (datetime.now() - timedelta(days=settle_days)).date()
+
+
+async def process_funnel_daily(full: bool = False, final_days: set | None = None,
+                               settle_days: int = FUNNEL_DAILY_SETTLE_DAYS):
     """
-    Оптимизированная версия: собираем ВСЕ данные в один DataFrame за 3 месяца
+    Собираем данные ежедневной воронки за последние FUNNEL_DAILY_DAYS дней в один DataFrame.
+
+    Последние settle_days дней загружаются всегда, более ранние — только для
+    аккаунтов, у которых день не отмечен окончательным (final_days — пары
+    (account, день), см. watermarks: отсутствующие и помеченные stale дни
+    сюда не входят). full=True — полная загрузка всех дней по всем аккаунтам.
+
+    Возвращает DataFrame и {(account, день): число товаров} полностью выгруженных дней.
     """
-    # === 1. ПОЛУЧАЕМ ДАТЫ ДЛЯ 12 МЕСЯЦЕВ до текущего ===
+    # === 1. ПОЛУЧАЕМ ДНИ ДЛЯ ЗАГРУЗКИ ===
     bath_size = 28
+    accounts = list(load_api_tokens())
+    recent_from = settled_before(settle_days)
+    final_days = set() if full else (final_days or set())
     date_ranges = []
-    for day_num in range(1, 29):
-        found_day = datetime.now()-timedelta(days=day_num)
-        first_date, last_date = found_day, found_day
-        date_ranges.append((first_date, last_date))
+    for day_num in range(1, FUNNEL_DAILY_DAYS + 1):
+        found_day = (datetime.now()-timedelta(days=day_num)).date()
+        day_accounts = [account for account in accounts
+                        if found_day >= recent_from or (account, found_day) not in final_days]
+        if day_accounts:
+            date_ranges.append((found_day, found_day, day_accounts))
     
-    print(f"📅 Запрашиваем данные за {len(date_ranges)} дней...")
+    requests_count = sum(len(day_accounts) for _, _, day_accounts in date_ranges)
+    print(f"📅 Запрашиваем данные за {len(date_ranges)} дней: {requests_count} из "
+          f"{FUNNEL_DAILY_DAYS * len(accounts)} пар (аккаунт, день){' — полная загрузка' if full else ''}")
 
     batches = batchify(date_ranges, bath_size)
 
-    # === 2. ПАРАЛЛЕЛЬНЫЙ ЗАПРОС ВСЕХ МЕСЯЦЕВ ===
+    # === 2. ПАРАЛЛЕЛЬНЫЙ ЗАПРОС ВСЕХ ДНЕЙ (одна сессия на весь запуск) ===
     list_dfs = []
-    for batch in batches:
-        tasks = [fetch_all(first, last) for first, last in batch]
-        results = await asyncio.gather(*tasks)
-        
-        print(f"✅ Получено {sum(len(r) for r in results)} записей")
-        
-        # === 3. ОБЪЕДИНЯЕМ ВСЕ ДАННЫЕ В ОДИН СПИСОК ===
-        all_products = []
-        for result in results:
-            for acc_data in result:
-                if acc_data:
-                    all_products.extend(acc_data)
-        
-        print(f"📦 Обработано {len(all_products)} товаров")
-        
-        # === 4. ОБРАБОТКА ВСЕХ ДАННЫХ ===
-        rows = []
-        for product in all_products:
-            # Извлекаем данные 
-            prod_info = product.get("product", {})
-            stat = product.get("statistic", {})
-            selected = stat.get("selected", {})
-            time_to_ready = selected.get("timeToReady", {})
+    fetched = {}
+    async with FunnelSession() as http:
+        for batch in batches:
+            tasks = [fetch_all(first, last, http, day_accounts, fetched) for first, last, day_accounts in batch]
+            results = await asyncio.gather(*tasks)
             
-            # Базовая информация
-            row = {
-                "account": product.get("account"),
-                "nm_id": prod_info.get("nmId"),
-                "vendor_code": prod_info.get("vendorCode"),  
-                "title": prod_info.get("title"),
-                "subject_id": prod_info.get("subjectId"),
-                "subject_name": prod_info.get("subjectName"),
-                "brand_name": prod_info.get("brandName"),
-                "product_rating": prod_info.get("productRating"),
-                "feedback_rating": prod_info.get("feedbackRating"),
-                "stocks_wb": prod_info.get("stocks", {}).get("wb"),
-                "stocks_mp": prod_info.get("stocks", {}).get("mp"),
-                "balance_sum": prod_info.get("stocks", {}).get("balanceSum"),
-            }
+            print(f"✅ Получено {sum(len(r) for r in results)} записей")
             
-            # Метрики selected
-            row.update({
-                "open_count": selected.get("openCount"),
-                "cart_count": selected.get("cartCount"),
-                "order_count": selected.get("orderCount"),
-                "orders_sum": selected.get("orderSum"),
-                "buyout_count": selected.get("buyoutCount"),
-                "buyout_sum": selected.get("buyoutSum"),
-                "cancel_count": selected.get("cancelCount"),
-                "cancel_sum": selected.get("cancelSum"),
-                "avg_price": selected.get("avgPrice"),
-                "avg_orders_count_per_day": selected.get("avgOrdersCountPerDay"),
-                "share_order_percent": selected.get("shareOrderPercent"),
-                "add_to_wish_list": selected.get("addToWishlist"),
-                "time_to_ready": (
-                    time_to_ready.get("days", 0) * 24 * 60 +
-                    time_to_ready.get("hours", 0) * 60 +
-                    time_to_ready.get("mins", 0)
-                ),
-                "localization_percent": selected.get("localizationPercent"),
-                "date": selected.get("period", {}).get("end"),
-            })
+            # === 3. ОБЪЕДИНЯЕМ ВСЕ ДАННЫЕ В ОДИН СПИСОК ===
+            all_products = []
+            for result in results:
+                for acc_data in result:
+                    if acc_data:
+                        all_products.extend(acc_data)
             
-            rows.append(row)
-                
-        # === 5. ОДИН DataFrame ===
-        df_full = pd.DataFrame(rows)
-        list_dfs.append(df_full)
-    df_final = pd.concat(list_dfs)
-    # === 6. Создаем новые колонки ===
-    df_final['month'] = pd.to_datetime(df_final['date']).dt.strftime('%m-%Y')
-    df_final['wild'] = df_final['vendor_code'].str.extract(r'(wild\d+)')
+            print(f"📦 Обработано {len(all_products)} товаров")
+            
+            # === 4. ОБРАБОТКА ВСЕХ ДАННЫХ В ОДИН DataFrame ===
+            df_full = normalize_funnel_products(all_products)
+            list_dfs.append(df_full)
+    df_final = pd.concat(list_dfs, ignore_index=True) if list_dfs else pd.DataFrame()
     
     print(f"⚡ DataFrame создан: {len(df_final)} строк за {len(date_ranges)} дней")   
-    return df_final    
+    return df_final, fetched
 
 
-async def main_funnel_daily():
+async def main_funnel_daily(full: bool = False, settle_days: int = FUNNEL_DAILY_SETTLE_DAYS):
+    """
+    Ежедневная воронка. Обычный запуск перезагружает последние settle_days дней
+    и дни без окончательной отметки в funnel_daily_watermarks (пропущенные,
+    недосчитанные или помеченные stale); full=True — все FUNNEL_DAILY_DAYS дней.
+    """
+    # === Окончательные дни по водяным знакам ===
+    final_days = set()
+    if not full:
+        connection = funnel_db_connection()
+        try:
+            final_days = load_final_days(connection)
+        finally:
+            connection.close()
+
     # Запрашиваем данные по воронке за дни
-    df = await process_funnel_daily()
-    # Удаляем общие дубликаты
-    df = df.drop_duplicates()
-    # Приводим колонку к типу данных дата
-    df['date'] = pd.to_datetime(df['date']).dt.date
-
-    # Удаляем дубликаты, оставляя запись с наибольшим open_count
-    # Находим дубликаты по nm_id и date
-    df_orders_sum = df.sort_values(
-        by=['nm_id', 'date', 'orders_sum'],
-        ascending=[True, True, False]
-    )
-    # Удаляем дубликаты, оставляя первую запись (с наибольшим open_count)
-    df_orders_sum = df_orders_sum.drop_duplicates(subset=['nm_id', 'date'], keep='first')
-
-    # Теперь из полученного датафрейма удаляем дубликаты по nm_id и date, оставляя запись с наибольшим open_count
-    df_open_count = df_orders_sum.sort_values(
-        by=['nm_id', 'date', 'open_count'],
-        ascending=[True, True, False]
-    )
-    # Удаляем дубликаты, оставляя первую запись (с наибольшим open_count)
-    df_open_count = df_open_count.drop_duplicates(subset=['nm_id', 'date'], keep='first')
-
-    # === Добавляем данные в БД ===
+    df, fetched = await process_funnel_daily(full, final_days, settle_days)
     table_name = 'funnel_daily'
-    columns_type = {
-        'account': 'VARCHAR(255)',
-        'nm_id': 'BIGINT',
-        'vendor_code': 'VARCHAR(255)',
-        'title': 'VARCHAR(255)',
-        'subject_id': 'BIGINT',
-        'subject_name': 'VARCHAR(255)',
-        'brand_name': 'VARCHAR(255)',
-        'product_rating': 'NUMERIC(5,2)',
-        'feedback_rating': 'NUMERIC(5,2)',
-        'stocks_wb': 'BIGINT',
-        'stocks_mp': 'BIGINT',
-        'balance_sum': 'BIGINT',
-        'open_count': 'BIGINT',
-        'cart_count': 'BIGINT',
-        'order_count': 'BIGINT',
-        'orders_sum': 'BIGINT',
-        'buyout_count': 'BIGINT',
-        'buyout_sum': 'BIGINT',
-        'cancel_count': 'BIGINT',
-        'cancel_sum': 'BIGINT',
-        'avg_price': 'NUMERIC(12,2)',
-        'avg_orders_count_per_day': 'NUMERIC(10,2)',
-        'share_order_percent': 'NUMERIC(10,2)',
-        'add_to_wish_list': 'BIGINT',
-        'time_to_ready': 'BIGINT',
-        'localization_percent': 'NUMERIC(10,2)',
-        'date': 'DATE',
-        'month': 'TEXT',
-        'wild': 'TEXT'
-    }
-
-    # Ключевые колонки для UPSERT
-    key_columns = ('nm_id', 'date')  # как первичный ключ
-    create_insert_table_db_sync(df_open_count, table_name, columns_type, key_columns)
-    print(f"Данные добавлены в БД {table_name}")
+    if df.empty:
+        print(f"Новых данных для {table_name} нет")
+    else:
+        df_open_count = dedup_funnel_daily(df)
+
+        # === Добавляем данные в БД ===
+        columns_type = FUNNEL_COLUMNS_TYPE
+
+        # Ключевые колонки для UPSERT
+        key_columns = ('nm_id', 'date')  # как первичный ключ
+        create_insert_table_db_sync(df_open_count, table_name, columns_type, key_columns)
+        print(f"Данные добавлены в БД {table_name}")
+
+        # === Помесячная сводка — за все загруженные месяцы ===
+        # Не только при изменениях в этом запуске: если прошлый пересчёт упал после записи,
+        # повторная загрузка тех же дней покажет «без изменений», а сводка останется устаревшей
+        connection = funnel_db_connection()
+        try:
+            refresh_monthly_rollup(connection, set(df_open_count['date']))
+        finally:
+            connection.close()
+
+    # === Водяные знаки — только после успешной записи в БД ===
+    connection = funnel_db_connection()
+    try:
+        save_daily_watermarks(connection, fetched, settled_before(settle_days))
+    finally:
+        connection.close()
@@ -0,0 +1,93 @@
+"""Водяные знаки загрузки воронки: какие периоды по аккаунтам уже выгружены окончательно
+
+Таблица водяных знаков хранит по паре (account, период) дату последней полной
+выгрузки, число строк и признак final. Окончательные периоды при обычном
+запуске не перезагружаются. Чтобы принудительно перезагрузить период,
+достаточно выставить ему stale = TRUE (или удалить строку).
+"""
+import logging
+from datetime import date
+
+from psycopg2.extras import execute_values
+
+
+MONTH_WATERMARKS_TABLE = 'funnel_month_watermarks'
+DAILY_WATERMARKS_TABLE = 'funnel_daily_watermarks'
+
+
+def ensure_watermarks(connection, table_name: str, period_column: str):
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                account VARCHAR(255) NOT NULL,
+                {period_column} DATE NOT NULL,
+                rows_count INTEGER NOT NULL DEFAULT 0,
+                fetched_at TIMESTAMP NOT NULL DEFAULT now(),
+                final BOOLEAN NOT NULL DEFAULT FALSE,
+                stale BOOLEAN NOT NULL DEFAULT FALSE,
+                PRIMARY KEY (account, {period_column})
+            )
+        """)
+        # stale появилась позже первой версии таблицы месяцев
+        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS stale BOOLEAN NOT NULL DEFAULT FALSE")
+    connection.commit()
+
+
+def load_final_periods(connection, table_name: str, period_column: str) -> set:
+    """Пары (account, период), которые больше не перезагружаются: окончательные и не помеченные stale."""
+    ensure_watermarks(connection, table_name, period_column)
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT account, {period_column} FROM {table_name} WHERE final AND NOT stale")
+        return set(cursor.fetchall())
+
+
+def save_watermarks(connection, table_name: str, period_column: str, fetched: dict, is_final):
+    """
+    Отмечает полностью выгруженные периоды: fetched — {(account, период): число строк},
+    is_final(период) — окончательна ли эта выгрузка. Отметка stale снимается.
+    """
+    if not fetched:
+        return
+    ensure_watermarks(connection, table_name, period_column)
+    rows = [(account, period, rows_count, is_final(period)) for (account, period), rows_count in fetched.items()]
+    with connection.cursor() as cursor:
+        execute_values(cursor, f"""
+            INSERT INTO {table_name} (account, {period_column}, rows_count, final)
+            VALUES %s
+            ON CONFLICT (account, {period_column}) DO UPDATE
+            SET rows_count = EXCLUDED.rows_count, final = EXCLUDED.final, stale = FALSE, fetched_at = now()
+        """, rows)
+    connection.commit()
+    final_count = sum(1 for row in rows if row[3])
+    logging.info(f"🔖 Водяные знаки {table_name}: {len(rows)} периодов, из них окончательных {final_count}")
+
+
+def load_final_months(connection) -> set:
+    """Пары (account, первый день месяца), которые больше не перезагружаются."""
+    return load_final_periods(connection, MONTH_WATERMARKS_TABLE, 'month')
+
+
+def save_month_watermarks(connection, fetched: dict, open_months: set):
+    """
+    Месяц становится окончательным, если на момент выгрузки он уже вне открытого окна
+    (open_months — текущий и предыдущий месяц): такая выгрузка — последняя.
+    """
+    save_watermarks(connection, MONTH_WATERMARKS_TABLE, 'month', fetched, lambda month: month not in open_months)
+
+
+def load_final_days(connection) -> set:
+    """Пары (account, день), которые больше не перезагружаются."""
+    return load_final_periods(connection, DAILY_WATERMARKS_TABLE, 'day')
+
+
+def save_daily_watermarks(connection, fetched: dict, settled_before: date):
+    """День окончательный, если на момент выгрузки он старше окна досчёта (раньше settled_before)."""
+    save_watermarks(connection, DAILY_WATERMARKS_TABLE, 'day', fetched, lambda day: day < settled_before)
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def previous_month(first_day: date) -> date:
+    return date(first_day.year - (first_day.month == 1), (first_day.month - 2) % 12 + 1, 1)
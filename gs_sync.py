@@ -0,0 +1,161 @@
+"""Инкрементальная выгрузка DataFrame на лист Google Sheets
+
+Вместо очистки листа и полной перезаписи (set_with_dataframe) на лист уходят
+только изменившиеся ячейки. Последний выгруженный снимок листа хранится в
+локальном кэше
+    <root>/<spreadsheet_id>/<worksheet_id>.json
+(каталог — GS_SYNC_CACHE_DIR, по умолчанию gs_sync_cache в корне проекта).
+Новый кадр сравнивается со снимком построчно: подряд идущие изменённые строки
+объединяются в один диапазон (по колонкам — от первой до последней изменённой),
+и все диапазоны отправляются одним запросом values_batch_update.
+
+Полная перезапись — если снимка нет (первый запуск, другой компьютер),
+изменился состав колонок или передан full=True. Правки, сделанные на листе
+вручную в выгружаемой области, по снимку не видны: чтобы их затереть, нужен full=True.
+"""
+import json
+import logging
+import os
+
+import pandas as pd
+from gspread.utils import absolute_range_name, rowcol_to_a1
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gs_sync_cache')
+VALUE_INPUT_OPTION = 'USER_ENTERED'
+
+
+def cell_value(value) -> str:
+    """Значение ячейки в том виде, в каком его пишет set_with_dataframe: пропуск — пустая строка."""
+    if pd.isnull(value) is True:
+        return ''
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def frame_to_rows(df: pd.DataFrame) -> list:
+    """Заголовок и строки кадра — список списков строк."""
+    rows = [[str(col) for col in df.columns]]
+    rows.extend([cell_value(value) for value in row] for row in df.itertuples(index=False, name=None))
+    return rows
+
+
+def changed_ranges(old: list, new: list) -> list:
+    """
+    Диапазоны изменений new относительно old: [(первая строка, последняя строка,
+    первая колонка, последняя колонка)], нумерация с 1 как на листе. Строки,
+    которых нет в old, считаются изменёнными целиком.
+    """
+    ranges = []
+    for row_num, row in enumerate(new, start=1):
+        previous = old[row_num - 1] if row_num <= len(old) else None
+        if previous == row:
+            continue
+        if previous is None or len(previous) != len(row):
+            first_col, last_col = 1, len(row)
+        else:
+            changed = [col for col, (a, b) in enumerate(zip(previous, row), start=1) if a != b]
+            first_col, last_col = changed[0], changed[-1]
+        if ranges and ranges[-1][1] == row_num - 1:
+            start, _, start_col, end_col = ranges[-1]
+            ranges[-1] = (start, row_num, min(start_col, first_col), max(end_col, last_col))
+        else:
+            ranges.append((row_num, row_num, first_col, last_col))
+    return ranges
+
+
+class SheetSnapshotCache:
+    """Снимки выгруженных листов, ключ — (id таблицы, id листа)."""
+
+    def __init__(self, root: str | None = None):
+        self.root = root or os.getenv('GS_SYNC_CACHE_DIR') or DEFAULT_CACHE_DIR
+
+    def _path(self, spreadsheet_id: str, worksheet_id) -> str:
+        return os.path.join(self.root, str(spreadsheet_id), f"{worksheet_id}.json")
+
+    def load(self, spreadsheet_id: str, worksheet_id) -> list | None:
+        path = self._path(spreadsheet_id, worksheet_id)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)['rows']
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Снимок листа {path} не прочитан ({e}), будет полная перезапись")
+            return None
+
+    def save(self, spreadsheet_id: str, worksheet_id, rows: list):
+        """Запись атомарная: при сбое остаётся прежний снимок."""
+        path = self._path(spreadsheet_id, worksheet_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'rows': rows}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def drop(self, spreadsheet_id: str, worksheet_id):
+        path = self._path(spreadsheet_id, worksheet_id)
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+def sync_dataframe(spreadsheet, worksheet, df: pd.DataFrame, resize: bool = False,
+                   full: bool = False, cache: SheetSnapshotCache | None = None) -> dict:
+    """
+    Выгружает df (с заголовком, с ячейки A1) на лист worksheet таблицы
+    spreadsheet, отправляя только изменения относительно прошлой выгрузки.
+
+    resize=True — размер листа подгоняется под df (как set_with_dataframe(resize=True)),
+    иначе лист только увеличивается до размера df (как set_with_dataframe без resize),
+    а лишние строки прошлой выгрузки очищаются. full=True — перезаписать
+    всю область, не глядя на снимок.
+    Возвращает {'mode': 'diff' | 'full', 'ranges': число диапазонов, 'cells': число ячеек}.
+    """
+    cache = cache or SheetSnapshotCache()
+    rows = frame_to_rows(df)
+    width = len(rows[0])
+    previous = None if full else cache.load(spreadsheet.id, worksheet.id)
+
+    if previous and previous[0] == rows[0]:
+        mode = 'diff'
+        ranges = changed_ranges(previous, rows)
+    else:
+        mode = 'full'
+        ranges = [(1, len(rows), 1, width)]
+
+    # Снимок сбрасываем до записи: если запрос оборвётся, следующий запуск перезапишет лист целиком
+    cache.drop(spreadsheet.id, worksheet.id)
+
+    if resize:
+        if (worksheet.row_count, worksheet.col_count) != (len(rows), width):
+            worksheet.resize(rows=len(rows), cols=width)
+    else:
+        # Запись за пределы сетки листа values_batch_update отклоняет (exceeds grid limits)
+        if worksheet.row_count < len(rows) or worksheet.col_count < width:
+            worksheet.resize(rows=max(worksheet.row_count, len(rows)), cols=max(worksheet.col_count, width))
+        if previous:
+            # Строки и колонки прошлой выгрузки, которые теперь вне df
+            stale = []
+            old_width = max(len(r) for r in previous)
+            if len(previous) > len(rows):
+                stale.append(f"A{len(rows) + 1}:{rowcol_to_a1(len(previous), old_width)}")
+            if old_width > width:
+                stale.append(f"{rowcol_to_a1(1, width + 1)}:{rowcol_to_a1(min(len(previous), len(rows)), old_width)}")
+            if stale:
+                worksheet.batch_clear(stale)
+
+    data = [
+        {
+            'range': absolute_range_name(worksheet.title, f"{rowcol_to_a1(start, first_col)}:{rowcol_to_a1(end, last_col)}"),
+            'values': [row[first_col - 1:last_col] for row in rows[start - 1:end]],
+        }
+        for start, end, first_col, last_col in ranges
+    ]
+    if data:
+        spreadsheet.values_batch_update({'valueInputOption': VALUE_INPUT_OPTION, 'data': data})
+    cache.save(spreadsheet.id, worksheet.id, rows)
+
+    cells = sum((end - start + 1) * (last_col - first_col + 1) for start, end, first_col, last_col in ranges)
+    logging.info(f"📤 {worksheet.title}: {'изменения' if mode == 'diff' else 'полная запись'} — "
+                 f"{len(ranges)} диапазонов, {cells} из {len(rows) * width} ячеек")
+    return {'mode': mode, 'ranges': len(ranges), 'cells': cells}
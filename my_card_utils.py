@@ -1,12 +1,20 @@
+import os
 import requests
 import time
 from my_utils import load_api_tokens, safe_open_spreadsheet, insert_multiple_columns
 import gspread
-
-
-def cards_list_wb(api_token):
-  """Получение информации о карточке товара"""
-  url = 'https://content-api.wildberries.ru/content/v2/get/cards/list'
+from wb_archive import ArchiveMissError, get_archive
+
+# Базовый URL content-api (переопределяется, например, для локального имитатора wb_simulator.py)
+CONTENT_API_URL = os.getenv('WB_CONTENT_API_URL', 'https://content-api.wildberries.ru')
+# Эндпоинт списка карточек (ключ архива ответов); список хранится как последний снимок
+CARDS_ENDPOINT = 'content-cards-list'
+CARDS_PERIOD = 'current'
+
+def cards_list_wb(api_token, account='default'):
+  """Получение информации о карточке товара.
+  account — название кабинета (ключ страниц в архиве ответов)"""
+  url = f'{CONTENT_API_URL}/content/v2/get/cards/list'
   headers = {
       "Authorization" : api_token
   }
@@ -16,6 +24,9 @@ def cards_list_wb(api_token):
   total = 100
   limit = 100
   all_cards_data = []
+  # архив сырых страниц: запись (record) или воспроизведение без HTTP (replay)
+  archive = get_archive()
+  page = 0
 
   while total >= limit:
     print(f'Получены данные по {counter} карточкам')
@@ -35,18 +46,27 @@ def cards_list_wb(api_token):
       }
     }
     try:
-      res = requests.post(url, headers=headers, json=payload)
+      if archive.replaying:
+        res = archive.sync_response(CARDS_ENDPOINT, account, CARDS_PERIOD, page)
+      else:
+        res = requests.post(url, headers=headers, json=payload)
       print(res.status_code)
       data = res.json()
       if res.status_code == 200:
+        archive.record(CARDS_ENDPOINT, account, CARDS_PERIOD, page, res.content)
+        page += 1
         nmID = data['cursor']['nmID']
         updatedAt = data['cursor']['updatedAt']
         total = data['cursor']['total']
         all_cards_data.append(data)
         counter+=total
+    except ArchiveMissError as e:
+      print(f'Страницы нет в архиве: {e}')
+      break
     except Exception as e:
       print(e)
-    time.sleep(1)
+    if not archive.replaying:
+      time.sleep(1)
   return all_cards_data
 
 
@@ -57,7 +77,7 @@ def get_card_info():
     cards_info_list = [] 
     for account, api_token in load_api_tokens().items():
         print(f'Получаем данные по ЛК: {account}')
-        res = cards_list_wb(api_token)
+        res = cards_list_wb(api_token, account)
         for i in range(len(res)):
             cards = res[i]['cards']
             for card in cards:
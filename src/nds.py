@@ -5,9 +5,14 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 # Теперь можно импортировать
 from my_card_utils import extract_characteristic, get_nds_target_range, prepare_insert_nds_to_unit
 from my_utils import safe_open_spreadsheet
+from wb_archive import add_archive_arguments, configure_archive
+import argparse
 
 
 if __name__ == "__main__":
+    # --record сохраняет ответы content-api в архив, --replay собирает данные из архива без запросов
+    args = add_archive_arguments(argparse.ArgumentParser()).parse_args()
+    configure_archive(args.archive_mode, args.archive_dir)
     # Определяем нужную для извлечения характеристику
     characteristic = 'Ставка НДС'
     # Извлекаем нужные данные
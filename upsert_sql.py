@@ -0,0 +1,48 @@
+"""SQL для UPSERT, общий для синхронных и асинхронных загрузчиков
+
+Обновление только изменившихся строк (IS DISTINCT FROM) и подсчёт вставленных
+и изменённых строк через RETURNING (xmax = 0). Используется в
+fin_reports/db_async.py и в db_sync.py (funnel_v3, conditional_calculation).
+"""
+
+
+def conflict_update_sql(table_name: str, columns: list, key_columns, on_constraint: bool = True) -> str:
+    """
+    ON CONFLICT ... DO UPDATE, который обновляет строку, только если хотя бы одна
+    неключевая колонка отличается (IS DISTINCT FROM учитывает NULL). Неизменённые
+    строки не порождают новую версию кортежа, WAL и работу для VACUUM.
+
+    on_constraint=True — конфликт по ограничению unique_{table_name},
+    иначе по списку колонок key_columns.
+    """
+    target = (f"ON CONSTRAINT unique_{table_name}" if on_constraint
+              else f"({', '.join(key_columns)})")
+    value_columns = [col for col in columns if col not in key_columns]
+    if not value_columns:
+        return f"ON CONFLICT {target} DO NOTHING"
+    updates = ', '.join([f"{col}=EXCLUDED.{col}" for col in value_columns])
+    current = ', '.join([f"{table_name}.{col}" for col in value_columns])
+    incoming = ', '.join([f"EXCLUDED.{col}" for col in value_columns])
+    return (f"ON CONFLICT {target} DO UPDATE SET {updates} "
+            f"WHERE ({current}) IS DISTINCT FROM ({incoming})")
+
+
+def counted_upsert_sql(insert_sql: str) -> str:
+    """
+    Оборачивает INSERT ... ON CONFLICT в CTE и возвращает одну строку
+    (inserted, updated): xmax = 0 только у только что вставленных кортежей.
+    Строки, пропущенные условием обновления, в RETURNING не попадают.
+    """
+    return f"""
+        WITH upserted AS (
+            {insert_sql}
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT COUNT(*) FILTER (WHERE inserted) AS inserted,
+               COUNT(*) FILTER (WHERE NOT inserted) AS updated
+        FROM upserted
+    """
+
+
+def upsert_counts(total: int, inserted: int, updated: int) -> dict:
+    return {'inserted': inserted, 'updated': updated, 'unchanged': total - inserted - updated}
@@ -0,0 +1,198 @@
+"""Архив сырых ответов WB API и офлайн-воспроизведение загрузок без HTTP
+
+Каждая страница ответа (тело как есть, в байтах) сохраняется сжатой в файл
+    <root>/<endpoint>/<account>/<period>/<page>.json.zst   (zstandard)
+    <root>/<endpoint>/<account>/<period>/<page>.json.gz    (если zstandard не установлен)
+
+Режимы (переменная окружения WB_ARCHIVE_MODE или configure_archive):
+    off    — архив не используется (по умолчанию);
+    record — обычная загрузка из API, каждая успешная страница дополнительно пишется в архив;
+    replay — запросов к API нет, страницы читаются из архива, дальше работает тот же код
+             разбора и записи в БД.
+Каталог архива — WB_ARCHIVE_DIR (по умолчанию wb_archive в корне проекта).
+"""
+import gzip
+import json
+import logging
+import os
+
+from dotenv import load_dotenv
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+load_dotenv()
+
+ARCHIVE_MODES = ('off', 'record', 'replay')
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'wb_archive')
+
+
+class ArchiveMissError(KeyError):
+    """В режиме replay запрошенной страницы нет в архиве."""
+
+
+def _safe_part(value) -> str:
+    return str(value).replace(os.sep, '_').replace('/', '_').strip() or '_'
+
+
+class ArchivedResponse:
+    """
+    Ответ из архива с интерфейсом aiohttp.ClientResponse (status, headers,
+    асинхронные read/text/json). Используется вместо session.get/post.
+    """
+
+    status = 200
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+        self.headers = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def read(self) -> bytes:
+        return self.raw
+
+    async def text(self) -> str:
+        return self.raw.decode('utf-8')
+
+    async def json(self):
+        return json.loads(self.raw)
+
+    def raise_for_status(self):
+        pass
+
+
+class ArchivedSyncResponse:
+    """Ответ из архива с интерфейсом requests.Response (status_code, content, json())."""
+
+    status_code = 200
+
+    def __init__(self, raw: bytes):
+        self.content = raw
+        self.headers = {}
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        pass
+
+
+class ResponseArchive:
+    """Хранилище сырых страниц ответов, ключ — endpoint/account/period/page."""
+
+    def __init__(self, root: str = DEFAULT_ARCHIVE_DIR, mode: str = 'off'):
+        if mode not in ARCHIVE_MODES:
+            raise ValueError(f"Недопустимый режим архива: {mode}. Допустимые: {ARCHIVE_MODES}")
+        self.root = root
+        self.mode = mode
+        self.extension = '.json.zst' if zstandard else '.json.gz'
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == 'record'
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    def _dir(self, endpoint: str, account: str, period) -> str:
+        return os.path.join(self.root, _safe_part(endpoint), _safe_part(account), _safe_part(period))
+
+    def _compress(self, raw: bytes) -> bytes:
+        if zstandard:
+            return zstandard.ZstdCompressor(level=10).compress(raw)
+        return gzip.compress(raw, compresslevel=6)
+
+    @staticmethod
+    def _decompress(path: str, data: bytes) -> bytes:
+        if path.endswith('.zst'):
+            if zstandard is None:
+                raise RuntimeError(f"Для чтения {path} нужен пакет zstandard")
+            return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        return gzip.decompress(data)
+
+    def save(self, endpoint: str, account: str, period, page, raw: bytes):
+        """Сохраняет страницу (перезаписывает, если уже есть). Запись атомарная."""
+        directory = self._dir(endpoint, account, period)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{_safe_part(page)}{self.extension}")
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(self._compress(raw))
+        os.replace(tmp_path, path)
+
+    def record(self, endpoint: str, account: str, period, page, raw: bytes):
+        """Сохраняет страницу, только если архив в режиме record."""
+        if self.recording:
+            self.save(endpoint, account, period, page, raw)
+
+    def load(self, endpoint: str, account: str, period, page) -> bytes:
+        directory = self._dir(endpoint, account, period)
+        for extension in ('.json.zst', '.json.gz'):
+            path = os.path.join(directory, f"{_safe_part(page)}{extension}")
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    return self._decompress(path, f.read())
+        raise ArchiveMissError(f"{endpoint}/{account}/{period}/{page}")
+
+    def periods(self, endpoint: str, account: str | None = None) -> list:
+        """Ключи периодов, сохранённые в архиве по эндпоинту (по всем аккаунтам или одному)."""
+        endpoint_dir = os.path.join(self.root, _safe_part(endpoint))
+        if not os.path.isdir(endpoint_dir):
+            return []
+        accounts = [_safe_part(account)] if account else os.listdir(endpoint_dir)
+        periods = set()
+        for account_dir in accounts:
+            path = os.path.join(endpoint_dir, account_dir)
+            if os.path.isdir(path):
+                periods.update(os.listdir(path))
+        return sorted(periods)
+
+    def response(self, endpoint: str, account: str, period, page) -> ArchivedResponse:
+        """Архивная страница в виде ответа aiohttp (для async with ... as response)."""
+        return ArchivedResponse(self.load(endpoint, account, period, page))
+
+    def sync_response(self, endpoint: str, account: str, period, page) -> ArchivedSyncResponse:
+        """Архивная страница в виде ответа requests."""
+        return ArchivedSyncResponse(self.load(endpoint, account, period, page))
+
+
+_archive = None
+
+
+def configure_archive(mode: str | None = None, root: str | None = None) -> ResponseArchive:
+    """Задаёт режим и каталог архива для всего процесса (по умолчанию — из окружения)."""
+    global _archive
+    _archive = ResponseArchive(root or os.getenv('WB_ARCHIVE_DIR') or DEFAULT_ARCHIVE_DIR,
+                               mode or os.getenv('WB_ARCHIVE_MODE') or 'off')
+    if _archive.mode != 'off':
+        logging.info(f"🗄️ Архив ответов WB: режим {_archive.mode}, каталог {_archive.root}")
+    return _archive
+
+
+def get_archive() -> ResponseArchive:
+    if _archive is None:
+        return configure_archive()
+    return _archive
+
+
+def add_archive_arguments(parser):
+    """Флаги --record/--replay для скриптов запуска."""
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--record', action='store_const', dest='archive_mode', const='record',
+                       help="сохранять сырые ответы API в архив")
+    group.add_argument('--replay', action='store_const', dest='archive_mode', const='replay',
+                       help="не обращаться к API, воспроизвести загрузку из архива")
+    parser.add_argument('--archive-dir', default=None, help="каталог архива (по умолчанию WB_ARCHIVE_DIR)")
+    return parser
@@ -0,0 +1,37 @@
+"""Разбор заголовков лимитов WB API: сколько ждать до следующего запроса
+
+Общий для рейт-лимитера fin_reports (rate_limiter.py) и AIMD-лимитера воронки
+(funnel_v3/aimd_limiter.py).
+"""
+import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+
+# Заголовки, в которых WB (и стандартный HTTP) сообщают, сколько секунд ждать до следующего запроса
+RETRY_HEADERS = ('X-Ratelimit-Retry', 'Retry-After', 'X-Ratelimit-Reset')
+
+
+def retry_after_from_headers(headers) -> float | None:
+    """
+    Возвращает количество секунд ожидания из заголовков ответа или None,
+    если сервер ничего не сообщил.
+    Retry-After может прийти как числом секунд, так и HTTP-датой.
+    """
+    for name in RETRY_HEADERS:
+        value = headers.get(name)
+        if value is None:
+            continue
+        # X-Ratelimit-Reset имеет смысл только когда лимит исчерпан
+        if name == 'X-Ratelimit-Reset' and headers.get('X-Ratelimit-Remaining') not in ('0', 0):
+            continue
+        try:
+            return max(float(value), 0.0)
+        except (TypeError, ValueError):
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+            return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+        except (TypeError, ValueError):
+            logging.warning(f"Не удалось разобрать заголовок {name}: {value}")
+    return None
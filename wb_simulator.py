@@ -0,0 +1,495 @@
+"""Локальный имитатор WB API для нагрузочного тестирования загрузчиков
+
+Отвечает синтетическими данными на эндпоинты, которые используют пайплайны проекта:
+    statistics-api         GET  /api/v5/supplier/reportDetailByPeriod   (fetch_all_data)
+    seller-analytics-api   POST /api/analytics/v3/sales-funnel/products  (process_funnel_month/daily)
+    advert-api             GET  /adv/v3/fullstats                        (get_all_adv_data)
+                           POST /adv/v1/promotion/adverts
+                           GET  /adv/v0/auction/adverts
+    content-api            POST /content/v2/get/cards/list               (get_card_info)
+
+Объём данных, задержка ответа, доля ответов 429/400/204 и лимит запросов
+настраиваются. Лимит считается отдельно на каждый токен и эндпоинт, в ответах
+приходят заголовки X-Ratelimit-* как у WB.
+
+Запуск:
+    python wb_simulator.py --port 8081 --fin-rows 200000 --rate-interval 0.5 --error-429 0.05
+
+и в окружении загрузчика:
+    WB_STATISTICS_API_URL=http://127.0.0.1:8081
+    WB_ANALYTICS_API_URL=http://127.0.0.1:8081
+    WB_ADVERT_API_URL=http://127.0.0.1:8081
+    WB_CONTENT_API_URL=http://127.0.0.1:8081
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from aiohttp import web
+
+
+@dataclass
+class SimulatorConfig:
+    # строк отчёта о реализации на один (токен, период)
+    fin_rows: int = 100_000
+    # товаров воронки на один (токен, период)
+    funnel_products: int = 2_000
+    # кампаний каждого типа на один токен
+    campaigns: int = 50
+    # карточек товаров на один токен
+    cards: int = 500
+    # задержка ответа, мс (равномерно в [latency_ms, latency_ms + latency_jitter_ms])
+    latency_ms: float = 0.0
+    latency_jitter_ms: float = 0.0
+    # доли ответов с ошибками (0..1)
+    error_429: float = 0.0
+    error_400: float = 0.0
+    error_204: float = 0.0
+    # лимит: минимальный интервал между запросами одного токена к эндпоинту и размер всплеска
+    rate_interval: float = 0.0
+    rate_burst: int = 1
+    seed: int = 0
+    # кэшировать тела страниц отчёта — повторные прогоны бенчмарка не тратят время на генерацию
+    cache_pages: bool = False
+
+
+class SimulatedRateLimit:
+    """GCRA по ключу (токен, эндпоинт) — так же, как лимиты считает WB."""
+
+    def __init__(self, interval: float, burst: int):
+        self.interval = interval
+        self.burst = max(burst, 1)
+        self._tat = {}
+
+    def check(self, key) -> tuple[bool, dict]:
+        """Возвращает (разрешён ли запрос, заголовки X-Ratelimit-*)."""
+        if self.interval <= 0:
+            return True, {}
+        now = time.monotonic()
+        tat = max(self._tat.get(key, now), now)
+        allowed_at = tat - (self.burst - 1) * self.interval
+        if now < allowed_at:
+            retry = allowed_at - now
+            return False, {
+                'X-Ratelimit-Limit': str(self.burst),
+                'X-Ratelimit-Remaining': '0',
+                'X-Ratelimit-Retry': f"{retry:.3f}",
+                'X-Ratelimit-Reset': f"{retry:.3f}",
+            }
+        tat += self.interval
+        self._tat[key] = tat
+        remaining = int((self.burst * self.interval - (tat - now)) // self.interval)
+        return True, {
+            'X-Ratelimit-Limit': str(self.burst),
+            'X-Ratelimit-Remaining': str(max(remaining, 0)),
+            'X-Ratelimit-Reset': f"{max(tat - now - (self.burst - 1) * self.interval, 0.0):.3f}",
+        }
+
+
+def _rng(*parts) -> random.Random:
+    """Детерминированный генератор: одни и те же запросы дают одни и те же данные."""
+    digest = hashlib.sha256('|'.join(map(str, parts)).encode('utf-8')).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+
+def _token_id(value: str) -> int:
+    """Стабильный числовой идентификатор строки (токена, даты) в диапазоне 0..2**20."""
+    return int(hashlib.sha256(value.encode('utf-8')).hexdigest()[:5], 16)
+
+
+def fin_report_row(rng: random.Random, report_id: int, rrd_id: int, date_from: str, date_to: str) -> dict:
+    doc_type = rng.choice(('Продажа', 'Продажа', 'Продажа', 'Возврат', ''))
+    sale_dt = datetime.fromisoformat(date_from) + timedelta(seconds=rng.randrange(7 * 86400))
+    nm_id = rng.randrange(10_000_000, 10_001_000)
+    retail_price = round(rng.uniform(300, 5000), 2)
+    return {
+        'realizationreport_id': report_id,
+        'date_from': date_from,
+        'date_to': date_to,
+        'create_dt': date_to,
+        'currency_name': 'руб',
+        'suppliercontract_code': None,
+        'rrd_id': rrd_id,
+        'gi_id': rng.randrange(1, 10_000_000),
+        'dlv_prc': round(rng.uniform(1, 2), 2),
+        'fix_tariff_date_from': '',
+        'fix_tariff_date_to': '',
+        'subject_name': rng.choice(('Футболки', 'Платья', 'Джинсы', 'Куртки')),
+        'nm_id': nm_id,
+        'brand_name': 'Brand',
+        'sa_name': f"wild{nm_id % 1000}",
+        'ts_name': rng.choice(('S', 'M', 'L', 'XL')),
+        'barcode': str(2_000_000_000_000 + nm_id),
+        'doc_type_name': doc_type,
+        'quantity': 1 if doc_type else 0,
+        'retail_price': retail_price,
+        'retail_amount': retail_price if doc_type else 0,
+        'sale_percent': rng.randrange(0, 60),
+        'commission_percent': round(rng.uniform(5, 25), 2),
+        'office_name': rng.choice(('Коледино', 'Электросталь', 'Казань')),
+        'supplier_oper_name': doc_type or 'Логистика',
+        'order_dt': (sale_dt - timedelta(days=rng.randrange(1, 10))).strftime('%Y-%m-%dT%H:%M:%S'),
+        'sale_dt': sale_dt.strftime('%Y-%m-%dT%H:%M:%S'),
+        'rr_dt': sale_dt.strftime('%Y-%m-%d'),
+        'shk_id': rng.randrange(1, 10**10),
+        'retail_price_withdisc_rub': round(retail_price * 0.7, 2),
+        'delivery_amount': 0 if doc_type else 1,
+        'return_amount': 0,
+        'delivery_rub': 0 if doc_type else round(rng.uniform(30, 120), 2),
+        'gi_box_type_name': 'Монопаллета',
+        'product_discount_for_report': round(rng.uniform(0, 50), 2),
+        'supplier_promo': 0,
+        'ppvz_spp_prc': round(rng.uniform(0, 30), 2),
+        'ppvz_kvw_prc_base': round(rng.uniform(5, 25), 2),
+        'ppvz_kvw_prc': round(rng.uniform(5, 25), 2),
+        'sup_rating_prc_up': 0,
+        'ppvz_sales_commission': round(retail_price * 0.15, 2),
+        'ppvz_for_pay': round(retail_price * 0.6, 2) if doc_type else 0,
+        'ppvz_reward': 0,
+        'acquiring_fee': round(retail_price * 0.015, 2),
+        'acquiring_percent': 1.5,
+        'payment_processing': 'Комиссия за организацию платежа',
+        'acquiring_bank': 'Сбербанк',
+        'ppvz_vw': round(retail_price * 0.1, 2),
+        'ppvz_vw_nds': round(retail_price * 0.02, 2),
+        'ppvz_office_name': '',
+        'ppvz_office_id': 0,
+        'ppvz_supplier_id': 0,
+        'ppvz_supplier_name': '',
+        'ppvz_inn': '',
+        'declaration_number': '',
+        'bonus_type_name': '' if rng.random() > 0.05 else 'Штраф',
+        'sticker_id': str(rng.randrange(10**9)),
+        'site_country': 'Россия',
+        'srv_dbs': False,
+        'penalty': 0 if rng.random() > 0.05 else round(rng.uniform(50, 500), 2),
+        'additional_payment': 0,
+        'rebill_logistic_cost': 0,
+        'rebill_logistic_org': '',
+        'storage_fee': 0 if rng.random() > 0.1 else round(rng.uniform(100, 3000), 2),
+        'deduction': 0 if rng.random() > 0.02 else round(rng.uniform(100, 1000), 2),
+        'acceptance': 0,
+        'assembly_id': 0,
+        'srid': f"{rrd_id}.{rng.randrange(10**9)}",
+        'report_type': 1,
+        'is_legal_entity': False,
+        'trbx_id': '',
+        'installment_cofinancing_amount': 0,
+        'wibes_wb_discount_percent': 0,
+        'cashback_amount': 0,
+        'cashback_discount': 0,
+        'payment_schedule': 0,
+        'order_uid': str(rng.randrange(10**12)),
+        'kiz': '',
+        'cashback_commission_change': 0,
+        'delivery_method': 'FBW',
+    }
+
+
+def funnel_product(rng: random.Random, index: int, start: str, end: str) -> dict:
+    nm_id = 10_000_000 + index
+    orders = rng.randrange(0, 200)
+    price = rng.randrange(300, 5000)
+    return {
+        'product': {
+            'nmId': nm_id,
+            'title': f"Товар {index}",
+            'vendorCode': f"wild{index % 1000}-{index}",
+            'brandName': 'Brand',
+            'subjectId': 100 + index % 20,
+            'subjectName': 'Футболки',
+            'productRating': round(rng.uniform(3, 5), 1),
+            'feedbackRating': round(rng.uniform(3, 5), 1),
+            'stocks': {'wb': rng.randrange(0, 1000), 'mp': rng.randrange(0, 100), 'balanceSum': rng.randrange(0, 10**6)},
+        },
+        'statistic': {
+            'selected': {
+                'period': {'start': start, 'end': end},
+                'openCount': orders * rng.randrange(5, 50),
+                'cartCount': orders * rng.randrange(1, 5),
+                'orderCount': orders,
+                'orderSum': orders * price,
+                'buyoutCount': int(orders * 0.7),
+                'buyoutSum': int(orders * 0.7) * price,
+                'cancelCount': int(orders * 0.1),
+                'cancelSum': int(orders * 0.1) * price,
+                'avgPrice': price,
+                'avgOrdersCountPerDay': round(orders / 30, 2),
+                'shareOrderPercent': round(rng.uniform(0, 5), 2),
+                'addToWishlist': rng.randrange(0, 100),
+                'timeToReady': {'days': rng.randrange(0, 3), 'hours': rng.randrange(0, 24), 'mins': rng.randrange(0, 60)},
+                'localizationPercent': rng.randrange(0, 100),
+            },
+        },
+    }
+
+
+def fullstats_item(rng: random.Random, advert_id: int, begin: str, end: str) -> dict:
+    views = rng.randrange(0, 10_000)
+    clicks = rng.randrange(0, max(views // 20, 1))
+    orders = rng.randrange(0, max(clicks // 10, 1))
+    return {
+        'advertId': advert_id,
+        'views': views,
+        'clicks': clicks,
+        'ctr': round(clicks / views * 100, 2) if views else 0,
+        'cpc': round(rng.uniform(1, 30), 2),
+        'sum': round(clicks * rng.uniform(1, 30), 2),
+        'atbs': rng.randrange(0, clicks + 1),
+        'orders': orders,
+        'cr': round(orders / clicks * 100, 2) if clicks else 0,
+        'shks': orders,
+        'sum_price': orders * rng.randrange(300, 5000),
+        'dates': [begin] if begin == end else [begin, end],
+        'days': [],
+    }
+
+
+def card(index: int, token_id: int) -> dict:
+    nm_id = 10_000_000 + index
+    return {
+        'nmID': nm_id,
+        'imtID': 20_000_000 + index,
+        'vendorCode': f"wild{index % 1000}-{index}",
+        'subjectName': 'Футболки',
+        'brand': 'Brand',
+        'title': f"Товар {index}",
+        'characteristics': [
+            {'id': 1, 'name': 'Ставка НДС', 'value': ['20' if index % 3 else '10']},
+            {'id': 2, 'name': 'Пол', 'value': ['Женский']},
+        ],
+        'sizes': [{'chrtID': nm_id * 10, 'techSize': 'M', 'skus': [str(2_000_000_000_000 + nm_id)]}],
+        'updatedAt': (datetime(2025, 1, 1) + timedelta(minutes=token_id % 1000 + index)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+    }
+
+
+class WBSimulator:
+    """Обработчики эндпоинтов и общие правила: авторизация, задержка, лимит, ошибки."""
+
+    def __init__(self, config: SimulatorConfig):
+        self.config = config
+        self.rate_limit = SimulatedRateLimit(config.rate_interval, config.rate_burst)
+        self._random = random.Random(config.seed)
+        # счётчики ответов по статусам — для отчёта бенчмарков
+        self.stats = {}
+        self._page_cache = {}
+
+    def _count(self, endpoint: str, status: int):
+        key = f"{endpoint}:{status}"
+        self.stats[key] = self.stats.get(key, 0) + 1
+
+    async def _guard(self, request: web.Request, endpoint: str, allow_204: bool = False):
+        """
+        Общая часть всех обработчиков. Возвращает (ответ-ошибку или None, заголовки лимита).
+        """
+        config = self.config
+        if config.latency_ms or config.latency_jitter_ms:
+            await asyncio.sleep((config.latency_ms + self._random.uniform(0, config.latency_jitter_ms)) / 1000)
+
+        token = request.headers.get('Authorization')
+        if not token:
+            self._count(endpoint, 401)
+            return web.json_response({'title': 'unauthorized', 'detail': 'empty Authorization header'}, status=401), {}
+
+        allowed, headers = self.rate_limit.check((token, endpoint))
+        if not allowed or self._random.random() < config.error_429:
+            if allowed:
+                headers = {'X-Ratelimit-Retry': f"{max(config.rate_interval, 1.0):.3f}", 'X-Ratelimit-Limit': str(config.rate_burst),
+                           'X-Ratelimit-Remaining': '0'}
+            self._count(endpoint, 429)
+            return web.json_response({'title': 'too many requests', 'detail': 'limited by simulator'},
+                                     status=429, headers=headers), headers
+        if self._random.random() < config.error_400:
+            self._count(endpoint, 400)
+            return web.json_response({'title': 'bad request', 'detail': 'temporary simulator failure'},
+                                     status=400, headers=headers), headers
+        if allow_204 and self._random.random() < config.error_204:
+            self._count(endpoint, 204)
+            return web.Response(status=204, headers=headers), headers
+        self._count(endpoint, 200)
+        return None, headers
+
+    async def report_detail(self, request: web.Request) -> web.Response:
+        error, headers = await self._guard(request, 'reportDetailByPeriod', allow_204=True)
+        if error is not None:
+            return error
+        query = request.query
+        date_from, date_to = query.get('dateFrom', ''), query.get('dateTo', '')
+        limit = min(int(query.get('limit', 100_000)), 100_000)
+        rrdid = int(query.get('rrdid', 0))
+        token_id = _token_id(request.headers['Authorization'])
+        period_id = _token_id(f"{date_from}_{date_to}")
+        # rrd_id строк периода: base + 1 .. base + fin_rows (не пересекаются между токенами и периодами)
+        base = token_id * 10**12 + period_id % 10**5 * 10**7
+        report_id = 300_000_000 + (token_id + period_id) % 10**8
+        first = max(rrdid - base, 0)
+        cache_key = (token_id, date_from, date_to, first, limit)
+        body = self._page_cache.get(cache_key)
+        if body is None:
+            rows = [fin_report_row(_rng(token_id, date_from, n), report_id, base + n + 1, date_from, date_to)
+                    for n in range(first, min(first + limit, self.config.fin_rows))]
+            body = json.dumps(rows, ensure_ascii=False).encode('utf-8')
+            if self.config.cache_pages:
+                self._page_cache[cache_key] = body
+        return web.Response(body=body, content_type='application/json', headers=headers)
+
+    async def sales_funnel(self, request: web.Request) -> web.Response:
+        error, headers = await self._guard(request, 'sales-funnel-products')
+        if error is not None:
+            return error
+        payload = await request.json()
+        period = payload.get('selectedPeriod', {})
+        start, end = period.get('start', ''), period.get('end', '')
+        limit = int(payload.get('limit', 1000))
+        offset = int(payload.get('offset', 0))
+        token_id = _token_id(request.headers['Authorization'])
+        products = [funnel_product(_rng(token_id, start, end, n), token_id % 1000 * 100_000 + n, start, end)
+                    for n in range(offset, min(offset + limit, self.config.funnel_products))]
+        return web.json_response({'data': {'products': products}}, headers=headers)
+
+    def _campaign_ids(self, token: str, kind: int, status: int) -> list:
+        """Кампании токена: kind — тип (0 — единая ставка, 1 — ручная), status 9/11 делят их пополам."""
+        base = _token_id(token) % 1000 * 10_000 + kind * 5_000
+        ids = range(base, base + self.config.campaigns)
+        return [advert_id for advert_id in ids if (advert_id % 2 == 0) == (status == 9)]
+
+    async def fullstats(self, request: web.Request) -> web.Response:
+        error, headers = await self._guard(request, 'adv-fullstats')
+        if error is not None:
+            return error
+        ids = [int(i) for i in request.query.get('ids', '').split(',') if i.strip()]
+        if len(ids) > 100:
+            return web.json_response({'message': 'too many ids'}, status=400, headers=headers)
+        begin, end = request.query.get('beginDate', ''), request.query.get('endDate', '')
+        return web.json_response([fullstats_item(_rng(advert_id, begin, end), advert_id, begin, end) for advert_id in ids],
+                                 headers=headers)
+
+    async def promotion_adverts(self, request: web.Request) -> web.Response:
+        error, headers = await self._guard(request, 'adv-promotion-adverts')
+        if error is not None:
+            return error
+        status = int(request.query.get('status', 9))
+        ids = self._campaign_ids(request.headers['Authorization'], 0, status)
+        adverts = [{'advertId': advert_id, 'status': status, 'type': 8} for advert_id in ids]
+        return web.json_response(adverts, headers=headers)
+
+    async def auction_adverts(self, request: web.Request) -> web.Response:
+        error, headers = await self._guard(request, 'adv-auction-adverts')
+        if error is not None:
+            return error
+        status = int(request.query.get('status', 9))
+        ids = self._campaign_ids(request.headers['Authorization'], 1, status)
+        adverts = [{'id': advert_id, 'status': status, 'bid_type': 'manual'} for advert_id in ids]
+        return web.json_response({'adverts': adverts}, headers=headers)
+
+    async def cards_list(self, request: web.Request) -> web.Response:
+        error, headers = await self._guard(request, 'content-cards-list')
+        if error is not None:
+            return error
+        payload = await request.json()
+        cursor = payload.get('settings', {}).get('cursor', {})
+        limit = min(int(cursor.get('limit', 100)), 100)
+        token_id = _token_id(request.headers['Authorization'])
+        # курсор — nmID последней отданной карточки
+        start = cursor['nmID'] - 10_000_000 + 1 if cursor.get('nmID') else 0
+        cards = [card(n, token_id) for n in range(start, min(start + limit, self.config.cards))]
+        last = cards[-1] if cards else {'nmID': cursor.get('nmID'), 'updatedAt': cursor.get('updatedAt')}
+        return web.json_response({
+            'cards': cards,
+            'cursor': {'updatedAt': last['updatedAt'], 'nmID': last['nmID'], 'total': len(cards)},
+        }, headers=headers)
+
+
+def create_app(config: SimulatorConfig | None = None) -> web.Application:
+    simulator = WBSimulator(config or SimulatorConfig())
+    app = web.Application(client_max_size=10 * 1024 * 1024)
+    app['simulator'] = simulator
+    app.router.add_get('/api/v5/supplier/reportDetailByPeriod', simulator.report_detail)
+    app.router.add_post('/api/analytics/v3/sales-funnel/products', simulator.sales_funnel)
+    app.router.add_get('/adv/v3/fullstats', simulator.fullstats)
+    app.router.add_post('/adv/v1/promotion/adverts', simulator.promotion_adverts)
+    app.router.add_get('/adv/v0/auction/adverts', simulator.auction_adverts)
+    app.router.add_post('/content/v2/get/cards/list', simulator.cards_list)
+    return app
+
+
+class SimulatorThread:
+    """
+    Имитатор в отдельном потоке со своим event loop — для синхронного кода
+    и бенчмарков, которые запускают каждый прогон через asyncio.run.
+    """
+
+    def __init__(self, config: SimulatorConfig | None = None, host: str = '127.0.0.1', port: int = 0):
+        self.config = config
+        self.host = host
+        self.port = port
+        self.base_url = None
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    def __enter__(self):
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._runner, self.base_url = self._loop.run_until_complete(
+                start_simulator(self.config, self.host, self.port))
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def __exit__(self, *exc):
+        future = asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop)
+        future.result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        return False
+
+
+async def start_simulator(config: SimulatorConfig | None = None, host: str = '127.0.0.1',
+                          port: int = 0) -> tuple[web.AppRunner, str]:
+    """
+    Запускает имитатор в текущем event loop (для бенчмарков). Возвращает runner
+    (остановка — await runner.cleanup()) и базовый URL. port=0 — любой свободный порт.
+    """
+    runner = web.AppRunner(create_app(config), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный имитатор WB API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    defaults = SimulatorConfig()
+    for name, value in vars(defaults).items():
+        if isinstance(value, bool):
+            parser.add_argument(f"--{name.replace('_', '-')}", action='store_true', default=value)
+        else:
+            parser.add_argument(f"--{name.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+    config = SimulatorConfig(**{name: getattr(args, name) for name in vars(defaults)})
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    logging.info(f"🧪 Имитатор WB API на http://{args.host}:{args.port}: {config}")
+    web.run_app(create_app(config), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == '__main__':
+    main()